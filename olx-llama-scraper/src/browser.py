@@ -0,0 +1,587 @@
+"""
+Browser - Вспомогательные объекты для работы с Playwright
+
+Функционал:
+- Пул переиспользуемых вкладок (PagePool)
+- Блокировка лишних ресурсов через context.route (ResourcePolicy)
+- Изолированные контексты со своим UA/прокси/rate limit (BrowserSlot)
+- Перехват тел изображений галереи из сетевых ответов (ImageCapture)
+- Один драйвер Playwright и один браузер на процесс (BrowserManager)
+"""
+
+import asyncio
+import zlib
+from contextlib import asynccontextmanager
+from typing import Dict, List, Any, AsyncIterator, Iterable, Optional, Sequence
+from urllib.parse import urlparse
+from playwright.async_api import async_playwright, Playwright, Page, Browser, BrowserContext, Route, Request, Response
+from loguru import logger
+
+from .utils import RateLimiter
+
+
+# ========================================
+# Page Pool
+# ========================================
+
+class PagePool:
+    """
+    Пул вкладок поверх одного BrowserContext
+    
+    Вместо new_page()/close() на каждый URL вкладки выдаются из пула
+    и возвращаются обратно. Вкладка пересоздаётся после max_uses
+    использований или если она перестала отвечать.
+    """
+    
+    BLANK_URL = 'about:blank'
+    
+    def __init__(self, context: BrowserContext, size: int = 2, max_uses: int = 50):
+        """
+        Args:
+            context: Playwright BrowserContext, в котором создаются вкладки
+            size: Максимум одновременно выданных вкладок
+            max_uses: Сколько раз вкладку можно выдать до пересоздания
+        """
+        self.context = context
+        self.size = max(1, size)
+        self.max_uses = max(1, max_uses)
+        
+        self._idle: List[Page] = []
+        self._uses: Dict[Page, int] = {}
+        self._semaphore = asyncio.Semaphore(self.size)
+        
+        self.stats = {'created': 0, 'reused': 0, 'recycled': 0}
+        
+        logger.debug(f"PagePool initialized: size={self.size}, max_uses={self.max_uses}")
+    
+    async def checkout(self) -> Page:
+        """
+        Выдаёт вкладку из пула (ждёт, если все вкладки заняты)
+        
+        Returns:
+            Playwright Page
+        """
+        await self._semaphore.acquire()
+        
+        try:
+            while self._idle:
+                page = self._idle.pop()
+                
+                if page.is_closed():
+                    self._uses.pop(page, None)
+                    continue
+                
+                self.stats['reused'] += 1
+                return page
+            
+            page = await self.context.new_page()
+            self._uses[page] = 0
+            self.stats['created'] += 1
+            return page
+            
+        except BaseException:
+            self._semaphore.release()
+            raise
+    
+    async def checkin(self, page: Page, healthy: bool = True):
+        """
+        Возвращает вкладку в пул
+        
+        Args:
+            page: Вкладка, полученная через checkout()
+            healthy: False если вкладку нужно закрыть, а не переиспользовать
+        """
+        try:
+            uses = self._uses.get(page, 0) + 1
+            self._uses[page] = uses
+            
+            if not healthy or uses >= self.max_uses or page.is_closed():
+                await self._discard(page)
+                return
+            
+            # Health check: пустая страница освобождает DOM/JS heap
+            # предыдущего URL и заодно проверяет, что вкладка жива
+            try:
+                await page.goto(self.BLANK_URL)
+            except Exception as e:
+                logger.debug(f"Page failed health check, recycling: {e}")
+                await self._discard(page)
+                return
+            
+            self._idle.append(page)
+            
+        finally:
+            self._semaphore.release()
+    
+    @asynccontextmanager
+    async def page(self) -> AsyncIterator[Page]:
+        """
+        Context manager: checkout() на входе, checkin() на выходе
+        
+        Если внутри блока вылетело исключение - вкладка пересоздаётся.
+        """
+        page = await self.checkout()
+        healthy = True
+        
+        try:
+            yield page
+        except BaseException:
+            healthy = False
+            raise
+        finally:
+            await self.checkin(page, healthy)
+    
+    async def close(self):
+        """
+        Закрывает все свободные вкладки пула
+        """
+        while self._idle:
+            await self._discard(self._idle.pop())
+        
+        logger.debug(f"PagePool closed: {self.stats}")
+    
+    async def _discard(self, page: Page):
+        """
+        Закрывает вкладку и забывает о ней
+        """
+        self._uses.pop(page, None)
+        self.stats['recycled'] += 1
+        
+        try:
+            if not page.is_closed():
+                await page.close()
+        except Exception:
+            pass
+
+
+# ========================================
+# Resource Blocking
+# ========================================
+
+class ResourcePolicy:
+    """
+    Политика блокировки ресурсов для context.route
+    
+    Порядок проверки: allowed_domains (всегда пропускаем) ->
+    blocked_domains (всегда блокируем) -> blocked_types.
+    Домены сравниваются по суффиксу: 'facebook.net' блокирует
+    и 'connect.facebook.net'.
+    """
+    
+    DEFAULT_BLOCKED_TYPES = ('image', 'media', 'font')
+    
+    DEFAULT_BLOCKED_DOMAINS = (
+        'google-analytics.com',
+        'googletagmanager.com',
+        'googlesyndication.com',
+        'doubleclick.net',
+        'facebook.net',
+        'hotjar.com',
+        'criteo.com',
+        'scorecardresearch.com',
+        'adnxs.com',
+        'gemius.pl',
+        'taboola.com'
+    )
+    
+    def __init__(
+        self,
+        blocked_types: Optional[Iterable[str]] = None,
+        blocked_domains: Optional[Iterable[str]] = None,
+        allowed_domains: Optional[Iterable[str]] = None
+    ):
+        """
+        Args:
+            blocked_types: Playwright resource types (image, font, media, script...)
+            blocked_domains: Домены трекеров/рекламы
+            allowed_domains: Домены, которые никогда не блокируются
+        """
+        self.blocked_types = set(self.DEFAULT_BLOCKED_TYPES if blocked_types is None else blocked_types)
+        self.blocked_domains = tuple(self.DEFAULT_BLOCKED_DOMAINS if blocked_domains is None else blocked_domains)
+        self.allowed_domains = tuple(allowed_domains or ())
+        
+        self.stats = {
+            'blocked_requests': 0,
+            'allowed_requests': 0,
+            'allowed_bytes': 0,
+            'blocked_by_type': {}
+        }
+        
+        logger.info(
+            f"ResourcePolicy initialized: types={sorted(self.blocked_types)}, "
+            f"{len(self.blocked_domains)} blocked domains, {len(self.allowed_domains)} allowed domains"
+        )
+    
+    @staticmethod
+    def _host_matches(host: str, domains: Iterable[str]) -> bool:
+        """
+        Проверяет совпадение хоста с доменом или его поддоменом
+        """
+        return any(host == domain or host.endswith('.' + domain) for domain in domains)
+    
+    def should_block(self, resource_type: str, url: str) -> bool:
+        """
+        Решает, нужно ли блокировать запрос
+        
+        Args:
+            resource_type: request.resource_type
+            url: URL запроса
+            
+        Returns:
+            True если запрос нужно прервать
+        """
+        host = (urlparse(url).hostname or '').lower()
+        
+        if self._host_matches(host, self.allowed_domains):
+            return False
+        
+        if self._host_matches(host, self.blocked_domains):
+            return True
+        
+        return resource_type in self.blocked_types
+    
+    async def attach(self, context: BrowserContext):
+        """
+        Подключает политику к контексту браузера
+        """
+        await context.route('**/*', self._handle_route)
+        context.on('requestfinished', self._on_request_finished)
+    
+    async def _handle_route(self, route: Route):
+        """
+        Route handler: abort для заблокированных, continue для остальных
+        """
+        request = route.request
+        resource_type = request.resource_type
+        
+        if self.should_block(resource_type, request.url):
+            self.stats['blocked_requests'] += 1
+            by_type = self.stats['blocked_by_type']
+            by_type[resource_type] = by_type.get(resource_type, 0) + 1
+            await route.abort()
+        else:
+            self.stats['allowed_requests'] += 1
+            await route.continue_()
+    
+    async def _on_request_finished(self, request: Request):
+        """
+        Считает реально скачанные байты пропущенных запросов
+        """
+        try:
+            sizes = await request.sizes()
+            self.stats['allowed_bytes'] += sizes['responseHeadersSize'] + sizes['responseBodySize']
+        except Exception:
+            pass
+    
+    def summary(self) -> str:
+        """
+        Короткая сводка для лога
+        """
+        return (
+            f"blocked {self.stats['blocked_requests']} requests {self.stats['blocked_by_type']}, "
+            f"allowed {self.stats['allowed_requests']} requests / "
+            f"{self.stats['allowed_bytes'] / 1024:.1f} KB"
+        )
+
+
+# ========================================
+# Image Capture
+# ========================================
+
+class ImageCapture:
+    """
+    Забирает тела изображений галереи, которые браузер уже скачал при рендере
+    
+    На время работы на вкладке висят:
+    - page.route, который пропускает картинки с хостов галереи мимо
+      блокировки ResourcePolicy (остальное уходит в route контекста)
+    - page.on('response'), который читает тела этих картинок
+    
+    stop() снимает оба обработчика, поэтому вкладку можно вернуть в пул.
+    """
+    
+    def __init__(self, page: Page, hosts: Iterable[str]):
+        """
+        Args:
+            page: Вкладка, на которой открывается объявление
+            hosts: Домены CDN галереи (сравнение по суффиксу)
+        """
+        self.page = page
+        self.hosts = tuple(hosts)
+        
+        self._bodies: Dict[str, asyncio.Task] = {}
+        self._active = False
+    
+    def _is_gallery_image(self, resource_type: str, url: str) -> bool:
+        """
+        Картинка с хоста галереи?
+        """
+        host = (urlparse(url).hostname or '').lower()
+        return resource_type == 'image' and ResourcePolicy._host_matches(host, self.hosts)
+    
+    async def start(self):
+        """
+        Подключает обработчики к вкладке (до page.goto)
+        """
+        await self.page.route('**/*', self._handle_route)
+        self.page.on('response', self._on_response)
+        self._active = True
+    
+    async def _handle_route(self, route: Route):
+        """
+        Картинки галереи - в сеть, остальное - в route контекста
+        """
+        if self._is_gallery_image(route.request.resource_type, route.request.url):
+            await route.continue_()
+        else:
+            await route.fallback()
+    
+    def _on_response(self, response: Response):
+        """
+        Запускает чтение тела успешного ответа с картинкой галереи
+        """
+        if not response.ok or response.url in self._bodies:
+            return
+        
+        if self._is_gallery_image(response.request.resource_type, response.url):
+            self._bodies[response.url] = asyncio.ensure_future(response.body())
+    
+    async def stop(self) -> Dict[str, bytes]:
+        """
+        Снимает обработчики и возвращает полученные тела
+        
+        Returns:
+            URL -> байты изображения (только успешно прочитанные)
+        """
+        if not self._active:
+            return {}
+        
+        self._active = False
+        self.page.remove_listener('response', self._on_response)
+        
+        try:
+            await self.page.unroute('**/*', self._handle_route)
+        except Exception as e:
+            logger.debug(f"Could not remove capture route: {e}")
+        
+        urls = list(self._bodies)
+        results = await asyncio.gather(*self._bodies.values(), return_exceptions=True)
+        self._bodies.clear()
+        
+        return {url: body for url, body in zip(urls, results) if isinstance(body, bytes)}
+
+
+# ========================================
+# Browser Manager
+# ========================================
+
+# Флаги запуска Chromium (общие для scraper и Llama)
+CHROMIUM_ARGS = [
+    '--no-sandbox',
+    '--disable-setuid-sandbox',
+    '--disable-dev-shm-usage',
+    '--disable-blink-features=AutomationControlled'
+]
+
+
+class BrowserManager:
+    """
+    Владелец драйвера Playwright и браузера
+    
+    Браузер запускается один раз, scraper и LlamaBridge получают
+    в нём отдельные контексты. close() закрывает всё в обратном
+    порядке: контексты, браузер, драйвер.
+    """
+    
+    def __init__(self, config: Dict[str, Any]):
+        """
+        Args:
+            config: Конфигурация (browser_type, headless)
+        """
+        self.browser_type = config.get('browser_type', 'chromium')
+        self.headless = config.get('headless', True)
+        
+        # Инициализируются в start()
+        self.playwright: Optional[Playwright] = None
+        self.browser: Optional[Browser] = None
+    
+    async def __aenter__(self):
+        await self.start()
+        return self
+    
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+    
+    async def start(self) -> Browser:
+        """
+        Запускает драйвер и браузер (повторный вызов возвращает тот же браузер)
+        
+        Returns:
+            Запущенный Playwright Browser
+        """
+        if self.browser:
+            return self.browser
+        
+        logger.info("Launching Playwright browser...")
+        
+        self.playwright = await async_playwright().start()
+        
+        try:
+            if self.browser_type == 'firefox':
+                self.browser = await self.playwright.firefox.launch(headless=self.headless)
+            elif self.browser_type == 'webkit':
+                self.browser = await self.playwright.webkit.launch(headless=self.headless)
+            else:
+                self.browser = await self.playwright.chromium.launch(headless=self.headless, args=CHROMIUM_ARGS)
+                
+        except Exception:
+            await self.playwright.stop()
+            self.playwright = None
+            raise
+        
+        logger.info(f"Browser launched: {self.browser_type}, headless={self.headless}")
+        
+        return self.browser
+    
+    async def new_context(self, purpose: str, **options) -> BrowserContext:
+        """
+        Создаёт изолированный контекст в общем браузере
+        
+        Args:
+            purpose: Для чего контекст (для логов): 'scraper', 'llama'...
+            **options: Параметры browser.new_context
+            
+        Returns:
+            Новый BrowserContext
+        """
+        browser = await self.start()
+        context = await browser.new_context(**options)
+        
+        logger.debug(f"Browser context opened: {purpose} (total {len(browser.contexts)})")
+        
+        return context
+    
+    async def close(self):
+        """
+        Закрывает оставшиеся контексты, браузер и драйвер
+        
+        Ошибка на одном шаге не мешает следующим: драйвер
+        останавливается в любом случае.
+        """
+        if self.browser:
+            for context in list(self.browser.contexts):
+                try:
+                    await context.close()
+                except Exception as e:
+                    logger.warning(f"Failed to close browser context: {e}")
+            
+            try:
+                await self.browser.close()
+            except Exception as e:
+                logger.warning(f"Failed to close browser: {e}")
+            
+            self.browser = None
+        
+        if self.playwright:
+            await self.playwright.stop()
+            self.playwright = None
+            
+            logger.info("Browser closed")
+
+
+# ========================================
+# Browser Slots
+# ========================================
+
+class BrowserSlot:
+    """
+    Отдельная "личность" браузера для шардирования трафика
+    
+    У каждого слота свой BrowserContext (cookies), User-Agent, прокси,
+    RateLimiter, пул вкладок и (опционально) HTTP fetcher. Так нагрузка
+    не концентрируется на одном отпечатке.
+    """
+    
+    def __init__(self, index: int, user_agent: str, proxy: Optional[str], rate_limiter: RateLimiter):
+        """
+        Args:
+            index: Номер слота (для логов)
+            user_agent: User-Agent контекста
+            proxy: URL прокси или None
+            rate_limiter: Rate limiter этого слота
+        """
+        self.index = index
+        self.user_agent = user_agent
+        self.proxy = proxy
+        self.rate_limiter = rate_limiter
+        
+        # Инициализируются в open()
+        self.context: Optional[BrowserContext] = None
+        self.page_pool: Optional[PagePool] = None
+        self.http_fetcher = None
+    
+    async def open(
+        self,
+        browser_manager: BrowserManager,
+        context_options: Dict[str, Any],
+        resource_policy: Optional[ResourcePolicy] = None,
+        pool_size: int = 2,
+        max_uses: int = 50
+    ):
+        """
+        Создаёт контекст слота и пул вкладок в нём
+        
+        Args:
+            browser_manager: Общий BrowserManager процесса
+            context_options: Общие параметры new_context (viewport, locale...)
+            resource_policy: Политика блокировки ресурсов (общая статистика)
+            pool_size: Размер пула вкладок
+            max_uses: Использований вкладки до пересоздания
+        """
+        options = dict(context_options, user_agent=self.user_agent)
+        if self.proxy:
+            options['proxy'] = {'server': self.proxy}
+        
+        self.context = await browser_manager.new_context(f"scraper slot {self.index}", **options)
+        
+        if resource_policy:
+            await resource_policy.attach(self.context)
+        
+        self.page_pool = PagePool(self.context, size=pool_size, max_uses=max_uses)
+        
+        logger.info(f"Browser slot {self.index} opened: proxy={self.proxy or '-'}, user_agent={self.user_agent[:50]}...")
+    
+    async def close(self):
+        """
+        Закрывает пул вкладок, контекст и HTTP fetcher слота
+        """
+        if self.http_fetcher:
+            await self.http_fetcher.close()
+            self.http_fetcher = None
+        if self.page_pool:
+            await self.page_pool.close()
+            self.page_pool = None
+        if self.context:
+            await self.context.close()
+            self.context = None
+
+
+def pick_slot(slots: Sequence[BrowserSlot], url: str) -> BrowserSlot:
+    """
+    Выбирает слот для URL по crc32 пути
+    
+    Путь не включает ?page=N, поэтому все страницы одного поиска
+    (и повторные визиты одного объявления) попадают в один контекст.
+    
+    Args:
+        slots: Слоты браузера
+        url: URL страницы
+        
+    Returns:
+        Слот, который обслуживает URL
+    """
+    if len(slots) == 1:
+        return slots[0]
+    
+    key = urlparse(url).path.encode('utf-8')
+    return slots[zlib.crc32(key) % len(slots)]
@@ -0,0 +1,166 @@
+"""
+Detection - Определение CAPTCHA и блокировок
+
+Порядок проверок (от дешёвых к дорогим):
+1. Ответ навигации: статус, хост после редиректов
+2. Элементы challenge-виджетов и видимый текст страницы - одним page.evaluate
+   и одним объединённым регулярным выражением
+
+Полный HTML страницы (page.content()) не сериализуется.
+"""
+
+import re
+from typing import Optional
+from urllib.parse import urlparse
+from playwright.async_api import Page, Response
+from loguru import logger
+
+
+# ========================================
+# Классификация и сигнатуры
+# ========================================
+
+PAGE_OK = 'ok'
+PAGE_CAPTCHA = 'captcha'
+PAGE_BLOCK = 'block'
+
+# Хосты challenge-страниц (сравнение по суффиксу)
+CHALLENGE_HOSTS = (
+    'captcha-delivery.com',
+    'hcaptcha.com',
+    'recaptcha.net',
+    'challenges.cloudflare.com'
+)
+
+# Статусы, которые сами по себе означают блокировку
+BLOCK_STATUSES = (429,)
+
+# Статусы, при которых страница может быть challenge (проверяется дальше)
+CHALLENGE_STATUSES = (401, 403, 503)
+
+# Элементы challenge-виджетов
+CHALLENGE_SELECTOR = ', '.join([
+    '.g-recaptcha',
+    '.h-captcha',
+    'iframe[src*="captcha"]',
+    'iframe[src*="challenges.cloudflare.com"]',
+    '#captcha-container',
+    '#cf-challenge-running'
+])
+
+# Все текстовые сигнатуры одним выражением (скомпилировано один раз)
+CAPTCHA_TEXT_RE = re.compile(
+    r'captcha|robot\s+check|verify\s+you[^.]{0,40}human|security\s+check',
+    re.IGNORECASE
+)
+
+# Разметка challenge-виджетов в сыром HTML (HTTP fast path)
+CHALLENGE_MARKUP_RE = re.compile(
+    r'class=["\'][^"\']*\b(?:g-recaptcha|h-captcha)\b|'
+    r'<iframe[^>]+src=["\'][^"\']*(?:captcha|challenges\.cloudflare\.com)|'
+    r'captcha-delivery\.com',
+    re.IGNORECASE
+)
+
+# Сколько видимого текста проверять: challenge-страницы короткие
+VISIBLE_TEXT_LIMIT = 5000
+
+# Наличие challenge-элемента и начало видимого текста за один round trip
+DETECT_JS = """
+([selector, limit]) => ({
+    challenge: !!document.querySelector(selector),
+    text: document.body ? document.body.innerText.slice(0, limit) : ''
+})
+"""
+
+
+# ========================================
+# Проверки
+# ========================================
+
+def _is_challenge_host(url: str) -> bool:
+    """
+    URL ведёт на хост challenge-страницы?
+    """
+    host = (urlparse(url).hostname or '').lower()
+    return any(host == domain or host.endswith('.' + domain) for domain in CHALLENGE_HOSTS)
+
+
+def classify_response(status: Optional[int], final_url: str) -> Optional[str]:
+    """
+    Классификация по ответу навигации
+    
+    Args:
+        status: HTTP статус основного документа (None если ответа нет)
+        final_url: URL после всех редиректов
+        
+    Returns:
+        PAGE_CAPTCHA / PAGE_BLOCK или None если по ответу не понять
+    """
+    if _is_challenge_host(final_url):
+        return PAGE_CAPTCHA
+    
+    if status in BLOCK_STATUSES:
+        return PAGE_BLOCK
+    
+    return None
+
+
+def classify_html(html: str, status: int = 200, final_url: str = '') -> str:
+    """
+    Классификация страницы, загруженной без браузера
+    
+    Сырой HTML уже в памяти, поэтому ищем разметку challenge-виджетов,
+    а не слово "captcha" (оно встречается в скриптах обычных страниц).
+    
+    Args:
+        html: HTML страницы
+        status: HTTP статус
+        final_url: URL после редиректов
+        
+    Returns:
+        PAGE_OK / PAGE_CAPTCHA / PAGE_BLOCK
+    """
+    verdict = classify_response(status, final_url)
+    if verdict:
+        return verdict
+    
+    if CHALLENGE_MARKUP_RE.search(html):
+        return PAGE_CAPTCHA
+    
+    return PAGE_BLOCK if status in CHALLENGE_STATUSES else PAGE_OK
+
+
+async def classify_page(page: Page, response: Optional[Response], ready: bool = False) -> str:
+    """
+    Классификация страницы в браузере
+    
+    Args:
+        page: Вкладка после page.goto
+        response: Ответ page.goto (None для навигации без ответа)
+        ready: Появился ли селектор готовности страницы
+        
+    Returns:
+        PAGE_OK / PAGE_CAPTCHA / PAGE_BLOCK
+    """
+    status = response.status if response else None
+    
+    verdict = classify_response(status, page.url)
+    if verdict:
+        logger.debug(f"Page classified by response ({status}, {page.url}): {verdict}")
+        return verdict
+    
+    detected = await page.evaluate(DETECT_JS, [CHALLENGE_SELECTOR, VISIBLE_TEXT_LIMIT])
+    
+    if detected['challenge']:
+        return PAGE_CAPTCHA
+    
+    # Страница с нужным контентом - текст не проверяем: слово "captcha"
+    # в описании объявления не должно давать ложное срабатывание
+    if ready and status not in CHALLENGE_STATUSES:
+        return PAGE_OK
+    
+    if CAPTCHA_TEXT_RE.search(detected['text']):
+        return PAGE_CAPTCHA
+    
+    return PAGE_BLOCK if status in CHALLENGE_STATUSES else PAGE_OK
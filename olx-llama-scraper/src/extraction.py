@@ -0,0 +1,324 @@
+"""
+Extraction - Схема полей объявления OLX
+
+Функционал:
+- Декларативные селекторы полей объявления (одно место, с версией)
+- JS-скрипт, извлекающий все поля за один page.evaluate
+- Те же поля из HTML через lxml (HTTP fast path)
+- Объявления из встроенного JSON состояния страницы поиска
+- Преобразование сырых полей в запись объявления
+"""
+
+import re
+import json
+from typing import Dict, Any, Optional, List
+from datetime import datetime
+from urllib.parse import urljoin
+from bs4 import BeautifulSoup
+from loguru import logger
+
+from .utils import clean_text, parse_price, extract_id_from_url
+
+
+# ========================================
+# Схема полей
+# ========================================
+
+# Версия схемы селекторов. Увеличивайте при любом изменении AD_FIELDS,
+# чтобы по данным было видно, какой схемой они извлечены
+SCHEMA_VERSION = 1
+
+# Поле -> селектор. attr: читать атрибут вместо textContent,
+# many: вернуть список по всем совпадениям
+AD_FIELDS: Dict[str, Dict[str, Any]] = {
+    'title': {'selector': 'h1, h4[data-cy="ad_title"]'},
+    'price': {'selector': 'h3[data-testid="ad-price-container"]'},
+    'description': {'selector': '[data-cy="ad_description"]'},
+    'location_date': {'selector': '[data-testid="location-date"]'},
+    'images': {
+        'selector': '[data-testid="swiper-image-slide"] img, .swiper-slide img',
+        'attr': 'src',
+        'many': True
+    }
+}
+
+# Ссылки на объявления в карточках выдачи
+LISTING_LINK_SELECTOR = '[data-cy="l-card"] a[href*="/d/oferty/"]'
+
+# Максимум изображений на объявление
+MAX_IMAGES = 10
+
+# Размер фото, подставляемый в шаблон URL из JSON состояния
+LISTING_PHOTO_SIZE = '1000x750'
+
+# Страница поиска OLX содержит состояние приложения в виде JS-строки:
+# window.__PRERENDERED_STATE__ = "{\"listing\": ...}";
+PRERENDERED_STATE_RE = re.compile(r'window\.__PRERENDERED_STATE__\s*=\s*("(?:[^"\\]|\\.)*")')
+
+# То же состояние из живой страницы в браузере
+PRERENDERED_STATE_JS = "() => window.__PRERENDERED_STATE__ || null"
+
+# Извлекает все поля AD_FIELDS за один round trip.
+# Отсутствующее поле -> null (без ожидания таймаутов)
+EXTRACT_AD_JS = """
+(fields) => {
+    const result = {};
+    for (const [name, field] of Object.entries(fields)) {
+        const read = (el) => field.attr ? el.getAttribute(field.attr) : el.textContent;
+        if (field.many) {
+            result[name] = Array.from(document.querySelectorAll(field.selector))
+                .map(read)
+                .filter((value) => value);
+        } else {
+            const el = document.querySelector(field.selector);
+            result[name] = el ? read(el) : null;
+        }
+    }
+    return result;
+}
+"""
+
+
+# ========================================
+# Парсинг HTML (без браузера)
+# ========================================
+
+def parse_ad_html(html: str) -> Dict[str, Any]:
+    """
+    Извлекает поля AD_FIELDS из HTML страницы объявления
+    
+    Возвращает то же, что EXTRACT_AD_JS в браузере.
+    
+    Args:
+        html: HTML страницы объявления
+        
+    Returns:
+        Словарь поле -> строка/список/None
+    """
+    soup = BeautifulSoup(html, 'lxml')
+    result: Dict[str, Any] = {}
+    
+    for name, field in AD_FIELDS.items():
+        attr = field.get('attr')
+        
+        def read(el):
+            return el.get(attr) if attr else el.get_text()
+        
+        if field.get('many'):
+            result[name] = [value for value in map(read, soup.select(field['selector'])) if value]
+        else:
+            el = soup.select_one(field['selector'])
+            result[name] = read(el) if el else None
+    
+    return result
+
+
+def parse_search_html(html: str, base_url: str) -> List[str]:
+    """
+    Извлекает URL объявлений из HTML страницы поиска
+    
+    Args:
+        html: HTML страницы поиска
+        base_url: Базовый URL для относительных ссылок
+        
+    Returns:
+        Список уникальных URL объявлений
+    """
+    soup = BeautifulSoup(html, 'lxml')
+    
+    urls = [urljoin(base_url, a['href']) for a in soup.select(LISTING_LINK_SELECTOR) if a.get('href')]
+    
+    return list(dict.fromkeys(urls))
+
+
+# ========================================
+# JSON состояние страницы поиска
+# ========================================
+
+def decode_prerendered_state(value: Any) -> Optional[Dict[str, Any]]:
+    """
+    Декодирует __PRERENDERED_STATE__ (JSON-строка или уже объект)
+    """
+    if isinstance(value, dict):
+        return value
+    
+    if not isinstance(value, str):
+        return None
+    
+    try:
+        state = json.loads(value)
+    except json.JSONDecodeError as e:
+        logger.debug(f"Invalid prerendered state: {e}")
+        return None
+    
+    return state if isinstance(state, dict) else None
+
+
+def parse_prerendered_state(html: str) -> Optional[Dict[str, Any]]:
+    """
+    Находит и декодирует __PRERENDERED_STATE__ в HTML страницы поиска
+    
+    Returns:
+        Состояние страницы или None если его нет
+    """
+    match = PRERENDERED_STATE_RE.search(html)
+    if not match:
+        return None
+    
+    try:
+        literal = json.loads(match.group(1))
+    except json.JSONDecodeError as e:
+        logger.debug(f"Invalid prerendered state literal: {e}")
+        return None
+    
+    return decode_prerendered_state(literal)
+
+
+def _photo_url(photo: Any) -> Optional[str]:
+    """
+    URL фото из состояния: строка-шаблон или объект с полем link
+    """
+    link = photo.get('link') if isinstance(photo, dict) else photo
+    if not isinstance(link, str):
+        return None
+    
+    return link.replace('{width}x{height}', LISTING_PHOTO_SIZE)
+
+
+def listings_from_state(state: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """
+    Достаёт данные карточек из состояния страницы поиска
+    
+    Args:
+        state: Декодированный __PRERENDERED_STATE__
+        
+    Returns:
+        Словарь ID объявления -> сырые поля карточки (включая url)
+    """
+    ads = ((state.get('listing') or {}).get('listing') or {}).get('ads') or []
+    listings = {}
+    
+    for ad in ads:
+        if not isinstance(ad, dict) or not ad.get('url'):
+            continue
+        
+        price = ad.get('price') or {}
+        regular_price = price.get('regularPrice') or {}
+        location = ad.get('location') or {}
+        promotion = ad.get('promotion') or {}
+        photos = [url for url in map(_photo_url, ad.get('photos') or []) if url]
+        
+        # Описание в состоянии хранится как HTML
+        description = re.sub(r'<[^>]+>', ' ', ad.get('description') or '')
+        
+        ad_id = extract_id_from_url(ad['url'])
+        if not ad_id:
+            continue
+        
+        listings[ad_id] = {
+            'url': ad['url'],
+            'title': ad.get('title'),
+            'price': regular_price.get('value'),
+            'currency': regular_price.get('currencyCode'),
+            'description': description,
+            'location': location.get('cityName'),
+            'date': ad.get('createdTime'),
+            'last_refresh': ad.get('lastRefreshTime'),
+            # Продвигаемые объявления стоят в начале выдачи вне сортировки
+            'promoted': bool(ad.get('isPromoted') or promotion.get('top_ad')),
+            'images': photos
+        }
+    
+    return listings
+
+
+# ========================================
+# Сборка записи объявления
+# ========================================
+
+def build_ad_record(raw: Dict[str, Any], url: str, search_query: str) -> Dict[str, Any]:
+    """
+    Собирает запись объявления из сырых полей схемы
+    
+    Args:
+        raw: Результат EXTRACT_AD_JS (поле -> строка/список/None)
+        url: URL объявления
+        search_query: Поисковый запрос
+        
+    Returns:
+        Словарь с данными объявления (формат _extract_ad_data)
+    """
+    data = {
+        'url': url,
+        'id': extract_id_from_url(url),
+        'search_query': search_query,
+        'scraped_at': datetime.now().isoformat(),
+        'schema_version': SCHEMA_VERSION
+    }
+    
+    # Заголовок
+    data['title'] = clean_text(raw.get('title'))
+    if not data['title']:
+        logger.warning(f"Could not extract title from {url}")
+    
+    # Цена
+    price_text: Optional[str] = raw.get('price')
+    data['price'] = parse_price(price_text)
+    data['currency'] = 'PLN' if price_text and 'zł' in price_text else None
+    if price_text is None:
+        logger.warning(f"Could not extract price from {url}")
+    
+    # Описание
+    data['description'] = clean_text(raw.get('description'))
+    if not data['description']:
+        logger.warning(f"Could not extract description from {url}")
+    
+    # Локация и дата публикации ("Warszawa - Dzisiaj o 12:00")
+    location_parts = (raw.get('location_date') or '').split('-')
+    data['location'] = clean_text(location_parts[0])
+    data['date'] = clean_text(location_parts[1]) if len(location_parts) > 1 else ""
+    
+    # Изображения (только абсолютные URL, без дублей слайдов карусели)
+    images = [src for src in dict.fromkeys(raw.get('images') or []) if src.startswith('http')]
+    data['images'] = images[:MAX_IMAGES]
+    
+    return data
+
+
+def build_listing_record(listing: Dict[str, Any], url: str, search_query: str) -> Dict[str, Any]:
+    """
+    Собирает запись объявления из данных карточки выдачи (без визита на страницу)
+    
+    Args:
+        listing: Сырые поля из listings_from_state
+        url: URL объявления
+        search_query: Поисковый запрос
+        
+    Returns:
+        Словарь в том же формате, что и build_ad_record
+    """
+    price = listing.get('price')
+    
+    return {
+        'url': url,
+        'id': extract_id_from_url(url),
+        'search_query': search_query,
+        'scraped_at': datetime.now().isoformat(),
+        'schema_version': SCHEMA_VERSION,
+        'source': 'listing',
+        'title': clean_text(listing.get('title')),
+        'price': float(price) if isinstance(price, (int, float)) else None,
+        'currency': listing.get('currency'),
+        'description': clean_text(listing.get('description')),
+        'location': clean_text(listing.get('location')),
+        'date': listing.get('date') or "",
+        'last_refresh': listing.get('last_refresh'),
+        'images': list(dict.fromkeys(listing.get('images') or []))[:MAX_IMAGES]
+    }
+
+
+def missing_fields(data: Dict[str, Any], required: List[str]) -> List[str]:
+    """
+    Возвращает обязательные поля, которые в записи пустые
+    """
+    return [field for field in required if data.get(field) in (None, '', [])]
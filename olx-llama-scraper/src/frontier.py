@@ -0,0 +1,165 @@
+"""
+Frontier - Объявления, уже поставленные в работу за текущий запуск
+
+Функционал:
+- Дедупликация объявлений между поисковыми запросами по ID из URL
+- Множество для небольших запусков, фильтр Блума для больших
+- Теги запросов: объявление парсится один раз, но помнит все запросы,
+  в выдаче которых встретилось
+
+Frontier живёт в памяти процесса: в multi-process режиме у каждого
+воркера свой frontier, объявление из запросов разных воркеров
+может быть обработано в каждом из них.
+"""
+
+import math
+import hashlib
+from typing import Dict, Any
+from loguru import logger
+
+from .utils import extract_id_from_url
+
+
+# ========================================
+# Фильтр Блума
+# ========================================
+
+class BloomFilter:
+    """
+    Фильтр Блума на bytearray
+    
+    Позиции битов - двойное хеширование по одному blake2b дайджесту.
+    Ложноотрицательных ответов нет; ложноположительные - с частотой
+    не выше false_positive_rate, пока добавлено не больше capacity ключей.
+    """
+    
+    def __init__(self, capacity: int, false_positive_rate: float = 0.001):
+        """
+        Args:
+            capacity: Ожидаемое количество ключей
+            false_positive_rate: Допустимая доля ложных срабатываний
+        """
+        capacity = max(1, capacity)
+        
+        # Оптимальные размер и число хешей: m = -n·ln(p) / ln²2, k = m/n · ln2
+        self.size = max(8, int(math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)))
+        self.hash_count = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+    
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+    
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+    
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+# ========================================
+# Frontier
+# ========================================
+
+class UrlFrontier:
+    """
+    Объявления, поставленные в работу за запуск
+    
+    Карточка, впервые встреченная в выдаче, попадает в pending и получает
+    card['queries'] = [query]. Повторная встреча в выдаче другого запроса
+    только дописывает запрос в card['queries'], пока объявление ещё
+    не спарсено (release). После release объявление остаётся в
+    множестве/фильтре Блума, но теги больше не собираются; объявление,
+    которое не удалось спарсить, из множества убирается.
+    """
+    
+    def __init__(
+        self,
+        expected_items: int = 1000,
+        bloom_threshold: int = 100000,
+        false_positive_rate: float = 0.001
+    ):
+        """
+        Args:
+            expected_items: Ожидаемое количество объявлений за запуск
+            bloom_threshold: Начиная с какого expected_items использовать фильтр Блума
+            false_positive_rate: Доля ложных срабатываний фильтра Блума
+                (такие объявления будут пропущены как повторы)
+        """
+        self.bloom = expected_items > bloom_threshold
+        
+        if self.bloom:
+            self._seen = BloomFilter(expected_items, false_positive_rate)
+        else:
+            self._seen = set()
+        
+        # Карточки, которые ещё не спарсены: ID -> card
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        
+        self.stats = {'admitted': 0, 'duplicates': 0}
+        
+        backend = f"bloom filter ({self._seen.size} bits, {self._seen.hash_count} hashes)" if self.bloom else "set"
+        logger.info(f"UrlFrontier initialized: {backend}, expected {expected_items} ads")
+    
+    @staticmethod
+    def key(card: Dict[str, Any]) -> str:
+        """
+        Ключ карточки: ID объявления из URL (сам URL, если ID не найден)
+        """
+        return extract_id_from_url(card['url']) or card.get('id') or card['url']
+    
+    def admit(self, card: Dict[str, Any], query: str) -> bool:
+        """
+        Ставит карточку в работу или помечает повтор
+        
+        Args:
+            card: Карточка выдачи
+            query: Запрос, в выдаче которого она встретилась
+            
+        Returns:
+            True если объявление встретилось впервые и его нужно парсить
+        """
+        key = self.key(card)
+        
+        if key in self._seen:
+            self.stats['duplicates'] += 1
+            
+            pending = self.pending.get(key)
+            if pending is not None and query not in pending['queries']:
+                pending['queries'].append(query)
+            
+            return False
+        
+        self._seen.add(key)
+        self.stats['admitted'] += 1
+        
+        card['queries'] = [query]
+        self.pending[key] = card
+        
+        return True
+    
+    def release(self, card: Dict[str, Any], failed: bool = False):
+        """
+        Объявление обработано: теги больше не нужны
+        
+        Args:
+            card: Карточка из admit
+            failed: Объявление не спарсилось - следующие запросы запуска
+                могут взять его снова (из фильтра Блума ключ не удалить)
+        """
+        key = self.key(card)
+        self.pending.pop(key, None)
+        
+        if failed:
+            if self.bloom:
+                logger.warning(f"Failed ad stays in the Bloom filter, skipped by later queries: {card['url']}")
+            else:
+                self._seen.discard(key)
+    
+    def __contains__(self, card_url: str) -> bool:
+        return self.key({'url': card_url}) in self._seen
@@ -0,0 +1,86 @@
+"""
+HTTP Fetcher - Загрузка страниц OLX без браузера
+
+Большинство страниц OLX отдаются сервером уже отрендеренными, поэтому
+их можно получить обычным HTTP-запросом и распарсить через lxml.
+Браузер нужен только как fallback (CAPTCHA, пустые поля).
+"""
+
+from typing import Optional, Tuple
+import aiohttp
+from loguru import logger
+
+
+class HttpFetcher:
+    """
+    Асинхронный HTTP-клиент с общим пулом соединений
+    """
+    
+    def __init__(
+        self,
+        user_agent: str,
+        proxy: Optional[str] = None,
+        timeout: float = 30,
+        max_connections: int = 10
+    ):
+        """
+        Args:
+            user_agent: User-Agent (тот же, что у браузерного контекста)
+            proxy: HTTP прокси (опционально)
+            timeout: Таймаут запроса в секундах
+            max_connections: Максимум одновременных соединений
+        """
+        self.user_agent = user_agent
+        self.proxy = proxy
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_connections = max_connections
+        
+        self._session: Optional[aiohttp.ClientSession] = None
+        
+        logger.info(f"HttpFetcher initialized: max_connections={max_connections}, proxy={'yes' if proxy else 'no'}")
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Возвращает общую сессию, создавая её при первом запросе
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                limit_per_host=self.max_connections,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={
+                    'User-Agent': self.user_agent,
+                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                    'Accept-Language': 'pl-PL,pl;q=0.9,en;q=0.8'
+                }
+            )
+        
+        return self._session
+    
+    async def fetch(self, url: str) -> Tuple[int, str, str]:
+        """
+        Загружает страницу (aiohttp сам проходит редиректы)
+        
+        Args:
+            url: URL страницы
+            
+        Returns:
+            (HTTP статус, HTML, URL после редиректов)
+        """
+        session = self._get_session()
+        
+        async with session.get(url, proxy=self.proxy) as response:
+            html = await response.text()
+            return response.status, html, str(response.url)
+    
+    async def close(self):
+        """
+        Закрывает сессию и все соединения
+        """
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,487 @@
+"""
+Images - Асинхронное скачивание изображений объявлений
+
+Функционал:
+- Общий пул соединений aiohttp с лимитом на хост
+- Ограничение числа одновременных загрузок
+- Потоковая запись во временный файл с контролем размера
+- Атомарное переименование готового файла
+- Сохранение тел изображений, уже полученных браузером
+- Дедупликация через ImageStore (SHA-256 + перцептивный хеш)
+- Пост-обработка в пуле процессов: проверка, WebP, миниатюры
+- Собственный rate limiter CDN (не расходует лимит страниц OLX)
+"""
+
+import os
+import time
+import random
+import asyncio
+import hashlib
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import aiohttp
+from PIL import Image
+from loguru import logger
+
+from .storage import ImageStore
+from .utils import RateLimiter
+
+
+def verify_image(path: str) -> Optional[str]:
+    """
+    Проверяет, что файл - корректное изображение
+    
+    Args:
+        path: Путь к файлу
+        
+    Returns:
+        Расширение по формату изображения (jpg/png/webp...) или None
+    """
+    try:
+        with Image.open(path) as img:
+            img.verify()
+            fmt = (img.format or 'jpeg').lower()
+    except Exception as e:
+        logger.error(f"Invalid image data: {e}")
+        return None
+    
+    return 'jpg' if fmt == 'jpeg' else fmt
+
+
+def average_hash(path: str, size: int = 8) -> str:
+    """
+    Перцептивный average hash изображения
+    
+    Картинка уменьшается до size x size в оттенках серого, каждый бит -
+    пиксель ярче среднего. У пережатых/уменьшенных копий хеши почти совпадают.
+    
+    Returns:
+        Hex строка (size*size бит)
+    """
+    with Image.open(path) as img:
+        pixels = list(img.convert('L').resize((size, size)).getdata())
+    
+    mean = sum(pixels) / len(pixels)
+    bits = ''.join('1' if pixel > mean else '0' for pixel in pixels)
+    
+    return f"{int(bits, 2):0{size * size // 4}x}"
+
+
+def inspect_image(path: str, with_phash: bool = False) -> Optional[Tuple[str, Optional[str]]]:
+    """
+    Проверка изображения и (опционально) его phash за один вызов в потоке
+    
+    Returns:
+        (расширение, phash или None) или None если файл не изображение
+    """
+    ext = verify_image(path)
+    if ext is None:
+        return None
+    
+    return ext, average_hash(path) if with_phash else None
+
+
+def thumbnail_path(path: str) -> str:
+    """
+    Путь миниатюры для файла изображения ({stem}_thumb.webp рядом с ним)
+    """
+    return f"{os.path.splitext(path)[0]}_thumb.webp"
+
+
+def process_image(
+    path: str,
+    with_phash: bool,
+    webp_quality: int,
+    thumb_size: int
+) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+    """
+    Полная обработка скачанного файла (выполняется в пуле процессов)
+    
+    Проверяет изображение, считает phash, перекодирует файл в WebP
+    на месте и сохраняет миниатюру во временный файл рядом.
+    
+    Args:
+        path: Временный файл с исходными байтами
+        with_phash: Считать перцептивный хеш
+        webp_quality: Качество WebP (0 - оставить исходный формат)
+        thumb_size: Сторона миниатюры в пикселях (0 - без миниатюры)
+        
+    Returns:
+        (расширение, phash, путь временной миниатюры) или None если файл не изображение
+    """
+    inspected = inspect_image(path, with_phash)
+    if inspected is None:
+        return None
+    
+    ext, phash = inspected
+    thumb_tmp = None
+    
+    with Image.open(path) as img:
+        img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        
+        if thumb_size:
+            thumb = img.copy()
+            thumb.thumbnail((thumb_size, thumb_size))
+            thumb_tmp = f"{path}.thumb"
+            thumb.save(thumb_tmp, format='WEBP', quality=webp_quality or 80)
+        
+        if webp_quality:
+            img.save(f"{path}.webp", format='WEBP', quality=webp_quality)
+            ext = 'webp'
+    
+    if webp_quality:
+        os.replace(f"{path}.webp", path)
+    
+    return ext, phash, thumb_tmp
+
+
+class ImagePostProcessor:
+    """
+    Пул процессов для работы PIL (декодирование, WebP, миниатюры)
+    
+    PIL держит CPU и GIL, поэтому обработка выносится из event loop
+    и из процесса scraper целиком.
+    """
+    
+    def __init__(self, workers: int = 2, webp_quality: int = 80, thumb_size: int = 320):
+        """
+        Args:
+            workers: Количество процессов
+            webp_quality: Качество WebP 1-100 (0 - оставить исходный формат)
+            thumb_size: Сторона миниатюры в пикселях (0 - без миниатюр)
+        """
+        self.webp_quality = webp_quality
+        self.thumb_size = thumb_size
+        
+        # spawn: процессы не наследуют event loop и потоки Playwright
+        self.executor = ProcessPoolExecutor(
+            max_workers=max(1, workers),
+            mp_context=multiprocessing.get_context('spawn')
+        )
+        
+        logger.info(f"ImagePostProcessor initialized: {workers} workers, webp_quality={webp_quality}, thumb={thumb_size}px")
+    
+    async def process(self, path: str, with_phash: bool = False) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """
+        Обрабатывает файл в пуле процессов (см. process_image)
+        """
+        loop = asyncio.get_running_loop()
+        
+        return await loop.run_in_executor(
+            self.executor,
+            process_image,
+            path,
+            with_phash,
+            self.webp_quality,
+            self.thumb_size
+        )
+    
+    def close(self):
+        """
+        Останавливает процессы пула
+        """
+        self.executor.shutdown(wait=True)
+
+
+class ImageDownloader:
+    """
+    Скачивает изображения через общую aiohttp сессию
+    
+    Тело ответа пишется кусками во временный файл рядом с целевым,
+    размер проверяется по мере чтения (content-length не обязателен
+    и может врать), готовый файл переименовывается атомарно.
+    
+    С ImageStore файлы именуются по SHA-256 содержимого, а уже известные
+    URL не скачиваются повторно.
+    """
+    
+    CHUNK_SIZE = 64 * 1024
+    
+    def __init__(
+        self,
+        save_dir: str,
+        max_size_mb: int = 10,
+        concurrency: int = 4,
+        connections_per_host: int = 4,
+        timeout: float = 15,
+        user_agent: Optional[str] = None,
+        proxy: Optional[str] = None,
+        store: Optional[ImageStore] = None,
+        phash: bool = False,
+        postprocessor: Optional[ImagePostProcessor] = None,
+        rate_limiter: Optional[RateLimiter] = None
+    ):
+        """
+        Args:
+            save_dir: Директория для сохранения
+            max_size_mb: Максимальный размер файла в MB
+            concurrency: Максимум одновременных загрузок
+            connections_per_host: Максимум соединений к одному хосту
+            timeout: Таймаут загрузки одного изображения (сек)
+            user_agent: User-Agent запросов
+            proxy: HTTP прокси (опционально)
+            store: Хранилище с дедупликацией (None - файлы {name}.{ext} в save_dir)
+            phash: Считать перцептивный хеш для группировки похожих фото
+            postprocessor: Пул для WebP/миниатюр (None - только проверка в потоке)
+            rate_limiter: Ведро запросов к CDN (None - без ограничения)
+        """
+        self.save_dir = save_dir
+        self.max_bytes = max_size_mb * 1024 * 1024
+        self.concurrency = max(1, concurrency)
+        self.connections_per_host = max(1, connections_per_host)
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.user_agent = user_agent
+        self.proxy = proxy
+        self.store = store
+        self.phash = phash
+        self.postprocessor = postprocessor
+        self.rate_limiter = rate_limiter
+        
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+        
+        self.stats = {'downloaded': 0, 'captured': 0, 'failed': 0, 'too_large': 0, 'bytes': 0}
+        
+        logger.info(
+            f"ImageDownloader initialized: concurrency={self.concurrency}, "
+            f"per_host={self.connections_per_host}, max {max_size_mb}MB"
+        )
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """
+        Возвращает общую сессию, создавая её при первой загрузке
+        """
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency,
+                limit_per_host=self.connections_per_host,
+                ttl_dns_cache=300
+            )
+            headers = {'User-Agent': self.user_agent} if self.user_agent else None
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers=headers)
+        
+        return self._session
+    
+    async def download(self, url: str, name: Optional[str] = None) -> Optional[str]:
+        """
+        Скачивает одно изображение
+        
+        Args:
+            url: URL изображения
+            name: Имя файла без расширения (расширение - по формату изображения)
+            
+        Returns:
+            Путь к сохранённому файлу или None при ошибке
+        """
+        async with self._semaphore:
+            return await self._download(url, name)
+    
+    async def download_all(
+        self,
+        urls: List[str],
+        prefix: str,
+        captured: Optional[Dict[str, bytes]] = None
+    ) -> List[str]:
+        """
+        Параллельно скачивает изображения одного объявления
+        
+        Args:
+            urls: URL изображений
+            prefix: Префикс имён файлов ({prefix}_{n}.{ext})
+            captured: Тела изображений, уже полученные браузером (URL -> bytes)
+            
+        Returns:
+            Пути успешно скачанных файлов в порядке urls
+        """
+        captured = captured or {}
+        
+        async def fetch(url: str, name: str) -> Optional[str]:
+            if url in captured:
+                return await self.save_bytes(url, captured[url], name)
+            return await self.download(url, name)
+        
+        paths = await asyncio.gather(*(
+            fetch(url, f"{prefix}_{n}") for n, url in enumerate(urls, 1)
+        ))
+        
+        return [path for path in paths if path]
+    
+    async def save_bytes(self, url: str, body: bytes, name: Optional[str] = None) -> Optional[str]:
+        """
+        Сохраняет изображение, тело которого уже получено (без сети)
+        
+        Args:
+            url: Исходный URL изображения
+            body: Байты изображения
+            name: Имя файла без расширения
+            
+        Returns:
+            Путь к сохранённому файлу или None при ошибке
+        """
+        if self.store:
+            known_path = self.store.path_for_url(url)
+            if known_path:
+                return known_path
+        
+        if len(body) > self.max_bytes:
+            logger.warning(f"Captured image too large: {len(body)} bytes > {self.max_bytes} bytes")
+            self.stats['too_large'] += 1
+            return None
+        
+        Path(self.save_dir).mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.save_dir, suffix='.part')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+        
+        self.stats['captured'] += 1
+        
+        return await self._finalize(url, tmp_path, hashlib.sha256(body).hexdigest(), len(body), name)
+    
+    async def _download(self, url: str, name: Optional[str]) -> Optional[str]:
+        """
+        Потоковая загрузка во временный файл, затем _finalize
+        """
+        # Уже скачанный URL - без сети и без диска
+        if self.store:
+            known_path = self.store.path_for_url(url)
+            if known_path:
+                return known_path
+        
+        if self.rate_limiter:
+            await self.rate_limiter.wait()
+        
+        Path(self.save_dir).mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.save_dir, suffix='.part')
+        complete = False
+        
+        try:
+            logger.debug(f"Downloading image: {url}")
+            
+            size = 0
+            digest = hashlib.sha256()
+            with os.fdopen(fd, 'wb') as f:
+                async with self._get_session().get(url, proxy=self.proxy) as response:
+                    if response.status == 429 and self.rate_limiter:
+                        self.rate_limiter.penalize()
+                    response.raise_for_status()
+                    
+                    # Заведомо большой файл отбрасываем до чтения тела
+                    if response.content_length and response.content_length > self.max_bytes:
+                        logger.warning(f"Image too large: {response.content_length} bytes > {self.max_bytes} bytes")
+                        size = None
+                    
+                    while size is not None:
+                        chunk = await response.content.read(self.CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            logger.warning(f"Image too large: more than {self.max_bytes} bytes streamed from {url}")
+                            size = None
+                            break
+                        
+                        digest.update(chunk)
+                        f.write(chunk)
+            
+            complete = size is not None
+            
+        except Exception as e:
+            logger.error(f"Failed to download image {url}: {e}")
+            self.stats['failed'] += 1
+            return None
+            
+        finally:
+            # Ошибка, отмена (CancelledError) или слишком большой ответ -
+            # временный файл не нужен; иначе им дальше владеет _finalize
+            if not complete and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        
+        # Превышен max_size_mb - ответ дочитывать не стали
+        if size is None:
+            self.stats['too_large'] += 1
+            return None
+        
+        self.stats['downloaded'] += 1
+        self.stats['bytes'] += size
+        if self.rate_limiter:
+            self.rate_limiter.reward()
+        
+        return await self._finalize(url, tmp_path, digest.hexdigest(), size, name)
+    
+    async def _finalize(self, url: str, tmp_path: str, sha256: str, size: int, name: Optional[str]) -> Optional[str]:
+        """
+        Проверка/обработка временного файла и атомарный перенос на место
+        
+        Временные файлы удаляются при любом исходе.
+        """
+        thumb_tmp = None
+        
+        try:
+            # PIL работает с диском и CPU - не в event loop
+            with_phash = self.phash and self.store is not None
+            
+            if self.postprocessor:
+                processed = await self.postprocessor.process(tmp_path, with_phash)
+                if processed is None:
+                    self.stats['failed'] += 1
+                    return None
+                
+                ext, phash, thumb_tmp = processed
+            else:
+                inspected = await asyncio.to_thread(inspect_image, tmp_path, with_phash)
+                if inspected is None:
+                    self.stats['failed'] += 1
+                    return None
+                
+                ext, phash = inspected
+            
+            if self.store:
+                filepath = self.store.add(url, tmp_path, sha256, ext, size, phash)
+            else:
+                if not name:
+                    name = f"{int(time.time())}_{random.randint(1000, 9999)}"
+                
+                filepath = os.path.join(self.save_dir, f"{name}.{ext}")
+                os.replace(tmp_path, filepath)
+            
+            tmp_path = None
+            
+            if thumb_tmp:
+                self._place_thumbnail(thumb_tmp, filepath)
+                thumb_tmp = None
+            
+            logger.info(f"Image saved: {filepath} ({size} bytes)")
+            return filepath
+            
+        except Exception as e:
+            logger.error(f"Failed to store image {url}: {e}")
+            self.stats['failed'] += 1
+            return None
+            
+        finally:
+            for leftover in (tmp_path, thumb_tmp):
+                if leftover and os.path.exists(leftover):
+                    os.remove(leftover)
+    
+    def _place_thumbnail(self, thumb_tmp: str, filepath: str):
+        """
+        Переносит миниатюру к файлу изображения (если её там ещё нет)
+        """
+        target = thumbnail_path(filepath)
+        
+        if os.path.exists(target):
+            os.remove(thumb_tmp)
+        else:
+            os.replace(thumb_tmp, target)
+    
+    async def close(self):
+        """
+        Закрывает сессию и все соединения
+        """
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -0,0 +1,382 @@
+"""
+Limits - Бюджет запросов, общий для нескольких экземпляров scraper
+
+Функционал:
+- Бюджет в SQLite (WAL): координирует любые процессы на одной машине,
+  в том числе независимые systemd-юниты и compose-реплики с общим томом
+- Бюджет поверх Redis-совместимого хранилища (SET NX PX / GET / DELETE)
+- Локальная замена Redis в памяти (MemoryStore) для тестов и одного процесса
+- Общий CAPTCHA cool-down: пауза, которую соблюдают все участники
+
+Все бюджеты реализуют интерфейс SharedBudget из utils:
+reserve() -> секунды ожидания, start_cooldown(seconds), cooldown_remaining().
+Методы блокирующие (файл, сеть, ожидание замка): RateLimiter вызывает
+их из event loop через asyncio.to_thread.
+"""
+
+import os
+import time
+import uuid
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Optional
+from loguru import logger
+
+from .utils import SharedBudget
+
+
+# ========================================
+# SQLite
+# ========================================
+
+class SqliteBudget:
+    """
+    Общий бюджет запросов в файле SQLite
+    
+    reserve() выполняется в транзакции BEGIN IMMEDIATE: SQLite
+    сериализует её между всеми процессами, открывшими файл.
+    Если база занята дольше BUSY_TIMEOUT, операция повторяется через
+    LOCK_RETRY_DELAY вместо исключения.
+    Объект можно передавать в дочерние процессы - соединение
+    открывается заново в каждом процессе и общее для его потоков.
+    """
+    
+    # Сколько SQLite ждёт занятую базу внутри одной попытки (сек)
+    BUSY_TIMEOUT = 5
+    LOCK_RETRY_DELAY = 0.5
+    
+    def __init__(self, path: str, calls_per_minute: int, name: str = 'olx'):
+        """
+        Args:
+            path: Путь к файлу SQLite
+            calls_per_minute: Максимум запросов в минуту на всех участников
+            name: Имя бюджета (в одном файле может быть несколько)
+        """
+        self.path = path
+        self.interval = 60.0 / calls_per_minute
+        self.name = name
+        
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._thread_lock = threading.Lock()
+        
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._connect()
+        
+        logger.info(f"SqliteBudget initialized: {path}, {calls_per_minute} calls/min")
+    
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_conn'] = None
+        state['_pid'] = None
+        del state['_thread_lock']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._thread_lock = threading.Lock()
+    
+    def _connect(self) -> sqlite3.Connection:
+        """
+        Соединение текущего процесса (создаётся при первом обращении)
+        """
+        if self._conn is None or self._pid != os.getpid():
+            # isolation_level=None: транзакции открываются явно;
+            # потоки процесса используют соединение по очереди (_thread_lock)
+            self._conn = sqlite3.connect(
+                self.path,
+                timeout=self.BUSY_TIMEOUT,
+                isolation_level=None,
+                check_same_thread=False
+            )
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_limits (
+                    name TEXT PRIMARY KEY,
+                    next_slot REAL NOT NULL DEFAULT 0,
+                    cooldown_until REAL NOT NULL DEFAULT 0
+                )
+            ''')
+            self._conn.execute('INSERT OR IGNORE INTO rate_limits (name) VALUES (?)', (self.name,))
+            self._pid = os.getpid()
+        
+        return self._conn
+    
+    def _execute(self, operation):
+        """
+        Выполняет operation(conn), повторяя попытку, пока база занята
+        
+        Args:
+            operation: Функция от соединения
+            
+        Returns:
+            Результат operation
+        """
+        while True:
+            try:
+                with self._thread_lock:
+                    return operation(self._connect())
+                    
+            except sqlite3.OperationalError as e:
+                if 'locked' not in str(e) and 'busy' not in str(e):
+                    raise
+                
+                logger.warning(f"Rate limit database is busy, retrying in {self.LOCK_RETRY_DELAY}s: {e}")
+                time.sleep(self.LOCK_RETRY_DELAY)
+    
+    def reserve(self) -> float:
+        """
+        Занимает ближайший свободный слот (не раньше конца cool-down)
+        
+        Returns:
+            Сколько секунд ждать до своего слота
+        """
+        return self._execute(self._reserve)
+    
+    def _reserve(self, conn: sqlite3.Connection) -> float:
+        conn.execute('BEGIN IMMEDIATE')
+        
+        try:
+            next_slot, cooldown_until = conn.execute(
+                'SELECT next_slot, cooldown_until FROM rate_limits WHERE name = ?',
+                (self.name,)
+            ).fetchone()
+            
+            now = time.time()
+            slot = max(now, next_slot, cooldown_until)
+            
+            conn.execute('UPDATE rate_limits SET next_slot = ? WHERE name = ?', (slot + self.interval, self.name))
+            conn.execute('COMMIT')
+            
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        
+        return slot - now
+    
+    def start_cooldown(self, seconds: float):
+        """
+        Пауза для всех участников после CAPTCHA/блокировки
+        """
+        until = time.time() + seconds
+        
+        self._execute(lambda conn: conn.execute(
+            'UPDATE rate_limits SET cooldown_until = MAX(cooldown_until, ?) WHERE name = ?',
+            (until, self.name)
+        ))
+    
+    def cooldown_remaining(self) -> float:
+        """
+        Сколько секунд осталось до конца cool-down
+        """
+        row = self._execute(lambda conn: conn.execute(
+            'SELECT cooldown_until FROM rate_limits WHERE name = ?',
+            (self.name,)
+        ).fetchone())
+        
+        return max(0.0, row[0] - time.time())
+    
+    def close(self):
+        """
+        Закрывает соединение текущего процесса
+        """
+        with self._thread_lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
+
+
+# ========================================
+# Redis-совместимое хранилище
+# ========================================
+
+class MemoryStore:
+    """
+    Замена Redis в памяти процесса
+    
+    Поддерживает только команды, которые использует StoreBudget:
+    get, set (с nx/px) и delete.
+    """
+    
+    def __init__(self):
+        self._data: Dict[str, Any] = {}
+        self._expires: Dict[str, float] = {}
+        self._lock = threading.Lock()
+    
+    def _expire(self, key: str):
+        if key in self._expires and self._expires[key] <= time.time():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+    
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            self._expire(key)
+            value = self._data.get(key)
+        
+        return None if value is None else str(value).encode()
+    
+    def set(self, key: str, value: Any, nx: bool = False, px: Optional[int] = None) -> Optional[bool]:
+        with self._lock:
+            self._expire(key)
+            if nx and key in self._data:
+                return None
+            
+            self._data[key] = value
+            if px:
+                self._expires[key] = time.time() + px / 1000
+            else:
+                self._expires.pop(key, None)
+        
+        return True
+    
+    def delete(self, key: str) -> int:
+        with self._lock:
+            self._expires.pop(key, None)
+            return 1 if self._data.pop(key, None) is not None else 0
+
+
+class StoreBudget:
+    """
+    Общий бюджет запросов в Redis-совместимом хранилище
+    
+    Слот и cool-down меняются под коротким замком SET NX PX, поэтому
+    нужны только базовые команды (без Lua). Клиент создаётся из redis_url в каждом
+    процессе заново; вместо Redis можно передать store (например MemoryStore).
+    """
+    
+    # Время жизни замка (мс): упавший процесс не заблокирует бюджет навсегда
+    LOCK_TTL_MS = 2000
+    LOCK_RETRY_DELAY = 0.01
+    
+    def __init__(
+        self,
+        calls_per_minute: int,
+        store: Any = None,
+        redis_url: Optional[str] = None,
+        name: str = 'olx'
+    ):
+        """
+        Args:
+            calls_per_minute: Максимум запросов в минуту на всех участников
+            store: Готовый клиент (redis.Redis, MemoryStore...)
+            redis_url: URL Redis, если store не передан
+            name: Префикс ключей
+        """
+        if store is None and not redis_url:
+            raise ValueError("StoreBudget needs a store or redis_url")
+        
+        self.interval = 60.0 / calls_per_minute
+        self.redis_url = redis_url
+        self.name = name
+        self._store = store
+        
+        logger.info(f"StoreBudget initialized: {redis_url or type(store).__name__}, {calls_per_minute} calls/min")
+    
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        if self.redis_url:
+            state['_store'] = None
+        return state
+    
+    @property
+    def store(self):
+        """
+        Клиент хранилища (redis импортируется только при использовании)
+        """
+        if self._store is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package (pip install redis)")
+            
+            self._store = redis.Redis.from_url(self.redis_url)
+        
+        return self._store
+    
+    def _read(self, key: str) -> float:
+        value = self.store.get(f"{self.name}:{key}")
+        return float(value) if value is not None else 0.0
+    
+    @contextmanager
+    def _locked(self):
+        """
+        Замок бюджета: ждёт, пока его освободят другие участники
+        """
+        lock_key = f"{self.name}:lock"
+        token = uuid.uuid4().hex
+        
+        while not self.store.set(lock_key, token, nx=True, px=self.LOCK_TTL_MS):
+            time.sleep(self.LOCK_RETRY_DELAY)
+        
+        try:
+            yield
+            
+        finally:
+            # Замок мог истечь и достаться другому - удаляем только свой
+            current = self.store.get(lock_key)
+            if current is not None and current.decode() == token:
+                self.store.delete(lock_key)
+    
+    def reserve(self) -> float:
+        """
+        Занимает ближайший свободный слот (не раньше конца cool-down)
+        
+        Returns:
+            Сколько секунд ждать до своего слота
+        """
+        with self._locked():
+            now = time.time()
+            slot = max(now, self._read('next_slot'), self._read('cooldown_until'))
+            self.store.set(f"{self.name}:next_slot", repr(slot + self.interval))
+        
+        return slot - now
+    
+    def start_cooldown(self, seconds: float):
+        """
+        Пауза для всех участников после CAPTCHA/блокировки
+        
+        Срок только продлевается: более ранний конец паузы от другого
+        участника не перезапишет поздний.
+        """
+        with self._locked():
+            until = time.time() + seconds
+            if until > self._read('cooldown_until'):
+                self.store.set(f"{self.name}:cooldown_until", repr(until))
+    
+    def cooldown_remaining(self) -> float:
+        """
+        Сколько секунд осталось до конца cool-down
+        """
+        return max(0.0, self._read('cooldown_until') - time.time())
+
+
+# ========================================
+# Фабрика
+# ========================================
+
+def create_budget(config: Dict[str, Any], ctx=None):
+    """
+    Создаёт общий бюджет по RATE_LIMIT_BACKEND
+    
+    Args:
+        config: Конфигурация из load_config()
+        ctx: multiprocessing context (для backend memory)
+        
+    Returns:
+        SharedBudget / SqliteBudget / StoreBudget
+    """
+    backend = config.get('rate_limit_backend', 'memory')
+    calls_per_minute = config.get('global_rate_limit') or config['rate_limit']
+    
+    if backend == 'sqlite':
+        return SqliteBudget(config.get('rate_limit_state_path', './data/rate_limit.sqlite'), calls_per_minute)
+    
+    if backend == 'redis':
+        return StoreBudget(calls_per_minute, redis_url=config.get('redis_url') or 'redis://localhost:6379/0')
+    
+    if backend != 'memory':
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+    
+    return SharedBudget(calls_per_minute, ctx)
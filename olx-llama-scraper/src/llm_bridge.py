@@ -10,11 +10,15 @@ Llama 4 Bridge - Интеграция с Llama 4 Maverick через Web UI
 """
 
 import json
+import time
 import asyncio
 from typing import Dict, Any, Optional, Tuple
-from playwright.async_api import Page, Browser, TimeoutError as PlaywrightTimeoutError
+from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
 from loguru import logger
 
+from .browser import BrowserManager, PagePool
+from .utils import RateLimiter, TimingStats
+
 
 class LlamaBridge:
     """
@@ -33,18 +37,44 @@ class LlamaBridge:
 
 Выполни преобразование и отдай только JSON (никакого лишнего текста)."""
     
-    def __init__(self, config: Dict[str, Any], browser: Browser):
+    # Сообщения ассистента в распространённых web UI
+    ASSISTANT_MESSAGE_SELECTOR = (
+        '.bot-message, .assistant-message, [data-role="assistant"], '
+        '.message.bot, .response'
+    )
+    
+    # Интервал проверки, закончился ли стриминг ответа (сек)
+    STREAM_POLL_INTERVAL = 0.5
+    
+    def __init__(self, config: Dict[str, Any], browser_manager: BrowserManager):
         """
         Args:
             config: Конфигурация из utils.load_config()
-            browser: Playwright Browser instance
+            browser_manager: Общий BrowserManager (свой контекст внутри его браузера)
         """
         self.config = config
-        self.browser = browser
+        self.browser_manager = browser_manager
         self.llama_url = config['llama_url']
         self.timeout = config['llama_timeout'] * 1000  # в миллисекундах
         self.max_retries = config['llama_retries']
         
+        # Ожидание готовности UI + телеметрия реального времени ожидания
+        self.ready_timeout = config.get('ready_timeout', 10000)
+        self.timings = TimingStats()
+        
+        # Своё ведро запросов к UI (0 - без ограничения)
+        self.rate_limiter = RateLimiter(
+            calls_per_minute=config.get('llama_rate_limit', 0),
+            min_delay=0,
+            max_delay=0,
+            burst=config.get('llama_rate_burst', 1),
+            name='llama'
+        )
+        
+        # Контекст и пул вкладок создаются лениво при первом запросе
+        self.context = None
+        self.page_pool: Optional[PagePool] = None
+        
         logger.info(f"LlamaBridge initialized: url={self.llama_url}, timeout={self.timeout}ms")
     
     async def analyze_ad(self, ad_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -90,7 +120,7 @@ class LlamaBridge:
                     if attempt < self.max_retries:
                         user_prompt = f"Предыдущий ответ был некорректным JSON. Пожалуйста, верни ТОЛЬКО валидный JSON без лишнего текста:\n{response_text}"
                         await asyncio.sleep(2)  # Небольшая задержка
-                
+                        
             except Exception as e:
                 logger.error(f"Llama query failed (attempt {attempt}): {e}")
                 
@@ -128,6 +158,32 @@ Location: {ad_data.get('location', 'N/A')}
         
         return prompt
     
+    async def _get_page_pool(self) -> PagePool:
+        """
+        Возвращает пул вкладок Llama UI, создавая контекст при первом вызове
+        """
+        if self.page_pool is None:
+            self.context = await self.browser_manager.new_context('llama')
+            # По вкладке на каждый воркер стадии analyze
+            self.page_pool = PagePool(
+                self.context,
+                size=max(1, self.config.get('analyze_workers', 1)),
+                max_uses=self.config.get('page_max_uses', 50)
+            )
+        
+        return self.page_pool
+    
+    async def close(self):
+        """
+        Закрывает вкладки и контекст Llama UI
+        """
+        if self.page_pool:
+            await self.page_pool.close()
+            self.page_pool = None
+        if self.context:
+            await self.context.close()
+            self.context = None
+    
     async def _query_llama(self, user_prompt: str, is_retry: bool = False) -> str:
         """
         Отправляет промт в Llama 4 web UI и получает ответ
@@ -139,122 +195,154 @@ Location: {ad_data.get('location', 'N/A')}
         Returns:
             Текст ответа от модели
         """
-        page = await self.browser.new_page()
+        page_pool = await self._get_page_pool()
+        await self.rate_limiter.wait()
         
-        try:
-            logger.debug(f"Opening Llama web UI: {self.llama_url}")
-            
-            # Открываем страницу чата
-            await page.goto(self.llama_url, timeout=self.timeout, wait_until='networkidle')
-            
-            # Ждём загрузки интерфейса
-            await page.wait_for_timeout(2000)
-            
-            # Находим textarea для ввода (селектор зависит от конкретной реализации web UI)
-            # Пример для распространённых UI: text-generation-webui, oobabooga
-            textarea_selectors = [
-                'textarea[placeholder*="message"]',
-                'textarea[name="message"]',
-                'textarea#textbox',
-                'textarea.chat-input',
-                '#user-input',
-                'textarea'
-            ]
-            
-            textarea = None
-            for selector in textarea_selectors:
+        async with page_pool.page() as page:
+            try:
+                logger.debug(f"Opening Llama web UI: {self.llama_url}")
+                
+                # Открываем страницу чата
+                await page.goto(self.llama_url, timeout=self.timeout, wait_until='networkidle')
+                
+                # Находим textarea для ввода (селектор зависит от конкретной реализации web UI)
+                # Пример для распространённых UI: text-generation-webui, oobabooga
+                textarea_selectors = [
+                    'textarea[placeholder*="message"]',
+                    'textarea[name="message"]',
+                    'textarea#textbox',
+                    'textarea.chat-input',
+                    '#user-input',
+                    'textarea'
+                ]
+                
+                # Ждём появления любого поля ввода вместо фиксированной паузы
+                wait_start = time.perf_counter()
                 try:
-                    textarea = await page.locator(selector).first
-                    if await textarea.is_visible(timeout=2000):
+                    await page.locator(', '.join(textarea_selectors)).first.wait_for(
+                        state='visible',
+                        timeout=self.ready_timeout
+                    )
+                    self.timings.record('llama_input_ready', time.perf_counter() - wait_start)
+                except PlaywrightTimeoutError:
+                    self.timings.record('llama_input_ready_timeout', time.perf_counter() - wait_start)
+                
+                textarea = None
+                for selector in textarea_selectors:
+                    candidate = page.locator(selector).first
+                    if await candidate.is_visible():
+                        textarea = candidate
                         logger.debug(f"Found textarea with selector: {selector}")
                         break
-                except:
-                    continue
-            
-            if not textarea:
-                raise Exception("Could not find chat input textarea")
-            
-            # Если это первая попытка - отправляем system prompt
-            if not is_retry:
-                await textarea.fill(self.SYSTEM_PROMPT)
-                await textarea.press('Enter')
-                await page.wait_for_timeout(1000)
-            
-            # Отправляем user prompt
-            await textarea.fill(user_prompt)
-            
-            # Находим кнопку отправки
-            send_button_selectors = [
-                'button:has-text("Send")',
-                'button:has-text("Submit")',
-                'button[type="submit"]',
-                'button.send-button',
-                '#send-btn'
-            ]
-            
-            for selector in send_button_selectors:
-                try:
-                    button = await page.locator(selector).first
-                    if await button.is_visible(timeout=1000):
+                
+                if not textarea:
+                    raise Exception("Could not find chat input textarea")
+                
+                # Если это первая попытка - отправляем system prompt
+                if not is_retry:
+                    messages_before = await page.locator(self.ASSISTANT_MESSAGE_SELECTOR).count()
+                    await textarea.fill(self.SYSTEM_PROMPT)
+                    await textarea.press('Enter')
+                    
+                    # Ждём, пока модель ответит на system prompt
+                    await self._wait_for_response(page, messages_before, 'llama_system_ack')
+                
+                # Отправляем user prompt
+                messages_before = await page.locator(self.ASSISTANT_MESSAGE_SELECTOR).count()
+                await textarea.fill(user_prompt)
+                
+                # Находим кнопку отправки
+                send_button_selectors = [
+                    'button:has-text("Send")',
+                    'button:has-text("Submit")',
+                    'button[type="submit"]',
+                    'button.send-button',
+                    '#send-btn'
+                ]
+                
+                for selector in send_button_selectors:
+                    button = page.locator(selector).first
+                    if await button.is_visible():
                         await button.click()
                         logger.debug(f"Clicked send button: {selector}")
                         break
-                except:
-                    continue
-            
-            # Ждём ответа от модели
-            # Обычно ответ появляется в элементе с классом типа .bot-message, .assistant-message
-            logger.debug("Waiting for Llama response...")
-            
-            await page.wait_for_timeout(3000)  # Даём время на генерацию
-            
-            # Ищем последнее сообщение от ассистента
-            response_selectors = [
-                '.bot-message:last-of-type',
-                '.assistant-message:last-of-type',
-                '[data-role="assistant"]:last-of-type',
-                '.message.bot:last-of-type',
-                '.response:last-of-type'
-            ]
-            
-            response_text = ""
-            for selector in response_selectors:
-                try:
-                    response_el = await page.locator(selector).first
-                    if await response_el.is_visible(timeout=2000):
-                        response_text = await response_el.text_content()
-                        if response_text and len(response_text) > 10:
-                            logger.debug(f"Got response with selector: {selector}")
-                            break
-                except:
-                    continue
+                
+                # Ждём ответа от модели
+                # Обычно ответ появляется в элементе с классом типа .bot-message, .assistant-message
+                logger.debug("Waiting for Llama response...")
+                
+                response_text = ""
+                if await self._wait_for_response(page, messages_before, 'llama_response'):
+                    last_message = page.locator(self.ASSISTANT_MESSAGE_SELECTOR).last
+                    response_text = (await last_message.text_content()) or ""
+                
+                # Если не нашли через селекторы - берём весь текст страницы и ищем JSON
+                if not response_text:
+                    page_content = await page.content()
+                    # Ищем JSON блок в контенте
+                    import re
+                    json_match = re.search(r'\{[\s\S]*?"summary"[\s\S]*?\}', page_content)
+                    if json_match:
+                        response_text = json_match.group(0)
+                
+                if not response_text:
+                    raise Exception("Could not extract response from Llama UI")
+                
+                logger.debug(f"Llama response received: {len(response_text)} chars")
+                
+                return response_text
+                
+            except PlaywrightTimeoutError:
+                logger.error(f"Timeout querying Llama: {self.llama_url}")
+                raise
+                
+            except Exception as e:
+                logger.error(f"Error querying Llama: {e}")
+                raise
+    
+    async def _wait_for_response(self, page: Page, messages_before: int, metric: str) -> bool:
+        """
+        Ждёт новое сообщение ассистента и окончание его генерации
+        
+        Сначала ждём, пока число сообщений станет больше messages_before,
+        затем - пока текст последнего сообщения перестанет меняться
+        (UI обычно стримит ответ по токенам).
+        
+        Args:
+            page: Вкладка с чатом
+            messages_before: Число сообщений ассистента до отправки
+            metric: Имя метрики в self.timings
             
-            # Если не нашли через селекторы - берём весь текст страницы и ищем JSON
-            if not response_text:
-                page_content = await page.content()
-                # Ищем JSON блок в контенте
-                import re
-                json_match = re.search(r'\{[\s\S]*?"summary"[\s\S]*?\}', page_content)
-                if json_match:
-                    response_text = json_match.group(0)
+        Returns:
+            True если ответ получен до таймаута
+        """
+        start = time.perf_counter()
+        deadline = start + self.timeout / 1000
+        
+        try:
+            await page.wait_for_function(
+                "([selector, before]) => document.querySelectorAll(selector).length > before",
+                arg=[self.ASSISTANT_MESSAGE_SELECTOR, messages_before],
+                timeout=self.timeout
+            )
             
-            if not response_text:
-                raise Exception("Could not extract response from Llama UI")
+            last_message = page.locator(self.ASSISTANT_MESSAGE_SELECTOR).last
+            previous_text = None
             
-            logger.debug(f"Llama response received: {len(response_text)} chars")
+            while time.perf_counter() < deadline:
+                text = await last_message.text_content()
+                if text and text == previous_text:
+                    break
+                previous_text = text
+                await asyncio.sleep(self.STREAM_POLL_INTERVAL)
             
-            return response_text
+            self.timings.record(metric, time.perf_counter() - start)
+            return True
             
         except PlaywrightTimeoutError:
-            logger.error(f"Timeout querying Llama: {self.llama_url}")
-            raise
-            
-        except Exception as e:
-            logger.error(f"Error querying Llama: {e}")
-            raise
-            
-        finally:
-            await page.close()
+            self.timings.record(f"{metric}_timeout", time.perf_counter() - start)
+            logger.warning(f"No assistant message within {self.timeout}ms ({metric})")
+            return False
     
     def _parse_json_response(self, response_text: str) -> Optional[Dict[str, Any]]:
         """
@@ -415,7 +503,6 @@ async def test_llama_bridge():
     """
     Тест LlamaBridge
     """
-    from playwright.async_api import async_playwright
     from .utils import load_config, setup_logging
     
     # Загружаем конфиг
@@ -434,13 +521,11 @@ async def test_llama_bridge():
         'location': 'Warszawa'
     }
     
-    # Запускаем Playwright
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=False)  # headful для debug
+    # Запускаем Playwright (headful для debug)
+    async with BrowserManager(dict(config, headless=False)) as browser_manager:
+        bridge = LlamaBridge(config, browser_manager)
         
         try:
-            bridge = LlamaBridge(config, browser)
-            
             # Анализируем
             analysis = await bridge.analyze_ad(test_ad)
             
@@ -450,7 +535,7 @@ async def test_llama_bridge():
             print("="*60)
             
         finally:
-            await browser.close()
+            await bridge.close()
 
 
 if __name__ == '__main__':
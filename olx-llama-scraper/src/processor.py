@@ -10,18 +10,24 @@ Main Processor - Главный процессор OLX Scraper
 
 import asyncio
 import json
-from typing import List, Dict, Any
+import time
+from contextlib import asynccontextmanager
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 from datetime import datetime
 import requests
-from playwright.async_api import async_playwright
 from loguru import logger
 
 from .utils import (
+    RateLimiter,
+    SharedBudget,
     load_config,
     setup_logging,
     load_user_agents
 )
+from .browser import BrowserManager
 from .scraper import OLXScraper
+from .storage import SeenAdIndex
+from .search import ad_key
 from .llm_bridge import LlamaBridge, compute_simple_rating
 
 
@@ -30,16 +36,42 @@ class OLXProcessor:
     Главный процессор - координирует весь pipeline
     """
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], budget: Optional[SharedBudget] = None):
         """
         Args:
             config: Конфигурация из utils.load_config()
+            budget: Общий бюджет запросов (multi-process режим)
         """
         self.config = config
+        self.budget = budget
         self.webhook_url = config['webhook_url']
         self.webhook_timeout = config['webhook_timeout']
         self.webhook_retries = config['webhook_retries']
         
+        # Своё ведро для webhook: доставка не расходует лимит страниц OLX
+        self.webhook_limiter = RateLimiter(
+            calls_per_minute=config.get('webhook_rate_limit', 60),
+            min_delay=0,
+            max_delay=0,
+            burst=config.get('webhook_rate_burst', 5),
+            name='webhook'
+        )
+        
+        # Счётчики за запуск (в multi-process режиме суммируются по воркерам)
+        self.stats = {'queries': 0, 'ads_scraped': 0, 'ads_sent': 0, 'ads_failed': 0}
+        
+        # Конвейер scrape → analyze → deliver: воркеры стадий и размер очередей
+        self.analyze_workers = max(1, config.get('analyze_workers', 1))
+        self.deliver_workers = max(1, config.get('deliver_workers', 2))
+        self.queue_size = max(1, config.get('pipeline_queue_size', 10))
+        self.pipeline_stats = {
+            stage: {'items': 0, 'busy': 0.0, 'max_queue': 0}
+            for stage in ('scrape', 'analyze', 'deliver')
+        }
+        
+        # ad_key доставленных за запуск объявлений: по ним сдвигаются отметки выдач
+        self.delivered = set()
+        
         logger.info("OLXProcessor initialized")
     
     async def process_all_queries(self):
@@ -55,50 +87,57 @@ class OLXProcessor:
         
         logger.info(f"Processing {len(queries)} search queries, max {max_ads} ads each")
         
-        # Запускаем Playwright
-        async with async_playwright() as playwright:
-            # Запускаем браузер
-            browser_type = self.config['browser_type']
-            headless = self.config['headless']
+        async with self.session() as (scraper, llama_bridge):
+            # Сначала выдача всех запросов: общее объявление парсится один раз
+            # и приходит со всеми своими запросами в search_query
+            if scraper.frontier and len(queries) > 1:
+                await self._process_discovered(queries, max_ads, scraper, llama_bridge)
+                queries = []
             
-            if browser_type == 'chromium':
-                browser = await playwright.chromium.launch(headless=headless)
-            elif browser_type == 'firefox':
-                browser = await playwright.firefox.launch(headless=headless)
-            else:
-                browser = await playwright.webkit.launch(headless=headless)
+            # Обрабатываем каждый запрос
+            for query in queries:
+                logger.info(f"\n{'='*60}")
+                logger.info(f"Processing query: '{query}'")
+                logger.info(f"{'='*60}\n")
+                
+                await self._process_single_query(
+                    query,
+                    max_ads,
+                    scraper,
+                    llama_bridge
+                )
+        
+        logger.info(f"Processor stats: {self.stats}")
+        logger.info(f"Pipeline stats: {self.format_pipeline_stats()}")
+        logger.info("\n✅ All queries processed successfully!")
+    
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[Tuple[OLXScraper, LlamaBridge]]:
+        """
+        Запускает браузер и отдаёт (scraper, llama_bridge); на выходе всё закрывает
+        
+        Используется и обычным запуском, и воркерами multi-process режима.
+        """
+        # Один драйвер и один браузер: scraper и Llama получают свои контексты
+        async with BrowserManager(self.config) as browser_manager:
+            # Загружаем User-Agents
+            user_agents = load_user_agents(self.config['user_agents_file'])
+            
+            # Создаём scraper и Llama bridge
+            scraper = OLXScraper(self.config, user_agents, budget=self.budget, browser_manager=browser_manager)
+            llama_bridge = LlamaBridge(self.config, browser_manager)
             
             try:
-                # Загружаем User-Agents
-                user_agents = load_user_agents(self.config['user_agents_file'])
-                
-                # Создаём scraper
-                scraper = OLXScraper(self.config, user_agents)
                 await scraper._init_browser()
-                
-                # Создаём Llama bridge
-                llama_bridge = LlamaBridge(self.config, browser)
-                
-                # Обрабатываем каждый запрос
-                for query in queries:
-                    logger.info(f"\n{'='*60}")
-                    logger.info(f"Processing query: '{query}'")
-                    logger.info(f"{'='*60}\n")
-                    
-                    await self._process_single_query(
-                        query,
-                        max_ads,
-                        scraper,
-                        llama_bridge
-                    )
-                
-                # Закрываем scraper
+                yield scraper, llama_bridge
+            finally:
+                # Закрываем контексты scraper и Llama (браузер закроет менеджер)
                 await scraper._close_browser()
+                await llama_bridge.close()
                 
-            finally:
-                await browser.close()
-        
-        logger.info("\n✅ All queries processed successfully!")
+                logger.info(f"Llama UI timings: {llama_bridge.timings.format_summary()}")
+                logger.info(f"Rate limiter {llama_bridge.rate_limiter.format_summary()}")
+                logger.info(f"Rate limiter {self.webhook_limiter.format_summary()}")
     
     async def _process_single_query(
         self,
@@ -108,7 +147,7 @@ class OLXProcessor:
         llama_bridge: LlamaBridge
     ):
         """
-        Обрабатывает один поисковый запрос
+        Обрабатывает один поисковый запрос конвейером scrape → analyze → deliver
         
         Args:
             query: Поисковый запрос
@@ -116,50 +155,255 @@ class OLXProcessor:
             scraper: OLXScraper instance
             llama_bridge: LlamaBridge instance
         """
+        self.stats['queries'] += 1
+        await self._run_pipeline(
+            query,
+            scraper.iter_search_query(query, max_ads),
+            llama_bridge,
+            seen_index=scraper.seen_index
+        )
+        scraper.save_watermarks(self.delivered)
+    
+    async def _process_discovered(
+        self,
+        queries: List[str],
+        max_ads: int,
+        scraper: OLXScraper,
+        llama_bridge: LlamaBridge
+    ):
+        """
+        Обрабатывает все запросы одним конвейером после общего обхода выдачи
+        
+        Args:
+            queries: Поисковые запросы
+            max_ads: Максимум новых объявлений на запрос
+            scraper: OLXScraper instance (с frontier)
+            llama_bridge: LlamaBridge instance
+        """
+        self.stats['queries'] += len(queries)
+        
+        cards = await scraper.discover_queries(queries, max_ads)
+        await self._run_pipeline(
+            ', '.join(queries),
+            scraper.iter_cards(cards),
+            llama_bridge,
+            seen_index=scraper.seen_index
+        )
+        scraper.save_watermarks(self.delivered)
+    
+    async def _run_pipeline(
+        self,
+        query: str,
+        ads: AsyncIterator[Dict[str, Any]],
+        llama_bridge: LlamaBridge,
+        seen_index: Optional[SeenAdIndex] = None
+    ):
+        """
+        Конвейер scrape → analyze → deliver для потока объявлений
+        
+        Стадии связаны ограниченными очередями (PIPELINE_QUEUE_SIZE): если
+        анализ или доставка не успевают, парсинг ждёт свободного места.
+        Время запроса - примерно время самой медленной стадии, а не сумма.
+        Упавший воркер любой стадии завершает запрос с ошибкой.
+        
+        Args:
+            query: Запрос(ы) для логов
+            ads: Асинхронный генератор объявлений от scraper
+            llama_bridge: LlamaBridge instance
+            seen_index: Индекс инкрементального режима: в него попадают
+                только доставленные объявления
+        """
+        start = time.perf_counter()
+        
+        analyze_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        deliver_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        
+        analyzers = [
+            asyncio.create_task(self._analyze_worker(analyze_queue, deliver_queue, llama_bridge))
+            for _ in range(self.analyze_workers)
+        ]
+        deliverers = [
+            asyncio.create_task(self._deliver_worker(deliver_queue, seen_index))
+            for _ in range(self.deliver_workers)
+        ]
+        
+        async def drain() -> int:
+            scraped = await self._scrape_stage(ads, analyze_queue)
+            
+            # Стоп-сигналы: стадия завершается, когда разобрала свою очередь
+            for _ in analyzers:
+                await analyze_queue.put(None)
+            await asyncio.gather(*analyzers)
+            
+            for _ in deliverers:
+                await deliver_queue.put(None)
+            await asyncio.gather(*deliverers)
+            
+            return scraped
+        
+        feed = asyncio.create_task(drain())
+        tasks = [feed, *analyzers, *deliverers]
+        
         try:
-            # Скрапим объявления
-            ads = await scraper.scrape_search_query(query, max_ads)
+            # Упавший воркер стадии прерывает запрос: иначе предыдущая стадия
+            # вечно ждала бы места в его очереди
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception():
+                    raise task.exception()
+            
+            scraped = feed.result()
             
-            if not ads:
-                logger.warning(f"No ads found for query: '{query}'")
+        except Exception as e:
+            logger.error(f"Error processing query '{query}': {e}")
+            return
+            
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        if not scraped:
+            logger.warning(f"No ads found for query: '{query}'")
+            return
+        
+        logger.info(f"\n✅ Query '{query}' completed: {scraped} ads processed in {time.perf_counter() - start:.1f}s")
+        logger.info(f"Pipeline stats: {self.format_pipeline_stats()}")
+    
+    async def _scrape_stage(self, ads: AsyncIterator[Dict[str, Any]], analyze_queue: asyncio.Queue) -> int:
+        """
+        Стадия scrape: объявления от scraper в очередь анализа
+        
+        Returns:
+            Количество спарсенных объявлений
+        """
+        scraped = 0
+        
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    ad_data = await ads.__anext__()
+                except StopAsyncIteration:
+                    break
+                
+                scraped += 1
+                self.stats['ads_scraped'] += 1
+                self._record_stage('scrape', time.perf_counter() - started)
+                
+                # Полная очередь - парсинг ждёт анализ (backpressure)
+                await analyze_queue.put((scraped, ad_data))
+                self._record_queue('analyze', analyze_queue)
+        finally:
+            await ads.aclose()
+        
+        return scraped
+    
+    async def _analyze_worker(self, analyze_queue: asyncio.Queue, deliver_queue: asyncio.Queue, llama_bridge: LlamaBridge):
+        """
+        Стадия analyze: AI анализ через Llama и сборка payload
+        """
+        while True:
+            item = await analyze_queue.get()
+            if item is None:
                 return
             
-            logger.info(f"Found {len(ads)} ads for query '{query}', starting analysis...")
+            i, ad_data = item
+            logger.info(f"\n--- Processing ad {i} ---")
+            logger.info(f"Title: {ad_data.get('title', 'Unknown')[:50]}...")
             
-            # Обрабатываем каждое объявление
-            for i, ad_data in enumerate(ads, 1):
-                logger.info(f"\n--- Processing ad {i}/{len(ads)} ---")
-                logger.info(f"Title: {ad_data.get('title', 'Unknown')[:50]}...")
+            started = time.perf_counter()
+            
+            try:
+                # AI анализ через Llama
+                ai_analysis = await llama_bridge.analyze_ad(ad_data)
                 
-                try:
-                    # AI анализ через Llama
-                    ai_analysis = await llama_bridge.analyze_ad(ad_data)
-                    
-                    # Вычисляем fallback рейтинг
-                    fallback_score = compute_simple_rating(ad_data)
-                    
-                    # Формируем итоговый payload
-                    payload = self._build_payload(ad_data, ai_analysis, fallback_score)
-                    
-                    # Отправляем на webhook
-                    success = await self._send_to_webhook(payload)
-                    
-                    if success:
-                        logger.info(f"✅ Ad {i} processed and sent successfully")
-                    else:
-                        logger.error(f"❌ Failed to send ad {i} to webhook")
-                    
-                    # Небольшая задержка между объявлениями
-                    await asyncio.sleep(1)
-                    
-                except Exception as e:
-                    logger.error(f"Error processing ad {i}: {e}")
-                    continue
+                # Вычисляем fallback рейтинг
+                fallback_score = compute_simple_rating(ad_data)
+                
+                # Формируем итоговый payload
+                payload = self._build_payload(ad_data, ai_analysis, fallback_score)
+                
+            except Exception as e:
+                self.stats['ads_failed'] += 1
+                logger.error(f"Error processing ad {i}: {e}")
+                continue
             
-            logger.info(f"\n✅ Query '{query}' completed: {len(ads)} ads processed")
+            self._record_stage('analyze', time.perf_counter() - started)
             
-        except Exception as e:
-            logger.error(f"Error processing query '{query}': {e}")
+            await deliver_queue.put((i, ad_data, payload))
+            self._record_queue('deliver', deliver_queue)
+    
+    async def _deliver_worker(self, deliver_queue: asyncio.Queue, seen_index: Optional[SeenAdIndex] = None):
+        """
+        Стадия deliver: отправка payload на webhook
+        
+        Объявление запоминается в seen_index только после успешной
+        отправки: не доставленное следующий запуск обработает заново.
+        """
+        while True:
+            item = await deliver_queue.get()
+            if item is None:
+                return
+            
+            i, ad_data, payload = item
+            started = time.perf_counter()
+            
+            try:
+                success = await self._send_to_webhook(payload)
+                if success and seen_index:
+                    seen_index.remember(ad_data)
+            except Exception as e:
+                success = False
+                logger.error(f"Error delivering ad {i}: {e}")
+            
+            self._record_stage('deliver', time.perf_counter() - started)
+            
+            if success:
+                self.stats['ads_sent'] += 1
+                self.delivered.add(ad_key(ad_data))
+                logger.info(f"✅ Ad {i} processed and sent successfully")
+            else:
+                self.stats['ads_failed'] += 1
+                logger.error(f"❌ Failed to send ad {i} to webhook")
+    
+    def _record_stage(self, stage: str, seconds: float):
+        """
+        Учитывает одно обработанное стадией объявление
+        """
+        stats = self.pipeline_stats[stage]
+        stats['items'] += 1
+        stats['busy'] += seconds
+    
+    def _record_queue(self, stage: str, queue: asyncio.Queue):
+        """
+        Запоминает глубину входной очереди стадии
+        """
+        stats = self.pipeline_stats[stage]
+        stats['max_queue'] = max(stats['max_queue'], queue.qsize())
+    
+    def format_pipeline_stats(self) -> str:
+        """
+        Сводка по стадиям: объявлений, среднее время на объявление,
+        пропускная способность с учётом числа воркеров, максимум очереди
+        """
+        workers = {'scrape': 1, 'analyze': self.analyze_workers, 'deliver': self.deliver_workers}
+        parts = []
+        
+        for stage, stats in self.pipeline_stats.items():
+            if not stats['items']:
+                parts.append(f"{stage}: 0 items")
+                continue
+            
+            per_item = stats['busy'] / stats['items']
+            per_minute = 60.0 / per_item * workers[stage] if per_item else 0.0
+            parts.append(
+                f"{stage}: {stats['items']} items, {per_item:.2f}s/item, "
+                f"~{per_minute:.1f}/min, queue max {stats['max_queue']}/{self.queue_size}"
+            )
+        
+        return '; '.join(parts)
     
     def _build_payload(
         self,
@@ -178,7 +422,18 @@ class OLXProcessor:
         Returns:
             Словарь с полным набором данных
         """
+        change = ad_data.get('change') or {}
+        
+        # Все запросы, в выдаче которых встретилось объявление (всегда список)
+        search_queries = ad_data.get('search_query')
+        if isinstance(search_queries, str):
+            search_queries = [search_queries]
+        
         payload = {
+            # Событие: new / updated / price_changed (для известных объявлений)
+            'event': change.get('event', 'new'),
+            'previous_price': change.get('previous_price'),
+            
             # Основные данные
             'url': ad_data.get('url'),
             'id': ad_data.get('id'),
@@ -187,6 +442,8 @@ class OLXProcessor:
             'currency': ad_data.get('currency'),
             'description': ad_data.get('description'),
             'images': ad_data.get('images', []),
+            'local_images': ad_data.get('local_images', []),
+            'thumbnails': ad_data.get('thumbnails', []),
             'date': ad_data.get('date'),
             'location': ad_data.get('location'),
             
@@ -207,7 +464,8 @@ class OLXProcessor:
             'metadata': {
                 'scraped_at': ad_data.get('scraped_at'),
                 'source': 'olx.pl',
-                'search_query': ad_data.get('search_query'),
+                'search_query': search_queries,
+                'schema_version': ad_data.get('schema_version'),
                 'processor_version': '1.0.0'
             }
         }
@@ -227,9 +485,11 @@ class OLXProcessor:
         for attempt in range(1, self.webhook_retries + 1):
             try:
                 logger.debug(f"Sending to webhook (attempt {attempt}/{self.webhook_retries}): {self.webhook_url}")
+                await self.webhook_limiter.wait()
                 
-                # Отправляем POST запрос
-                response = requests.post(
+                # Отправляем POST запрос (в потоке: requests блокирующий)
+                response = await asyncio.to_thread(
+                    requests.post,
                     self.webhook_url,
                     json=payload,
                     timeout=self.webhook_timeout,
@@ -239,7 +499,10 @@ class OLXProcessor:
                     }
                 )
                 
+                if response.status_code == 429:
+                    self.webhook_limiter.penalize()
                 response.raise_for_status()
+                self.webhook_limiter.reward()
                 
                 logger.info(f"Webhook response: {response.status_code}")
                 logger.debug(f"Response body: {response.text[:200]}")
@@ -251,13 +514,13 @@ class OLXProcessor:
                 
                 if attempt < self.webhook_retries:
                     await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                
+                    
             except requests.exceptions.RequestException as e:
                 logger.error(f"Webhook request error (attempt {attempt}): {e}")
                 
                 if attempt < self.webhook_retries:
                     await asyncio.sleep(2 ** attempt)
-                
+                    
             except Exception as e:
                 logger.error(f"Unexpected webhook error (attempt {attempt}): {e}")
                 break
@@ -325,8 +588,21 @@ async def main():
         logger.info("="*60 + "\n")
         
         # Создаём и запускаем processor
-        processor = OLXProcessor(config)
-        await processor.process_all_queries()
+        if config.get('worker_processes', 1) > 1:
+            # Multi-process режим: запросы распределяются между процессами
+            from .runner import MultiProcessRunner
+            
+            runner = MultiProcessRunner(config)
+            await asyncio.to_thread(runner.run)
+        else:
+            # С общим backend бюджет делится с другими экземплярами scraper
+            budget = None
+            if config.get('rate_limit_backend', 'memory') != 'memory':
+                from .limits import create_budget
+                budget = create_budget(config)
+            
+            processor = OLXProcessor(config, budget=budget)
+            await processor.process_all_queries()
         
         logger.info("\n" + "="*60)
         logger.info("✅ Processing completed successfully!")
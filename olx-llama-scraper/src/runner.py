@@ -0,0 +1,274 @@
+"""
+Runner - Многопроцессный запуск OLXProcessor
+
+Функционал:
+- Распределение поисковых запросов между N процессами (у каждого свой браузер)
+- Общий бюджет запросов для всех процессов (SharedBudget / limits.py)
+- Перезапуск упавших воркеров и повторная выдача их запроса
+- Сбор статистики со всех воркеров
+"""
+
+import asyncio
+import multiprocessing
+import queue
+from collections import deque
+from typing import List, Dict, Any, Optional, Callable
+from loguru import logger
+
+from .limits import create_budget
+from .utils import SharedBudget, setup_logging
+
+
+# ========================================
+# Воркер
+# ========================================
+
+def merge_stats(total: Dict[str, Any], delta: Dict[str, Any]):
+    """
+    Прибавляет числовые счётчики delta к total (на месте)
+    """
+    for key, value in delta.items():
+        if isinstance(value, (int, float)):
+            total[key] = total.get(key, 0) + value
+
+
+def worker_main(worker_id: int, config: Dict[str, Any], tasks, results, budget: Optional[SharedBudget]):
+    """
+    Точка входа процесса-воркера
+    
+    Протокол с родителем:
+    - tasks: родитель кладёт запрос (str) или None для завершения
+    - results: ('done', worker_id, query, stats_delta) после каждого запроса,
+      ('stats', worker_id, None, fetch_stats) перед выходом
+    
+    Args:
+        worker_id: Номер воркера
+        config: Конфигурация из load_config()
+        tasks: multiprocessing.Queue с запросами этого воркера
+        results: Общая multiprocessing.Queue для ответов
+        budget: Общий бюджет запросов
+    """
+    setup_logging(
+        log_level=config['log_level'],
+        log_file=config['log_file'],
+        console=config['log_console']
+    )
+    logger.info(f"Worker {worker_id} started")
+    
+    asyncio.run(_worker_loop(worker_id, config, tasks, results, budget))
+    
+    logger.info(f"Worker {worker_id} finished")
+
+
+async def _worker_loop(worker_id: int, config: Dict[str, Any], tasks, results, budget: Optional[SharedBudget]):
+    """
+    Обрабатывает запросы из tasks в одной сессии браузера
+    """
+    from .processor import OLXProcessor
+    
+    processor = OLXProcessor(config, budget=budget)
+    
+    async with processor.session() as (scraper, llama_bridge):
+        while True:
+            query = await asyncio.to_thread(tasks.get)
+            if query is None:
+                break
+            
+            before = dict(processor.stats)
+            await processor._process_single_query(query, config['max_ads'], scraper, llama_bridge)
+            
+            delta = {key: processor.stats[key] - before[key] for key in processor.stats}
+            results.put(('done', worker_id, query, delta))
+        
+        results.put(('stats', worker_id, None, dict(scraper.fetch_stats)))
+
+
+# ========================================
+# Runner
+# ========================================
+
+class _WorkerHandle:
+    """
+    Процесс воркера, его очередь задач и запрос, который он сейчас обрабатывает
+    """
+    
+    def __init__(self, worker_id: int, process, tasks):
+        self.worker_id = worker_id
+        self.process = process
+        self.tasks = tasks
+        self.query: Optional[str] = None
+
+
+class MultiProcessRunner:
+    """
+    Запускает SEARCH_QUERIES в нескольких процессах
+    
+    Запросы выдаются воркерам по одному, поэтому родитель всегда знает,
+    что обрабатывал упавший воркер: такой запрос возвращается в очередь
+    (не больше worker_max_restarts раз), а вместо воркера запускается новый.
+    """
+    
+    POLL_INTERVAL = 1.0
+    SHUTDOWN_TIMEOUT = 60
+    
+    def __init__(self, config: Dict[str, Any], worker_target: Callable = worker_main):
+        """
+        Args:
+            config: Конфигурация из load_config()
+            worker_target: Функция процесса-воркера (подменяется в тестах)
+        """
+        self.config = config
+        self.worker_target = worker_target
+        self.worker_count = max(1, config.get('worker_processes', 1))
+        self.max_restarts = config.get('worker_max_restarts', 3)
+        
+        # spawn: Playwright и asyncio не переживают fork
+        self.ctx = multiprocessing.get_context('spawn')
+        self.budget = create_budget(config, self.ctx)
+        self.results = self.ctx.Queue()
+        
+        self.workers: Dict[int, _WorkerHandle] = {}
+        self.next_worker_id = 0
+        
+        self.stats: Dict[str, Any] = {}
+        self.fetch_stats: Dict[str, Any] = {}
+        self.failed_queries: List[str] = []
+        self.restarts = 0
+        
+        logger.info(f"MultiProcessRunner initialized: {self.worker_count} workers")
+    
+    def run(self, queries: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Обрабатывает запросы и ждёт завершения всех воркеров
+        
+        Args:
+            queries: Поисковые запросы (по умолчанию search_queries из конфига)
+            
+        Returns:
+            {'stats', 'fetch_stats', 'failed_queries', 'restarts'}
+        """
+        if queries is None:
+            queries = [q.strip() for q in self.config['search_queries'] if q.strip()]
+        
+        pending = deque(queries)
+        attempts: Dict[str, int] = {}
+        
+        for _ in range(min(self.worker_count, len(pending))):
+            self._spawn()
+        
+        try:
+            while pending or any(worker.query for worker in self.workers.values()):
+                # Раздаём запросы свободным воркерам
+                for worker in self.workers.values():
+                    if pending and worker.query is None and worker.process.is_alive():
+                        worker.query = pending.popleft()
+                        worker.tasks.put(worker.query)
+                
+                # Сначала читаем все ответы: воркер мог завершить запрос и сразу упасть
+                if self._receive(timeout=self.POLL_INTERVAL):
+                    while self._receive(timeout=0.1):
+                        pass
+                
+                # Упавшие воркеры: запрос обратно в очередь, воркер пересоздаётся
+                for worker in list(self.workers.values()):
+                    if worker.process.is_alive():
+                        continue
+                    
+                    del self.workers[worker.worker_id]
+                    logger.error(f"Worker {worker.worker_id} died (exit code {worker.process.exitcode})")
+                    
+                    if worker.query:
+                        attempts[worker.query] = attempts.get(worker.query, 0) + 1
+                        
+                        if attempts[worker.query] > self.max_restarts:
+                            logger.error(f"Giving up on query '{worker.query}' after {self.max_restarts} restarts")
+                            self.failed_queries.append(worker.query)
+                        else:
+                            pending.appendleft(worker.query)
+                    
+                    if pending:
+                        self.restarts += 1
+                        self._spawn()
+                        
+        finally:
+            self._shutdown()
+        
+        logger.info(f"Processor stats (all workers): {self.stats}")
+        logger.info(f"Fetch stats (all workers): {self.fetch_stats}")
+        
+        return {
+            'stats': self.stats,
+            'fetch_stats': self.fetch_stats,
+            'failed_queries': self.failed_queries,
+            'restarts': self.restarts
+        }
+    
+    def _spawn(self):
+        """
+        Запускает новый процесс-воркер
+        """
+        worker_id = self.next_worker_id
+        self.next_worker_id += 1
+        
+        tasks = self.ctx.Queue()
+        process = self.ctx.Process(
+            target=self.worker_target,
+            args=(worker_id, self.config, tasks, self.results, self.budget),
+            name=f"olx-worker-{worker_id}"
+        )
+        process.start()
+        
+        self.workers[worker_id] = _WorkerHandle(worker_id, process, tasks)
+        logger.info(f"Worker {worker_id} spawned (pid {process.pid})")
+    
+    def _receive(self, timeout: float) -> bool:
+        """
+        Обрабатывает одно сообщение от воркеров
+        
+        Returns:
+            True если сообщение получено
+        """
+        try:
+            kind, worker_id, query, payload = self.results.get(timeout=timeout)
+        except queue.Empty:
+            return False
+        
+        if kind == 'done':
+            merge_stats(self.stats, payload)
+            
+            worker = self.workers.get(worker_id)
+            if worker and worker.query == query:
+                worker.query = None
+            
+            logger.info(f"Worker {worker_id} completed query '{query}'")
+        elif kind == 'stats':
+            merge_stats(self.fetch_stats, payload)
+        
+        return True
+    
+    def _shutdown(self):
+        """
+        Останавливает воркеров и забирает их итоговую статистику
+        """
+        for worker in self.workers.values():
+            if worker.process.is_alive():
+                worker.tasks.put(None)
+        
+        # Читаем очередь, пока воркеры завершаются: иначе процесс
+        # с недочитанными сообщениями не сможет выйти
+        for worker in self.workers.values():
+            for _ in range(int(self.SHUTDOWN_TIMEOUT / self.POLL_INTERVAL)):
+                if not worker.process.is_alive():
+                    break
+                self._receive(timeout=self.POLL_INTERVAL)
+            
+            if worker.process.is_alive():
+                logger.warning(f"Worker {worker.worker_id} did not stop, terminating")
+                worker.process.terminate()
+            
+            worker.process.join()
+        
+        while self._receive(timeout=0.1):
+            pass
+        
+        self.workers.clear()
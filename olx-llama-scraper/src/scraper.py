@@ -7,26 +7,50 @@ OLX Scraper - Асинхронный парсинг объявлений чер
 - Сбор детальной информации с каждой страницы объявления
 - Скачивание изображений
 - Обнаружение CAPTCHA
+- HTTP fast path (aiohttp + lxml) с fallback на браузер
+- Listing mode: объявления прямо из JSON состояния страницы поиска
+- Инкрементальный режим: пропуск объявлений из прошлых запусков
+- Несколько контекстов браузера со своими UA/прокси (шардирование по URL)
 - Respect robots.txt
 """
 
 import asyncio
 import random
-from typing import List, Dict, Optional, Any
+import time
+from typing import List, Dict, Optional, Any, AsyncIterator, Callable, Set
 from datetime import datetime
-from urllib.parse import urljoin, quote_plus
-from playwright.async_api import async_playwright, Page, Browser, TimeoutError as PlaywrightTimeoutError
+from urllib.parse import urljoin
+from playwright.async_api import Page, Browser, TimeoutError as PlaywrightTimeoutError
 from loguru import logger
 
+from .browser import BrowserManager, BrowserSlot, ImageCapture, ResourcePolicy, pick_slot
+from .detection import PAGE_OK, classify_html, classify_page
+from .frontier import UrlFrontier
+from .search import SearchWatermark, build_search_url, filters_for_query, load_search_filters, normalize_filters
+from .extraction import (
+    AD_FIELDS,
+    EXTRACT_AD_JS,
+    LISTING_LINK_SELECTOR,
+    PRERENDERED_STATE_JS,
+    build_ad_record,
+    build_listing_record,
+    decode_prerendered_state,
+    listings_from_state,
+    missing_fields,
+    parse_ad_html,
+    parse_prerendered_state,
+    parse_search_html
+)
+from .http_fetcher import HttpFetcher
+from .images import ImageDownloader, ImagePostProcessor, thumbnail_path
+from .storage import ImageStore, SeenAdIndex, ad_fingerprint
 from .utils import (
     RateLimiter,
     RobotsParser,
-    download_image,
+    SharedBudget,
+    TimingStats,
     add_to_manual_review,
-    clean_text,
-    parse_price,
     extract_id_from_url,
-    is_captcha_present,
     get_random_user_agent
 )
 
@@ -37,32 +61,156 @@ class OLXScraper:
     """
     
     BASE_URL = "https://www.olx.pl"
-    SEARCH_URL = "https://www.olx.pl/d/oferty/q-{query}/"
     
-    def __init__(self, config: Dict[str, Any], user_agents: List[str]):
+    # Селекторы, появление которых означает готовность страницы
+    SEARCH_READY_SELECTOR = '[data-cy="l-card"]'
+    AD_READY_SELECTOR = '[data-cy="ad_description"]'
+    
+    def __init__(
+        self,
+        config: Dict[str, Any],
+        user_agents: List[str],
+        budget: Optional[SharedBudget] = None,
+        browser_manager: Optional[BrowserManager] = None
+    ):
         """
         Args:
             config: Словарь с настройками из utils.load_config()
             user_agents: Список User-Agent строк
+            budget: Общий бюджет запросов (multi-process режим)
+            browser_manager: Общий браузер процесса (None - scraper запускает свой)
         """
         self.config = config
         self.user_agents = user_agents
+        self.budget = budget
+        self.browser_manager = browser_manager
+        self.owns_browser = False
         
-        # Rate limiter
-        self.rate_limiter = RateLimiter(
-            calls_per_minute=config['rate_limit'],
-            min_delay=config['min_delay'],
-            max_delay=config['max_delay']
-        )
+        # Слоты браузера: у каждого свой контекст, UA, прокси и rate limiter.
+        # RATE_LIMIT действует на каждый слот отдельно
+        self.slots = self._create_slots(max(1, config.get('browser_contexts', 1)))
+        
+        # Количество одновременно открытых страниц объявлений
+        self.ad_concurrency = max(1, config.get('ad_concurrency', 1))
+        
+        # Сколько страниц выдачи загружать заранее (0 - без read-ahead)
+        self.search_prefetch_depth = max(0, config.get('search_prefetch_depth', 1))
+        
+        # Ожидание готовности страниц + телеметрия реального времени ожидания
+        self.ready_timeout = config.get('ready_timeout', 10000)
+        self.timings = TimingStats()
         
         # Robots.txt parser
         self.robots = None
         if config['respect_robots']:
-            self.robots = RobotsParser(config['robots_url'])
+            self.robots = RobotsParser(
+                config['robots_url'],
+                cache_path=config.get('robots_cache_path'),
+                cache_ttl=config.get('robots_cache_ttl', 86400),
+                retry_delay=config.get('robots_retry_delay', 300)
+            )
         
         # Playwright объекты (инициализируются позже)
         self.browser: Optional[Browser] = None
-        self.context = None
+        
+        # Блокировка картинок/шрифтов/трекеров (статистика за весь запуск)
+        self.resource_policy: Optional[ResourcePolicy] = None
+        if config.get('block_resources'):
+            self.resource_policy = ResourcePolicy(
+                blocked_types=config.get('block_resource_types'),
+                blocked_domains=config.get('block_domains'),
+                allowed_domains=config.get('allow_domains')
+            )
+        
+        # HTTP fast path: страницы сначала грузятся без браузера
+        # (свой HttpFetcher у каждого слота)
+        self.use_http = config.get('fetch_engine', 'browser') == 'http'
+        self.required_fields = config.get('fast_path_required_fields', ['title', 'description'])
+        self.fetch_stats = {
+            'http': 0, 'browser': 0, 'escalated': 0, 'listing': 0, 'skipped_known': 0, 'changed_known': 0,
+            'captcha': 0, 'block': 0, 'duplicate': 0, 'watermark_stop': 0
+        }
+        
+        # Listing mode: страница объявления открывается только если
+        # в карточке выдачи не хватает обязательных полей
+        self.listing_only = config.get('scrape_mode', 'full') == 'listing'
+        self.listing_required_fields = config.get('listing_required_fields', ['title', 'price', 'description'])
+        
+        # Скачивание изображений: общий пул соединений на все объявления,
+        # хранилище с дедупликацией по содержимому, WebP/миниатюры в пуле процессов
+        self.image_store: Optional[ImageStore] = None
+        self.image_postprocessor: Optional[ImagePostProcessor] = None
+        self.image_downloader: Optional[ImageDownloader] = None
+        if config.get('download_images'):
+            if config.get('image_postprocess'):
+                self.image_postprocessor = ImagePostProcessor(
+                    workers=config.get('image_workers', 2),
+                    webp_quality=config.get('image_webp_quality', 80),
+                    thumb_size=config.get('image_thumb_size', 320)
+                )
+            
+            if config.get('image_store', True):
+                self.image_store = ImageStore(
+                    config['images_dir'],
+                    config.get('image_index_path', './data/image_index.sqlite3'),
+                    phash_distance=config.get('image_phash_distance', 5)
+                )
+            
+            self.image_downloader = ImageDownloader(
+                save_dir=config['images_dir'],
+                max_size_mb=config.get('image_max_size_mb', 10),
+                concurrency=config.get('image_concurrency', 4),
+                connections_per_host=config.get('image_connections_per_host', 4),
+                user_agent=self.slots[0].user_agent,
+                proxy=self.slots[0].proxy,
+                store=self.image_store,
+                phash=config.get('image_phash', False),
+                postprocessor=self.image_postprocessor,
+                # Отдельное ведро CDN: картинки не расходуют лимит страниц OLX
+                rate_limiter=RateLimiter(
+                    calls_per_minute=config.get('image_rate_limit', 120),
+                    min_delay=0,
+                    max_delay=0,
+                    burst=config.get('image_rate_burst', 10),
+                    name='images'
+                )
+            )
+        
+        # Перехват картинок галереи из сетевых ответов браузера
+        self.image_capture_hosts: List[str] = []
+        if self.image_downloader and config.get('image_capture'):
+            self.image_capture_hosts = config.get('image_capture_hosts') or ['olxcdn.com']
+        
+        # Инкрементальный режим: индекс объявлений из прошлых запусков.
+        # Выдача идёт от новых к старым, поэтому после known_streak_stop
+        # известных объявлений подряд дальше листать не нужно
+        self.seen_index: Optional[SeenAdIndex] = None
+        if config.get('incremental'):
+            self.seen_index = SeenAdIndex(config['seen_index_path'])
+        self.known_streak_stop = config.get('known_streak_stop', 20)
+        
+        # Фильтры поиска: SEARCH_SORT, затем "*" и свои фильтры запроса из SEARCH_FILTERS_FILE
+        self.search_defaults = normalize_filters({'sort': config.get('search_sort', 'relevance')}, 'SEARCH_SORT')
+        self.search_filters = load_search_filters(config.get('search_filters_file'))
+        
+        # Отметка времени самого нового объявления выдачи хранится в индексе:
+        # следующий запуск листает выдачу (sort=newest) только до неё
+        self.use_watermark = bool(config.get('search_watermark')) and self.seen_index is not None
+        if config.get('search_watermark') and not self.seen_index:
+            logger.warning("SEARCH_WATERMARK requires INCREMENTAL=true, watermark disabled")
+        
+        # Отметки пройденных выдач: сдвигаются после доставки (save_watermarks)
+        self.pending_watermarks: List[SearchWatermark] = []
+        
+        # Frontier запуска: объявление из выдачи нескольких запросов
+        # парсится один раз и помечается всеми этими запросами
+        self.frontier: Optional[UrlFrontier] = None
+        if config.get('frontier', True):
+            self.frontier = UrlFrontier(
+                expected_items=max(1, len(config.get('search_queries') or [])) * config.get('max_ads', 10),
+                bloom_threshold=config.get('frontier_bloom_threshold', 100000),
+                false_positive_rate=config.get('frontier_false_positive_rate', 0.001)
+            )
         
         logger.info("OLXScraper initialized")
     
@@ -81,56 +229,111 @@ class OLXScraper:
     
     async def _init_browser(self):
         """
-        Инициализирует Playwright браузер
+        Открывает контексты слотов в браузере BrowserManager
         """
-        logger.info("Launching Playwright browser...")
+        # Без внешнего менеджера scraper сам запускает и закрывает браузер
+        if self.browser_manager is None:
+            self.browser_manager = BrowserManager(self.config)
+            self.owns_browser = True
         
-        playwright = await async_playwright().start()
+        self.browser = await self.browser_manager.start()
         
-        # Выбор браузера
-        browser_type = self.config['browser_type']
-        headless = self.config['headless']
+        context_options = {
+            'viewport': {'width': 1920, 'height': 1080},
+            'locale': 'pl-PL',
+            'timezone_id': 'Europe/Warsaw'
+        }
         
-        if browser_type == 'chromium':
-            browser_launcher = playwright.chromium
-        elif browser_type == 'firefox':
-            browser_launcher = playwright.firefox
+        for slot in self.slots:
+            # Пул вкладок: по умолчанию по одной на каждое параллельное
+            # объявление плюс одна под страницу поиска
+            await slot.open(
+                self.browser_manager,
+                context_options,
+                resource_policy=self.resource_policy,
+                pool_size=self.config.get('page_pool_size') or self.ad_concurrency + 1,
+                max_uses=self.config.get('page_max_uses', 50)
+            )
+            
+            if self.use_http:
+                slot.http_fetcher = HttpFetcher(
+                    user_agent=slot.user_agent,
+                    proxy=slot.proxy,
+                    timeout=self.config['page_timeout'] / 1000,
+                    max_connections=self.ad_concurrency + 1
+                )
+        
+        logger.info(f"Browser slots opened: {len(self.slots)}")
+    
+    def _create_slots(self, count: int) -> List[BrowserSlot]:
+        """
+        Создаёт слоты браузера (контексты открываются в _init_browser)
+        
+        User-Agent: разные для каждого слота при rotate_ua, иначе один на все.
+        Прокси: по кругу из proxy_list, иначе общий proxy.
+        
+        Args:
+            count: Количество слотов
+            
+        Returns:
+            Список BrowserSlot
+        """
+        if self.config.get('rotate_ua', True):
+            agents = random.sample(self.user_agents, min(count, len(self.user_agents)))
         else:
-            browser_launcher = playwright.webkit
-        
-        # Запуск браузера
-        self.browser = await browser_launcher.launch(
-            headless=headless,
-            args=[
-                '--no-sandbox',
-                '--disable-setuid-sandbox',
-                '--disable-dev-shm-usage',
-                '--disable-blink-features=AutomationControlled'
-            ]
-        )
+            agents = [get_random_user_agent(self.user_agents)]
         
-        # Создаём контекст с User-Agent
-        user_agent = get_random_user_agent(self.user_agents)
+        proxies = self.config.get('proxy_list') or [self.config.get('proxy')]
         
-        self.context = await self.browser.new_context(
-            user_agent=user_agent,
-            viewport={'width': 1920, 'height': 1080},
-            locale='pl-PL',
-            timezone_id='Europe/Warsaw',
-            proxy={'server': self.config['proxy']} if self.config.get('proxy') else None
-        )
+        slots = []
+        for index in range(count):
+            rate_limiter = RateLimiter(
+                calls_per_minute=self.config['rate_limit'],
+                min_delay=self.config['min_delay'],
+                max_delay=self.config['max_delay'],
+                budget=self.budget,
+                burst=self.config.get('rate_burst', 1),
+                name=f"olx-{index}",
+                cooldown=self.config.get('captcha_cooldown', 60)
+            )
+            slots.append(BrowserSlot(
+                index,
+                user_agent=agents[index % len(agents)],
+                proxy=proxies[index % len(proxies)],
+                rate_limiter=rate_limiter
+            ))
         
-        logger.info(f"Browser launched: {browser_type}, headless={headless}, user_agent={user_agent[:50]}...")
+        return slots
     
     async def _close_browser(self):
         """
         Закрывает браузер
         """
-        if self.context:
-            await self.context.close()
-        if self.browser:
-            await self.browser.close()
-        logger.info("Browser closed")
+        if self.seen_index:
+            self.seen_index.close()
+        if self.image_downloader:
+            await self.image_downloader.close()
+            logger.info(f"Image stats: {self.image_downloader.stats}")
+            logger.info(f"Rate limiter {self.image_downloader.rate_limiter.format_summary()}")
+        if self.image_postprocessor:
+            self.image_postprocessor.close()
+        if self.image_store:
+            self.image_store.close()
+            logger.info(f"Image store: {self.image_store.stats}")
+        logger.info(f"Fetch stats: {self.fetch_stats}")
+        for slot in self.slots:
+            await slot.close()
+        if self.owns_browser:
+            await self.browser_manager.close()
+            self.browser_manager = None
+            self.owns_browser = False
+        self.browser = None
+        if self.resource_policy:
+            logger.info(f"Resource policy: {self.resource_policy.summary()}")
+        logger.info(f"Page-ready timings: {self.timings.format_summary()}")
+        for slot in self.slots:
+            logger.info(f"Rate limiter {slot.rate_limiter.format_summary()}")
+        logger.info("Browser slots closed")
     
     async def scrape_search_query(self, query: str, max_ads: int = 10) -> List[Dict[str, Any]]:
         """
@@ -143,143 +346,600 @@ class OLXScraper:
         Returns:
             Список словарей с данными объявлений
         """
+        return [ad_data async for ad_data in self.iter_search_query(query, max_ads)]
+    
+    async def iter_search_query(self, query: str, max_ads: int = 10) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Выполняет поиск по запросу и отдаёт объявления по мере готовности
+        
+        Объявления приходят в порядке выдачи, каждое - как только спарсены
+        оно и все предыдущие; остальные объявления пачки тем временем
+        продолжают загружаться. aclose() (или отмена) прерывает незавершённые
+        загрузки объявлений и страниц выдачи.
+        
+        С frontier объявления, уже взятые в работу предыдущими запросами
+        запуска, пропускаются и не считаются в max_ads.
+        
+        Args:
+            query: Поисковый запрос
+            max_ads: Максимум объявлений для сбора
+            
+        Yields:
+            Словари с данными объявлений
+        """
         logger.info(f"Starting scrape for query: '{query}', max_ads: {max_ads}")
         
-        results = []
-        page_num = 1
+        scraped = 0
+        pages = self._iter_search_pages(query, lambda: max_ads - scraped)
         
-        while len(results) < max_ads:
-            # Формируем URL поиска
-            search_url = self._build_search_url(query, page_num)
+        try:
+            async for listings in pages:
+                # Собираем детальную информацию для каждого объявления.
+                # Берём ровно столько карточек, сколько не хватает до max_ads,
+                # и добираем из остатка страницы если часть объявлений не спарсилась
+                while listings and scraped < max_ads:
+                    remaining = max_ads - scraped
+                    batch = listings[:remaining]
+                    del listings[:remaining]
+                    
+                    # Объявления, уже взятые в работу другими запросами, не парсим повторно
+                    if self.frontier:
+                        batch = self._admit(batch, query)
+                    
+                    ads = self._iter_ads_batch(batch, query)
+                    try:
+                        async for ad_data in ads:
+                            scraped += 1
+                            logger.info(f"Scraped ad {scraped}/{max_ads}: {ad_data['title'][:50]}...")
+                            
+                            yield ad_data
+                    finally:
+                        # Потребитель остановился - отменяем загрузки остатка пачки
+                        await ads.aclose()
+                        
+        except Exception as e:
+            logger.error(f"Error scraping query '{query}': {e}")
             
-            # Проверяем robots.txt
-            if self.robots and not self.robots.can_fetch(search_url):
-                logger.warning(f"robots.txt disallows: {search_url}")
-                break
+        finally:
+            await pages.aclose()
+        
+        logger.info(f"Scraping complete for '{query}': {scraped} ads collected")
+    
+    async def discover_queries(self, queries: List[str], max_ads: int = 10) -> List[Dict[str, Any]]:
+        """
+        Обходит выдачу всех запросов до парсинга объявлений
+        
+        Каждый запрос набирает до max_ads объявлений, ещё не взятых в работу
+        предыдущими запросами; общие объявления получают в card['queries']
+        все запросы, в выдаче которых встретились. Карточки парсятся
+        через iter_cards. Требует frontier.
+        
+        Args:
+            queries: Поисковые запросы
+            max_ads: Максимум новых объявлений на запрос
             
-            # Rate limiting
-            await self.rate_limiter.wait()
+        Returns:
+            Карточки в порядке запросов и выдачи
+        """
+        cards = []
+        
+        for query in queries:
+            cards.extend(await self._discover_query(query, max_ads))
+        
+        logger.info(
+            f"Discovered {len(cards)} unique ads for {len(queries)} queries "
+            f"({self.frontier.stats['duplicates']} duplicates merged)"
+        )
+        
+        return cards
+    
+    async def _discover_query(self, query: str, max_ads: int) -> List[Dict[str, Any]]:
+        """
+        Листает выдачу одного запроса и ставит карточки в frontier
+        
+        Returns:
+            Новые для запуска карточки (не больше max_ads)
+        """
+        admitted: List[Dict[str, Any]] = []
+        pages = self._iter_search_pages(query, lambda: max_ads - len(admitted))
+        
+        try:
+            async for listings in pages:
+                # В frontier ставим только то, что влезает в max_ads:
+                # лишние карточки должны остаться доступны следующим запросам
+                while listings and len(admitted) < max_ads:
+                    remaining = max_ads - len(admitted)
+                    batch = listings[:remaining]
+                    del listings[:remaining]
+                    admitted.extend(self._admit(batch, query))
+        finally:
+            await pages.aclose()
+        
+        logger.info(f"Discovery complete for '{query}': {len(admitted)} new ads")
+        
+        return admitted
+    
+    async def iter_cards(self, cards: List[Dict[str, Any]]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Парсит карточки из discover_queries и отдаёт объявления по мере готовности
+        
+        Args:
+            cards: Карточки с card['queries']
             
-            # Получаем список объявлений на странице
-            logger.info(f"Fetching search page {page_num}: {search_url}")
+        Yields:
+            Словари с данными объявлений (search_query - список запросов)
+        """
+        scraped = 0
+        ads = self._iter_ads_batch(cards, None)
+        
+        try:
+            async for ad_data in ads:
+                scraped += 1
+                logger.info(f"Scraped ad {scraped}/{len(cards)}: {ad_data['title'][:50]}...")
+                
+                yield ad_data
+        finally:
+            await ads.aclose()
+        
+        logger.info(f"Scraping complete: {scraped} of {len(cards)} discovered ads collected")
+    
+    async def _iter_search_pages(self, query: str, wanted: Callable[[], int]) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Листает выдачу запроса и отдаёт карточки, которые нужно парсить
+        
+        Read-ahead: пока потребитель парсит карточки страницы, следующие
+        страницы выдачи грузятся в фоне. Объявления не новее прошлого
+        запуска (SEARCH_WATERMARK) и известные (INCREMENTAL) отбрасываются
+        здесь же, по ним же останавливается листание.
+        
+        Потребитель забирает карточки из отданного списка, удаляя их с
+        начала; оставшиеся в списке считаются необработанными. Отметка
+        выдачи попадает в pending_watermarks и сдвигается только после
+        доставки объявлений (save_watermarks).
+        
+        Args:
+            query: Поисковый запрос
+            wanted: Сколько объявлений ещё нужно потребителю (<= 0 - хватит)
             
-            try:
-                listings = await self._scrape_search_page(search_url)
+        Yields:
+            Карточки очередной страницы
+        """
+        page_num = 1
+        known_streak = 0
+        
+        prefetched: Dict[int, asyncio.Task] = {}
+        
+        watermark = self._open_watermark(query)
+        listings: List[Dict[str, Any]] = []
+        reached_end = False
+        
+        try:
+            page_cards = await self._fetch_search_page(query, page_num)
+            
+            while page_cards and wanted() > 0:
+                listings = list(page_cards)
+                reached_known = False
                 
-                if not listings:
-                    logger.info(f"No more listings found on page {page_num}")
+                # Объявления не новее прошлого запуска не открываем и дальше не листаем
+                if watermark:
+                    listings = watermark.cut(listings)
+                
+                # Инкрементальный режим: известные объявления не открываем
+                if self.seen_index:
+                    listings, known_streak, reached_known = self._skip_known(listings, known_streak)
+                
+                reached_end = reached_known or bool(watermark and watermark.reached)
+                
+                # Если текущей страницы может не хватить - запрашиваем следующие заранее
+                if not reached_end and len(listings) < wanted():
+                    for ahead in range(page_num + 1, page_num + 1 + self.search_prefetch_depth):
+                        if ahead not in prefetched:
+                            prefetched[ahead] = asyncio.create_task(self._fetch_search_page(query, ahead))
+                
+                page = list(listings)
+                try:
+                    yield listings
+                finally:
+                    if watermark:
+                        watermark.take(page[:len(page) - len(listings)])
+                
+                if wanted() <= 0:
                     break
                 
-                logger.info(f"Found {len(listings)} listings on page {page_num}")
+                if reached_known:
+                    logger.info(f"{known_streak} already known ads in a row, stopping pagination")
+                    break
                 
-                # Собираем детальную информацию для каждого объявления
-                for listing_url in listings:
-                    if len(results) >= max_ads:
-                        break
-                    
-                    # Rate limiting
-                    await self.rate_limiter.wait()
-                    
-                    # Парсим страницу объявления
-                    ad_data = await self._scrape_ad_page(listing_url, query)
-                    
-                    if ad_data:
-                        results.append(ad_data)
-                        logger.info(f"Scraped ad {len(results)}/{max_ads}: {ad_data['title'][:50]}...")
+                if reached_end:
+                    self._log_watermark_stop(watermark)
+                    break
                 
                 page_num += 1
                 
-            except Exception as e:
-                logger.error(f"Error scraping page {page_num}: {e}")
-                break
+                if page_num in prefetched:
+                    page_cards = await prefetched.pop(page_num)
+                else:
+                    page_cards = await self._fetch_search_page(query, page_num)
+            
+            # Всё новее прошлой отметки взято в работу
+            if watermark:
+                watermark.complete = not page_cards or (reached_end and not listings)
+                
+        except Exception as e:
+            logger.error(f"Error scraping page {page_num}: {e}")
+            
+        finally:
+            # Ранняя остановка: незавершённые prefetch-запросы больше не нужны
+            for task in prefetched.values():
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled() and task.exception():
+                    logger.debug(f"Discarded prefetched page failed: {task.exception()}")
+    
+    def _open_watermark(self, query: str) -> Optional[SearchWatermark]:
+        """
+        Отметка прошлого запуска для выдачи запроса
+        
+        Returns:
+            SearchWatermark или None (SEARCH_WATERMARK выключен или выдача не sort=newest)
+        """
+        if not self.use_watermark or self._filters_for(query).get('sort') != 'newest':
+            return None
+        
+        key = self._build_search_url(query)
+        watermark = SearchWatermark(key, self.seen_index.get_watermark(key))
+        self.pending_watermarks.append(watermark)
         
-        logger.info(f"Scraping complete for '{query}': {len(results)} ads collected")
-        return results
+        return watermark
     
-    def _build_search_url(self, query: str, page: int = 1) -> str:
+    def save_watermarks(self, delivered: Set[str]):
         """
-        Строит URL для поиска
+        Сдвигает отметки пройденных выдач по доставленным объявлениям
+        
+        Вызывается, когда конвейер разобрал все объявления этих выдач
+        (см. SearchWatermark.settle).
         
         Args:
-            query: Поисковый запрос
-            page: Номер страницы
+            delivered: ad_key доставленных за запуск объявлений
+        """
+        for watermark in self.pending_watermarks:
+            newest = watermark.settle(delivered)
+            
+            if newest:
+                self.seen_index.set_watermark(watermark.key, newest.isoformat())
+            elif watermark.taken:
+                logger.info(f"Undelivered ads or search not covered to the last mark, keeping watermark: {watermark.key}")
+        
+        self.pending_watermarks.clear()
+    
+    def _log_watermark_stop(self, watermark: SearchWatermark):
+        self.fetch_stats['watermark_stop'] += 1
+        logger.info(f"Reached ads not newer than {watermark.previous.isoformat()}, stopping pagination")
+    
+    def _admit(self, cards: List[Dict[str, Any]], query: str) -> List[Dict[str, Any]]:
+        """
+        Оставляет карточки, которые за этот запуск встретились впервые
+        
+        Повторы помечаются запросом query (см. UrlFrontier.admit).
+        """
+        fresh = [card for card in cards if self.frontier.admit(card, query)]
+        
+        duplicates = len(cards) - len(fresh)
+        if duplicates:
+            self.fetch_stats['duplicate'] += duplicates
+            logger.info(f"Skipping {duplicates} ads already taken by other queries")
+        
+        return fresh
+    
+    def _skip_known(self, cards: List[Dict[str, Any]], known_streak: int):
+        """
+        Убирает из карточек объявления, уже собранные в прошлых запусках
+        
+        Известные объявления, у которых по карточке видно изменение
+        (цена, заголовок, фото, last_refresh), остаются в выдаче с пометкой
+        card['change'] и не считаются в known_streak.
+        
+        Args:
+            cards: Карточки страницы выдачи
+            known_streak: Сколько известных объявлений подряд встретилось до этой страницы
             
         Returns:
-            URL строка
+            (новые и изменённые карточки, обновлённый known_streak, достигнут ли known_streak_stop)
         """
-        encoded_query = quote_plus(query)
-        url = self.SEARCH_URL.format(query=encoded_query)
+        fresh = []
+        known_ids = []
+        reached = False
+        
+        for card in cards:
+            change = self.seen_index.detect_change(card)
+            if change:
+                card['change'] = change
+                fresh.append(card)
+                known_streak = 0
+                self.fetch_stats['changed_known'] += 1
+                logger.info(f"Known ad changed ({change['event']}): {card['url']}")
+            elif self.seen_index.is_known(card.get('id')):
+                known_ids.append(card['id'])
+                known_streak += 1
+                
+                if self.known_streak_stop and known_streak >= self.known_streak_stop:
+                    reached = True
+                    break
+            else:
+                fresh.append(card)
+                known_streak = 0
+        
+        self.seen_index.touch(known_ids)
+        self.fetch_stats['skipped_known'] += len(known_ids)
         
-        if page > 1:
-            url += f"?page={page}"
+        if known_ids:
+            logger.info(f"Skipping {len(known_ids)} already known ads")
         
-        return url
+        return fresh, known_streak, reached
     
-    async def _scrape_search_page(self, url: str) -> List[str]:
+    async def _fetch_search_page(self, query: str, page_num: int) -> List[Dict[str, Any]]:
         """
-        Парсит страницу поиска и возвращает URL объявлений
+        Загружает одну страницу выдачи с учётом robots.txt и rate limit
         
         Args:
-            url: URL страницы поиска
+            query: Поисковый запрос
+            page_num: Номер страницы
             
         Returns:
-            Список URL объявлений
+            Карточки объявлений; пустой список - листать дальше нельзя/нечего
         """
-        page = await self.context.new_page()
+        # Формируем URL поиска
+        search_url = self._build_search_url(query, page_num)
         
-        try:
-            # Переход на страницу
-            await page.goto(url, timeout=self.config['page_timeout'], wait_until='domcontentloaded')
+        # Проверяем robots.txt
+        if self.robots and not await self.robots.can_fetch(search_url):
+            logger.warning(f"robots.txt disallows: {search_url}")
+            return []
+        
+        # Rate limiting
+        await pick_slot(self.slots, search_url).rate_limiter.wait()
+        
+        # Получаем список объявлений на странице
+        logger.info(f"Fetching search page {page_num}: {search_url}")
+        
+        listings = await self._scrape_search_page(search_url)
+        
+        if listings:
+            logger.info(f"Found {len(listings)} listings on page {page_num}")
+        else:
+            logger.info(f"No more listings found on page {page_num}")
+        
+        return listings
+    
+    async def _scrape_ads_batch(self, cards: List[Dict[str, Any]], search_query: str) -> List[Dict[str, Any]]:
+        """
+        Парсит пачку объявлений целиком (см. _iter_ads_batch)
+        
+        Returns:
+            Успешно спарсенные объявления в том же порядке, что и cards
+        """
+        return [ad_data async for ad_data in self._iter_ads_batch(cards, search_query)]
+    
+    async def _iter_ads_batch(self, cards: List[Dict[str, Any]], search_query: Optional[str]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Парсит пачку объявлений, держа не более ad_concurrency страниц одновременно
+        
+        Каждая страница перед загрузкой ждёт RateLimiter своего слота, поэтому
+        параллелизм не увеличивает частоту запросов сверх лимита.
+        
+        Args:
+            cards: Карточки выдачи от _scrape_search_page
+            search_query: Поисковый запрос (для метаданных; карточки из frontier
+                берут список запросов из card['queries'])
+                
+        Yields:
+            Успешно спарсенные объявления в том же порядке, что и cards
+        """
+        semaphore = asyncio.Semaphore(self.ad_concurrency)
+        
+        async def fetch(card: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+            # Listing mode: запись из карточки, без визита на страницу
+            if self.listing_only and card.get('listing'):
+                ad_data = await self._build_from_listing(card, search_query)
+                if ad_data:
+                    return ad_data
+            
+            # Rate limiting
+            await pick_slot(self.slots, card['url']).rate_limiter.wait()
             
-            # Небольшая задержка для загрузки JS
-            await page.wait_for_timeout(2000)
+            # Парсим страницу объявления
+            return await self._scrape_ad_page(card['url'], search_query)
+        
+        async def worker(card: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+            async with semaphore:
+                ad_data = await fetch(card)
             
-            # Проверка на CAPTCHA
-            content = await page.content()
-            if is_captcha_present(content):
-                logger.warning(f"CAPTCHA detected on search page: {url}")
+            if ad_data:
+                # last_refresh есть только в карточке - нужен индексу для
+                # определения изменений в следующих запусках
+                if not ad_data.get('last_refresh') and card.get('listing'):
+                    ad_data['last_refresh'] = card['listing'].get('last_refresh')
                 
-                # Скриншот
-                screenshot_path = await self._save_captcha_screenshot(page, url)
+                # Отпечаток берём с карточки, по которой объявление попало в
+                # выдачу: detect_change сравнивает именно карточки, а число фото
+                # в галерее страницы (lazy-load, дубли слайдов) может отличаться
+                if card.get('listing'):
+                    ad_data['listing_fingerprint'] = ad_fingerprint(card['listing'])
                 
-                # Добавляем в очередь ручной проверки
-                add_to_manual_review(url, "CAPTCHA on search page", screenshot_path)
+                if card.get('change'):
+                    ad_data['change'] = card['change']
                 
-                return []
-            
-            # Ищем все ссылки на объявления
-            # OLX использует data-cy="l-card" для карточек объявлений
-            listings = await page.locator('[data-cy="l-card"] a[href*="/d/oferty/"]').all()
-            
-            # Извлекаем URL
-            urls = []
-            for listing in listings:
-                href = await listing.get_attribute('href')
-                if href:
-                    full_url = urljoin(self.BASE_URL, href)
-                    urls.append(full_url)
-            
-            # Удаляем дубликаты
-            urls = list(dict.fromkeys(urls))
+                if card.get('queries'):
+                    ad_data['search_query'] = list(card['queries'])
             
-            logger.debug(f"Found {len(urls)} unique listing URLs on page")
-            
-            return urls
-            
-        except PlaywrightTimeoutError:
-            logger.error(f"Timeout loading search page: {url}")
-            return []
+            return ad_data
+        
+        tasks = [asyncio.ensure_future(worker(card)) for card in cards]
+        
+        try:
+            for card, task in zip(cards, tasks):
+                ad_data = None
+                try:
+                    ad_data = await task
+                except Exception as e:
+                    logger.error(f"Error scraping ad {card['url']}: {e}")
+                    continue
+                finally:
+                    # Объявление обработано - новые запросы его больше не пометят;
+                    # не спарсилось - другие запросы запуска могут взять его снова
+                    if self.frontier and task.done():
+                        self.frontier.release(card, failed=not ad_data)
+                
+                if ad_data:
+                    yield ad_data
+                    
+        finally:
+            # Ранняя остановка: дожидаемся отмены, чтобы вкладки вернулись в пул
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _build_from_listing(self, card: Dict[str, Any], search_query: str) -> Optional[Dict[str, Any]]:
+        """
+        Собирает объявление из данных карточки выдачи
+        
+        Returns:
+            Запись объявления или None, если нужен визит на страницу
+        """
+        ad_data = build_listing_record(card['listing'], card['url'], search_query)
+        
+        missing = missing_fields(ad_data, self.listing_required_fields)
+        if missing:
+            logger.debug(f"Listing card missing {missing}, visiting ad page: {card['url']}")
+            return None
+        
+        await self._download_ad_images(ad_data)
+        self.fetch_stats['listing'] += 1
+        
+        return ad_data
+    
+    def _build_cards(self, urls: List[str], state: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Объединяет ссылки из DOM с данными карточек из JSON состояния
+        
+        Args:
+            urls: URL объявлений в порядке выдачи
+            state: __PRERENDERED_STATE__ страницы (если есть)
             
-        except Exception as e:
-            logger.error(f"Error scraping search page {url}: {e}")
+        Returns:
+            Список карточек {'url', 'id', 'listing'}; listing = None если в состоянии нет данных
+        """
+        listings = listings_from_state(state) if state else {}
+        
+        # Карточки отрисованы на клиенте - берём порядок из состояния
+        if not urls:
+            urls = [listing['url'] for listing in listings.values()]
+        
+        cards = []
+        for url in urls:
+            ad_id = extract_id_from_url(url)
+            cards.append({'url': url, 'id': ad_id, 'listing': listings.get(ad_id)})
+        
+        return cards
+    
+    def _build_search_url(self, query: str, page: int = 1) -> str:
+        """
+        Строит URL для поиска с фильтрами запроса
+        
+        Args:
+            query: Поисковый запрос
+            page: Номер страницы
             
-            if self.config['screenshot_on_error']:
-                await self._save_error_screenshot(page, url)
+        Returns:
+            URL строка
+        """
+        return build_search_url(self.BASE_URL, query, page, self._filters_for(query))
+    
+    def _filters_for(self, query: str) -> Dict[str, Any]:
+        """
+        Фильтры поиска запроса (см. search.filters_for_query)
+        """
+        return filters_for_query(self.search_filters, query, self.search_defaults)
+    
+    async def _scrape_search_page(self, url: str) -> List[Dict[str, Any]]:
+        """
+        Парсит страницу поиска и возвращает карточки объявлений
+        
+        Args:
+            url: URL страницы поиска
             
-            return []
+        Returns:
+            Список карточек {'url', 'id', 'listing'} (см. _build_cards)
+        """
+        slot = pick_slot(self.slots, url)
+        
+        if self.use_http:
+            cards = await self._scrape_search_page_http(url)
+            if cards:
+                return cards
             
-        finally:
-            await page.close()
+            # Fast path не дал результата - повторяем в браузере
+            self.fetch_stats['escalated'] += 1
+            logger.info(f"HTTP fast path gave no listings, retrying in browser: {url}")
+            await slot.rate_limiter.wait()
+        
+        self.fetch_stats['browser'] += 1
+        
+        async with slot.page_pool.page() as page:
+            try:
+                # Переход на страницу
+                response = await page.goto(url, timeout=self.config['page_timeout'], wait_until='domcontentloaded')
+                
+                # Ждём появления карточек объявлений
+                ready = await self._wait_ready(page, self.SEARCH_READY_SELECTOR, 'search_ready')
+                
+                # Проверка на CAPTCHA / блокировку
+                verdict = await self._classify_page(page, response, ready, slot)
+                if verdict != PAGE_OK:
+                    logger.warning(f"{verdict.upper()} detected on search page: {url}")
+                    
+                    # Скриншот
+                    screenshot_path = await self._save_captcha_screenshot(page, url)
+                    
+                    # Добавляем в очередь ручной проверки
+                    add_to_manual_review(url, f"{verdict.upper()} on search page", screenshot_path)
+                    
+                    return []
+                
+                # Ищем все ссылки на объявления
+                # OLX использует data-cy="l-card" для карточек объявлений
+                listings = await page.locator(LISTING_LINK_SELECTOR).all()
+                
+                # Извлекаем URL
+                urls = []
+                for listing in listings:
+                    href = await listing.get_attribute('href')
+                    if href:
+                        full_url = urljoin(self.BASE_URL, href)
+                        urls.append(full_url)
+                
+                # Удаляем дубликаты
+                urls = list(dict.fromkeys(urls))
+                
+                logger.debug(f"Found {len(urls)} unique listing URLs on page")
+                
+                # Данные карточек из JSON состояния страницы
+                state = decode_prerendered_state(await page.evaluate(PRERENDERED_STATE_JS))
+                
+                return self._build_cards(urls, state)
+                
+            except PlaywrightTimeoutError:
+                logger.error(f"Timeout loading search page: {url}")
+                return []
+                
+            except Exception as e:
+                logger.error(f"Error scraping search page {url}: {e}")
+                
+                if self.config['screenshot_on_error']:
+                    await self._save_error_screenshot(page, url)
+                
+                return []
     
     async def _scrape_ad_page(self, url: str, search_query: str) -> Optional[Dict[str, Any]]:
         """
@@ -293,52 +953,210 @@ class OLXScraper:
             Словарь с данными объявления или None при ошибке
         """
         # Проверяем robots.txt
-        if self.robots and not self.robots.can_fetch(url):
+        if self.robots and not await self.robots.can_fetch(url):
             logger.warning(f"robots.txt disallows ad: {url}")
             return None
         
-        page = await self.context.new_page()
+        slot = pick_slot(self.slots, url)
         
-        try:
-            logger.debug(f"Scraping ad page: {url}")
-            
-            # Переход на страницу
-            await page.goto(url, timeout=self.config['page_timeout'], wait_until='domcontentloaded')
+        if self.use_http:
+            ad_data = await self._scrape_ad_page_http(url, search_query)
+            if ad_data:
+                return ad_data
             
-            # Ждём загрузки контента
-            await page.wait_for_timeout(2000)
+            # CAPTCHA или не хватает полей - повторяем в браузере
+            self.fetch_stats['escalated'] += 1
+            logger.info(f"HTTP fast path incomplete, retrying in browser: {url}")
+            await slot.rate_limiter.wait()
+        
+        self.fetch_stats['browser'] += 1
+        
+        async with slot.page_pool.page() as page:
+            # Картинки галереи забираем из ответов браузера, а не качаем повторно
+            capture = ImageCapture(page, self.image_capture_hosts) if self.image_capture_hosts else None
             
-            # Проверка на CAPTCHA
-            content = await page.content()
-            if is_captcha_present(content):
-                logger.warning(f"CAPTCHA detected on ad page: {url}")
+            try:
+                if capture:
+                    await capture.start()
+                
+                logger.debug(f"Scraping ad page: {url}")
+                
+                # Переход на страницу
+                response = await page.goto(url, timeout=self.config['page_timeout'], wait_until='domcontentloaded')
+                
+                # Ждём загрузки описания объявления
+                ready = await self._wait_ready(page, self.AD_READY_SELECTOR, 'ad_ready')
+                
+                # Проверка на CAPTCHA / блокировку
+                verdict = await self._classify_page(page, response, ready, slot)
+                if verdict != PAGE_OK:
+                    logger.warning(f"{verdict.upper()} detected on ad page: {url}")
+                    
+                    screenshot_path = await self._save_captcha_screenshot(page, url)
+                    add_to_manual_review(url, f"{verdict.upper()} on ad page", screenshot_path)
+                    
+                    return None
+                
+                # Парсим данные объявления
+                ad_data = await self._extract_ad_data(page, url, search_query, capture)
                 
-                screenshot_path = await self._save_captcha_screenshot(page, url)
-                add_to_manual_review(url, "CAPTCHA on ad page", screenshot_path)
+                return ad_data
                 
+            except PlaywrightTimeoutError:
+                logger.error(f"Timeout loading ad page: {url}")
                 return None
-            
-            # Парсим данные объявления
-            ad_data = await self._extract_ad_data(page, url, search_query)
-            
-            return ad_data
-            
-        except PlaywrightTimeoutError:
-            logger.error(f"Timeout loading ad page: {url}")
-            return None
-            
+                
+            except Exception as e:
+                logger.error(f"Error scraping ad {url}: {e}")
+                
+                if self.config['screenshot_on_error']:
+                    await self._save_error_screenshot(page, url)
+                
+                return None
+                
+            finally:
+                if capture:
+                    await capture.stop()
+    
+    async def _fetch_html(self, url: str) -> Optional[str]:
+        """
+        Загружает страницу через HTTP fast path
+        
+        Returns:
+            HTML или None, если нужен браузер (ошибка, не 200, CAPTCHA)
+        """
+        slot = pick_slot(self.slots, url)
+        
+        try:
+            status, html, final_url = await slot.http_fetcher.fetch(url)
         except Exception as e:
-            logger.error(f"Error scraping ad {url}: {e}")
+            logger.warning(f"HTTP fetch failed for {url}: {e}")
+            return None
+        
+        self.fetch_stats['http'] += 1
+        
+        if status == 429:
+            slot.rate_limiter.penalize()
+        
+        if status != 200:
+            logger.info(f"HTTP fast path got status {status}: {url}")
+            return None
+        
+        start = time.perf_counter()
+        # 200 после редиректа на challenge-хост видно только по final_url
+        verdict = classify_html(html, status, final_url)
+        self.timings.record('classify_http', time.perf_counter() - start)
+        
+        if verdict != PAGE_OK:
+            self.fetch_stats[verdict] += 1
+            slot.rate_limiter.penalize()
+            logger.warning(f"{verdict.upper()} detected on HTTP fast path: {url}")
+            return None
+        
+        slot.rate_limiter.reward()
+        return html
+    
+    async def _scrape_search_page_http(self, url: str) -> List[Dict[str, Any]]:
+        """
+        Страница поиска без браузера
+        
+        Returns:
+            Список карточек (пустой - нужен браузер)
+        """
+        html = await self._fetch_html(url)
+        if html is None:
+            return []
+        
+        urls = await asyncio.to_thread(parse_search_html, html, self.BASE_URL)
+        logger.debug(f"Found {len(urls)} unique listing URLs on page (HTTP)")
+        
+        return self._build_cards(urls, parse_prerendered_state(html))
+    
+    async def _scrape_ad_page_http(self, url: str, search_query: str) -> Optional[Dict[str, Any]]:
+        """
+        Страница объявления без браузера
+        
+        Returns:
+            Данные объявления или None, если нужен браузер
+        """
+        html = await self._fetch_html(url)
+        if html is None:
+            return None
+        
+        raw = await asyncio.to_thread(parse_ad_html, html)
+        data = build_ad_record(raw, url, search_query)
+        
+        missing = missing_fields(data, self.required_fields)
+        if missing:
+            logger.info(f"HTTP fast path missing fields {missing}: {url}")
+            return None
+        
+        await self._download_ad_images(data)
+        
+        return data
+    
+    async def _wait_ready(self, page: Page, selector: str, metric: str) -> bool:
+        """
+        Ждёт появления селектора (не дольше ready_timeout) и записывает время ожидания
+        
+        Таймаут не считается ошибкой: страница может быть CAPTCHA или
+        пустой выдачей, это проверяется дальше по коду.
+        
+        Args:
+            page: Playwright Page
+            selector: CSS селектор готовности
+            metric: Имя метрики в self.timings
             
-            if self.config['screenshot_on_error']:
-                await self._save_error_screenshot(page, url)
+        Returns:
+            True если селектор появился
+        """
+        start = time.perf_counter()
+        
+        try:
+            await page.wait_for_selector(selector, state='attached', timeout=self.ready_timeout)
+            self.timings.record(metric, time.perf_counter() - start)
+            return True
             
-            return None
+        except PlaywrightTimeoutError:
+            self.timings.record(f"{metric}_timeout", time.perf_counter() - start)
+            logger.debug(f"Selector {selector} not found within {self.ready_timeout}ms on {page.url}")
+            return False
+    
+    async def _classify_page(self, page: Page, response, ready: bool, slot: BrowserSlot) -> str:
+        """
+        Классифицирует страницу (ok / captcha / block) и записывает время проверки
+        
+        CAPTCHA/блокировка снижает скорость rate limiter слота, успешная
+        страница постепенно возвращает её.
+        
+        Args:
+            page: Playwright Page после перехода
+            response: Ответ page.goto
+            ready: Результат _wait_ready
+            slot: Слот, через который загружена страница
             
-        finally:
-            await page.close()
+        Returns:
+            PAGE_OK / PAGE_CAPTCHA / PAGE_BLOCK
+        """
+        start = time.perf_counter()
+        verdict = await classify_page(page, response, ready)
+        self.timings.record('classify', time.perf_counter() - start)
+        
+        if verdict != PAGE_OK:
+            self.fetch_stats[verdict] += 1
+            slot.rate_limiter.penalize()
+        else:
+            slot.rate_limiter.reward()
+        
+        return verdict
     
-    async def _extract_ad_data(self, page: Page, url: str, search_query: str) -> Dict[str, Any]:
+    async def _extract_ad_data(
+        self,
+        page: Page,
+        url: str,
+        search_query: str,
+        capture: Optional[ImageCapture] = None
+    ) -> Dict[str, Any]:
         """
         Извлекает данные из страницы объявления
         
@@ -346,92 +1164,47 @@ class OLXScraper:
             page: Playwright Page объект
             url: URL объявления
             search_query: Поисковый запрос
+            capture: Перехват картинок галереи на этой вкладке (опционально)
             
         Returns:
             Словарь с данными
         """
-        data = {
-            'url': url,
-            'id': extract_id_from_url(url),
-            'search_query': search_query,
-            'scraped_at': datetime.now().isoformat()
-        }
-        
-        # Заголовок
-        try:
-            title_el = await page.locator('h1, h4[data-cy="ad_title"]').first.text_content(timeout=5000)
-            data['title'] = clean_text(title_el)
-        except:
-            data['title'] = ""
-            logger.warning(f"Could not extract title from {url}")
-        
-        # Цена
-        try:
-            price_el = await page.locator('h3[data-testid="ad-price-container"]').first.text_content(timeout=5000)
-            data['price'] = parse_price(price_el)
-            data['currency'] = 'PLN' if 'zł' in price_el else None
-        except:
-            data['price'] = None
-            data['currency'] = None
-            logger.warning(f"Could not extract price from {url}")
+        # Все поля схемы за один round trip
+        raw = await page.evaluate(EXTRACT_AD_JS, AD_FIELDS)
+        data = build_ad_record(raw, url, search_query)
         
-        # Описание
-        try:
-            desc_el = await page.locator('[data-cy="ad_description"]').first.text_content(timeout=5000)
-            data['description'] = clean_text(desc_el)
-        except:
-            data['description'] = ""
-            logger.warning(f"Could not extract description from {url}")
+        captured = await capture.stop() if capture else None
+        await self._download_ad_images(data, captured)
         
-        # Локация
-        try:
-            loc_el = await page.locator('[data-testid="location-date"]').first.text_content(timeout=5000)
-            location_parts = loc_el.split('-')
-            data['location'] = clean_text(location_parts[0]) if location_parts else ""
-        except:
-            data['location'] = ""
+        return data
+    
+    async def _download_ad_images(self, data: Dict[str, Any], captured: Optional[Dict[str, bytes]] = None):
+        """
+        Скачивает изображения объявления (если включено) в data['local_images']
         
-        # Дата публикации
-        try:
-            date_el = await page.locator('[data-testid="location-date"]').first.text_content(timeout=5000)
-            date_parts = date_el.split('-')
-            if len(date_parts) > 1:
-                data['date'] = clean_text(date_parts[1])
-            else:
-                data['date'] = ""
-        except:
-            data['date'] = ""
+        data['images'] остаются только удалённые URL, миниатюры (если
+        включена пост-обработка) - в data['thumbnails'].
         
-        # Изображения
-        images = []
-        try:
-            img_elements = await page.locator('[data-testid="swiper-image-slide"] img, .swiper-slide img').all()
-            
-            for img_el in img_elements[:10]:  # Максимум 10 изображений
-                img_src = await img_el.get_attribute('src')
-                if img_src and img_src.startswith('http'):
-                    images.append(img_src)
-                    
-                    # Скачиваем изображение если нужно
-                    if self.config['download_images']:
-                        filename = f"{data['id']}_{len(images)}.jpg"
-                        local_path = await download_image(
-                            img_src,
-                            self.config['images_dir'],
-                            filename
-                        )
-                        if local_path:
-                            images.append(local_path)
-            
-            data['images'] = images
-            
-        except Exception as e:
-            logger.warning(f"Could not extract images: {e}")
-            data['images'] = []
+        Args:
+            data: Запись объявления от build_ad_record
+            captured: Тела картинок, полученные браузером (URL -> bytes)
+        """
+        data['local_images'] = []
+        data['thumbnails'] = []
+        if self.image_downloader:
+            data['local_images'] = await self.image_downloader.download_all(
+                data['images'],
+                prefix=data['id'],
+                captured=captured
+            )
         
-        logger.debug(f"Extracted ad data: title={data['title'][:30]}, price={data['price']}, images={len(images)}")
+        if self.image_postprocessor and self.image_postprocessor.thumb_size:
+            data['thumbnails'] = [thumbnail_path(path) for path in data['local_images']]
         
-        return data
+        logger.debug(
+            f"Extracted ad data: title={data['title'][:30]}, price={data['price']}, "
+            f"images={len(data['images'])}, local={len(data['local_images'])}"
+        )
     
     async def _save_captcha_screenshot(self, page: Page, url: str) -> str:
         """
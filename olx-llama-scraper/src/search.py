@@ -0,0 +1,320 @@
+"""
+Search - Фильтры поиска OLX и отметка последнего просмотренного объявления
+
+Функционал:
+- URL выдачи с категорией, городом/регионом и радиусом, ценой от/до,
+  состоянием и сортировкой
+- Фильтры для каждого запроса из JSON файла (SEARCH_FILTERS_FILE)
+- Ранняя остановка пагинации на объявлениях не новее прошлого запуска
+- Сдвиг отметки только по доставленным объявлениям
+"""
+
+import json
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Dict, Any, Optional, Set
+from urllib.parse import quote_plus, urlencode
+from loguru import logger
+
+
+# ========================================
+# Фильтры
+# ========================================
+
+# Сортировка выдачи -> значение search[order]
+SORT_ORDERS = {
+    'newest': 'created_at:desc',
+    'cheapest': 'filter_float_price:asc',
+    'expensive': 'filter_float_price:desc',
+    'relevance': None
+}
+
+# Состояние товара (search[filter_enum_state])
+CONDITIONS = ('new', 'used', 'damaged')
+
+FILTER_KEYS = (
+    'category', 'city', 'region', 'distance',
+    'price_from', 'price_to', 'condition', 'sort', 'params'
+)
+
+# Ключ фильтров, общих для всех запросов
+DEFAULT_KEY = '*'
+
+
+def normalize_filters(filters: Dict[str, Any], name: str = DEFAULT_KEY) -> Dict[str, Any]:
+    """
+    Проверяет фильтры одного запроса
+    
+    Args:
+        filters: Словарь фильтров (ключи из FILTER_KEYS)
+        name: Запрос, к которому относятся фильтры (для сообщений об ошибках)
+        
+    Returns:
+        Фильтры с condition в виде списка
+    """
+    if not isinstance(filters, dict):
+        raise ValueError(f"Search filters for '{name}' must be an object")
+    
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown search filters for '{name}': {', '.join(sorted(unknown))}")
+    
+    normalized = dict(filters)
+    
+    if normalized.get('sort') is not None and normalized['sort'] not in SORT_ORDERS:
+        raise ValueError(f"Unknown sort for '{name}': {normalized['sort']} (use {', '.join(SORT_ORDERS)})")
+    
+    condition = normalized.get('condition')
+    if condition:
+        states = [condition] if isinstance(condition, str) else list(condition)
+        invalid = [state for state in states if state not in CONDITIONS]
+        if invalid:
+            raise ValueError(f"Unknown condition for '{name}': {', '.join(invalid)} (use {', '.join(CONDITIONS)})")
+        normalized['condition'] = states
+    
+    return normalized
+
+
+def load_search_filters(path: Optional[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Загружает фильтры поиска из JSON файла
+    
+    Формат: {"*": {общие фильтры}, "<запрос>": {фильтры запроса}}
+    
+    Args:
+        path: Путь к файлу (пусто - без фильтров)
+        
+    Returns:
+        Словарь запрос (в нижнем регистре) -> фильтры
+    """
+    if not path:
+        return {}
+    
+    if not Path(path).exists():
+        logger.warning(f"Search filters file not found: {path}")
+        return {}
+    
+    with open(path, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+    
+    if not isinstance(raw, dict):
+        raise ValueError(f"{path}: expected an object of query -> filters")
+    
+    filters = {
+        query.strip().lower(): normalize_filters(query_filters, query)
+        for query, query_filters in raw.items()
+    }
+    
+    logger.info(f"Loaded search filters for {len(filters)} queries from {path}")
+    return filters
+
+
+def filters_for_query(
+    search_filters: Dict[str, Dict[str, Any]],
+    query: str,
+    defaults: Optional[Dict[str, Any]] = None
+) -> Dict[str, Any]:
+    """
+    Итоговые фильтры запроса: defaults < "*" < фильтры самого запроса
+    """
+    merged = dict(defaults or {})
+    merged.update(search_filters.get(DEFAULT_KEY, {}))
+    merged.update(search_filters.get(query.strip().lower(), {}))
+    return merged
+
+
+def _format_number(value: Any) -> str:
+    number = float(value)
+    return str(int(number)) if number.is_integer() else str(number)
+
+
+def build_search_url(base_url: str, query: str, page: int = 1, filters: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Строит URL выдачи OLX
+    
+    Категория и место - сегменты пути (/d/<категория>/<город>/q-<запрос>/),
+    остальные фильтры - параметры search[...].
+    
+    Args:
+        base_url: https://www.olx.pl
+        query: Поисковый запрос
+        page: Номер страницы
+        filters: Фильтры запроса (см. normalize_filters)
+        
+    Returns:
+        URL строка
+    """
+    filters = filters or {}
+    
+    segments = [
+        segment.strip('/')
+        for segment in (filters.get('category'), filters.get('city') or filters.get('region'))
+        if segment
+    ]
+    url = f"{base_url}/d/{'/'.join(segments or ['oferty'])}/q-{quote_plus(query)}/"
+    
+    params = []
+    
+    if filters.get('price_from') is not None:
+        params.append(('search[filter_float_price:from]', _format_number(filters['price_from'])))
+    if filters.get('price_to') is not None:
+        params.append(('search[filter_float_price:to]', _format_number(filters['price_to'])))
+    
+    # Радиус работает только от города
+    if filters.get('city') and filters.get('distance'):
+        params.append(('search[dist]', _format_number(filters['distance'])))
+    
+    for i, state in enumerate(filters.get('condition') or []):
+        params.append((f'search[filter_enum_state][{i}]', state))
+    
+    order = SORT_ORDERS.get(filters.get('sort') or 'relevance')
+    if order:
+        params.append(('search[order]', order))
+    
+    # Любые другие параметры OLX как есть
+    params.extend((key, str(value)) for key, value in (filters.get('params') or {}).items())
+    
+    if page > 1:
+        params.append(('page', str(page)))
+    
+    if params:
+        url += '?' + urlencode(params, safe='[]:')
+    
+    return url
+
+
+# ========================================
+# Отметка последнего просмотренного объявления
+# ========================================
+
+def parse_time(value: Any) -> Optional[datetime]:
+    """
+    ISO время из карточки OLX (без зоны - считается UTC)
+    """
+    if not value or not isinstance(value, str):
+        return None
+    
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def ad_key(item: Dict[str, Any]) -> str:
+    """
+    Ключ объявления для отметки: ID (URL, если ID нет)
+    
+    Одинаков для карточки выдачи и записи объявления.
+    """
+    return item.get('id') or item['url']
+
+
+class SearchWatermark:
+    """
+    Время самого нового объявления выдачи из прошлого запуска
+    
+    Выдача отсортирована от новых к старым (sort=newest, created_at:desc),
+    поэтому первая обычная карточка не новее отметки означает, что дальше
+    идут только уже просмотренные объявления. Сравнивается время создания
+    (date), а не last_refresh: по нему же отсортирована выдача.
+    Продвигаемые карточки (promoted) стоят вне порядка и не сравниваются.
+    
+    Новая отметка считается после обработки карточек (settle) только
+    по доставленным объявлениям.
+    """
+    
+    def __init__(self, key: str, previous: Optional[str]):
+        """
+        Args:
+            key: Ключ выдачи (URL первой страницы с фильтрами)
+            previous: Отметка прошлого запуска (ISO) или None
+        """
+        self.key = key
+        self.previous = parse_time(previous)
+        self.reached = False
+        
+        # Выдача просмотрена до прошлой отметки (или до конца)
+        self.complete = False
+        
+        # Взятые в работу объявления: ad_key -> время
+        self.taken: Dict[str, datetime] = {}
+    
+    @staticmethod
+    def _posted(card: Dict[str, Any]) -> Optional[datetime]:
+        """
+        Время карточки для сравнения с отметкой (None - вне порядка выдачи)
+        """
+        listing = card.get('listing') or {}
+        if listing.get('promoted'):
+            return None
+        
+        return parse_time(listing.get('date'))
+    
+    def cut(self, cards: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Оставляет карточки до первой не новее отметки
+        
+        Args:
+            cards: Карточки страницы выдачи
+            
+        Returns:
+            Карточки новее отметки; reached = True если отметка достигнута
+        """
+        fresh = []
+        
+        for card in cards:
+            posted = self._posted(card)
+            
+            if posted is not None and self.previous and posted <= self.previous:
+                self.reached = True
+                break
+            
+            fresh.append(card)
+        
+        return fresh
+    
+    def take(self, cards: List[Dict[str, Any]]):
+        """
+        Запоминает карточки, взятые в работу
+        """
+        for card in cards:
+            posted = self._posted(card)
+            if posted is not None:
+                self.taken[ad_key(card)] = posted
+    
+    def settle(self, delivered: Set[str]) -> Optional[datetime]:
+        """
+        Новая отметка после обработки взятых карточек
+        
+        Отметка - самое новое доставленное объявление, старше которого нет
+        недоставленных: объявление, которое не спарсилось или не прошло
+        Llama/webhook, остаётся новее отметки и попадёт в следующий запуск.
+        Если выдача не просмотрена до прошлой отметки, она не сдвигается:
+        объявления между ними потерялись бы. Первый запуск задаёт её сразу.
+        
+        Args:
+            delivered: ad_key доставленных объявлений
+            
+        Returns:
+            Время новой отметки или None (оставить прежнюю)
+        """
+        if self.previous is not None and not self.complete:
+            return None
+        
+        done = [posted for key, posted in self.taken.items() if key in delivered]
+        undelivered = [posted for key, posted in self.taken.items() if key not in delivered]
+        
+        if undelivered:
+            oldest = min(undelivered)
+            done = [posted for posted in done if posted < oldest]
+        
+        if not done:
+            return None
+        
+        newest = max(done)
+        if self.previous is not None and newest <= self.previous:
+            return None
+        
+        return newest
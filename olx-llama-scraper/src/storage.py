@@ -0,0 +1,404 @@
+"""
+Storage - Постоянное хранилище между запусками
+
+Функционал:
+- Индекс уже обработанных объявлений (SeenAdIndex) для инкрементальных запусков
+- Определение изменений известных объявлений по карточке выдачи
+- Хранилище изображений с адресацией по содержимому (ImageStore)
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+from datetime import datetime
+from loguru import logger
+
+from .utils import clean_text
+from .extraction import MAX_IMAGES
+
+
+# ========================================
+# Fingerprint объявления
+# ========================================
+
+def ad_fingerprint(ad_data: Dict[str, Any]) -> str:
+    """
+    Отпечаток содержимого объявления
+    
+    Считается по полям, которые есть и в карточке выдачи, и на странице
+    объявления: заголовок, цена, количество фото.
+    
+    Args:
+        ad_data: Запись объявления (build_ad_record / build_listing_record)
+        
+    Returns:
+        SHA-1 hex строка
+    """
+    images = [img for img in ad_data.get('images') or [] if str(img).startswith('http')]
+    price = ad_data.get('price')
+    
+    # Нормализуем так, чтобы карточка (сырые поля) и страница объявления
+    # (очищенные поля) давали одинаковый отпечаток
+    signals = {
+        'title': clean_text(ad_data.get('title')).lower(),
+        'price': float(price) if isinstance(price, (int, float)) else None,
+        'image_count': min(len(images), MAX_IMAGES)
+    }
+    
+    return hashlib.sha1(json.dumps(signals, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+# ========================================
+# Seen Ad Index
+# ========================================
+
+class SeenAdIndex:
+    """
+    SQLite индекс объявлений, уже собранных в прошлых запусках
+    """
+    
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Путь к файлу базы SQLite
+        """
+        self.path = path
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS seen_ads (
+                id TEXT PRIMARY KEY,
+                url TEXT,
+                fingerprint TEXT,
+                first_seen TEXT,
+                last_seen TEXT,
+                price REAL,
+                last_refresh TEXT
+            )
+            """
+        )
+        
+        # Колонки, добавленные после первой версии схемы
+        columns = {row['name'] for row in self.conn.execute('PRAGMA table_info(seen_ads)')}
+        for name, sql_type in (('price', 'REAL'), ('last_refresh', 'TEXT')):
+            if name not in columns:
+                self.conn.execute(f'ALTER TABLE seen_ads ADD COLUMN {name} {sql_type}')
+        
+        # Время самого нового объявления для каждой выдачи (URL с фильтрами)
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS search_watermarks (
+                search_key TEXT PRIMARY KEY,
+                newest TEXT,
+                updated TEXT
+            )
+            """
+        )
+        
+        self.conn.commit()
+        
+        count = self.conn.execute('SELECT COUNT(*) FROM seen_ads').fetchone()[0]
+        logger.info(f"SeenAdIndex opened: {path} ({count} known ads)")
+    
+    def get(self, ad_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        Возвращает сохранённую запись объявления или None
+        """
+        if not ad_id:
+            return None
+        
+        row = self.conn.execute('SELECT * FROM seen_ads WHERE id = ?', (ad_id,)).fetchone()
+        return dict(row) if row else None
+    
+    def is_known(self, ad_id: Optional[str]) -> bool:
+        """
+        Было ли объявление собрано раньше
+        """
+        return self.get(ad_id) is not None
+    
+    def detect_change(self, card: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Сравнивает карточку выдачи с сохранённой записью объявления
+        
+        Используются только дешёвые сигналы из карточки: last_refresh,
+        цена, заголовок и количество фото.
+        
+        Args:
+            card: Карточка {'url', 'id', 'listing'} от _scrape_search_page
+            
+        Returns:
+            None если объявление новое или не изменилось (см. is_known),
+            иначе {'event': 'price_changed' | 'updated', 'previous_price': ...}
+        """
+        record = self.get(card.get('id'))
+        listing = card.get('listing')
+        
+        # Нет сигналов в карточке - считаем известное объявление неизменным
+        if record is None or not listing:
+            return None
+        
+        if listing.get('last_refresh') and listing['last_refresh'] == record.get('last_refresh'):
+            return None
+        
+        if ad_fingerprint(listing) == record['fingerprint']:
+            return None
+        
+        price = listing.get('price')
+        new_price = float(price) if isinstance(price, (int, float)) else None
+        
+        return {
+            'event': 'price_changed' if new_price != record.get('price') else 'updated',
+            'previous_price': record.get('price')
+        }
+    
+    def touch(self, ad_ids: Iterable[str]):
+        """
+        Обновляет last_seen у объявлений, снова встретившихся в выдаче
+        """
+        now = datetime.now().isoformat()
+        self.conn.executemany(
+            'UPDATE seen_ads SET last_seen = ? WHERE id = ?',
+            [(now, ad_id) for ad_id in ad_ids if ad_id]
+        )
+        self.conn.commit()
+    
+    def remember(self, ad_data: Dict[str, Any]):
+        """
+        Сохраняет (или обновляет) объявление после успешной доставки
+        
+        Отпечаток берётся из listing_fingerprint (карточка выдачи, с которой
+        потом сравнивает detect_change), иначе считается по данным объявления.
+        """
+        if not ad_data.get('id'):
+            return
+        
+        now = datetime.now().isoformat()
+        self.conn.execute(
+            """
+            INSERT INTO seen_ads (id, url, fingerprint, first_seen, last_seen, price, last_refresh)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET
+                url = excluded.url,
+                fingerprint = excluded.fingerprint,
+                last_seen = excluded.last_seen,
+                price = excluded.price,
+                last_refresh = excluded.last_refresh
+            """,
+            (
+                ad_data['id'],
+                ad_data.get('url'),
+                ad_data.get('listing_fingerprint') or ad_fingerprint(ad_data),
+                now,
+                now,
+                ad_data.get('price'),
+                ad_data.get('last_refresh')
+            )
+        )
+        self.conn.commit()
+    
+    def get_watermark(self, search_key: str) -> Optional[str]:
+        """
+        Время самого нового объявления выдачи из прошлых запусков (ISO) или None
+        """
+        row = self.conn.execute(
+            'SELECT newest FROM search_watermarks WHERE search_key = ?',
+            (search_key,)
+        ).fetchone()
+        
+        return row['newest'] if row else None
+    
+    def set_watermark(self, search_key: str, newest: str):
+        """
+        Сохраняет время самого нового объявления выдачи
+        """
+        self.conn.execute(
+            """
+            INSERT INTO search_watermarks (search_key, newest, updated)
+            VALUES (?, ?, ?)
+            ON CONFLICT(search_key) DO UPDATE SET
+                newest = excluded.newest,
+                updated = excluded.updated
+            """,
+            (search_key, newest, datetime.now().isoformat())
+        )
+        self.conn.commit()
+    
+    def close(self):
+        """
+        Закрывает соединение с базой
+        """
+        self.conn.close()
+
+
+# ========================================
+# Image Store
+# ========================================
+
+class ImageStore:
+    """
+    Хранилище изображений с адресацией по содержимому
+    
+    Файл называется SHA-256 своих байт (root/ab/abcdef....jpg), поэтому
+    одно и то же фото из разных объявлений и запросов хранится один раз.
+    Индекс URL -> хеш позволяет пропускать уже скачанные URL без сети.
+    Опционально по перцептивному хешу (phash) похожие фото
+    (пережатые, другого размера) объединяются в группы.
+    """
+    
+    def __init__(self, root_dir: str, index_path: str, phash_distance: int = 5):
+        """
+        Args:
+            root_dir: Директория файлов изображений
+            index_path: Путь к файлу базы SQLite
+            phash_distance: Максимальное расстояние Хэмминга между phash одной группы
+        """
+        self.root_dir = root_dir
+        self.phash_distance = phash_distance
+        Path(index_path).parent.mkdir(parents=True, exist_ok=True)
+        
+        self.conn = sqlite3.connect(index_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS images (
+                sha256 TEXT PRIMARY KEY,
+                path TEXT,
+                size INTEGER,
+                phash TEXT,
+                group_id TEXT,
+                created TEXT
+            )
+            """
+        )
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS image_urls (
+                url TEXT PRIMARY KEY,
+                sha256 TEXT
+            )
+            """
+        )
+        self.conn.commit()
+        
+        # (phash, group_id) известных изображений, загружается при первом поиске группы
+        self._phashes: Optional[List[Tuple[int, str]]] = None
+        
+        self.stats = {'stored': 0, 'known_url': 0, 'known_content': 0, 'similar': 0}
+        
+        count = self.conn.execute('SELECT COUNT(*) FROM images').fetchone()[0]
+        logger.info(f"ImageStore opened: {root_dir} ({count} images)")
+    
+    def path_for_url(self, url: str) -> Optional[str]:
+        """
+        Локальный путь уже сохранённого URL (None - нужно скачивать)
+        """
+        row = self.conn.execute(
+            'SELECT images.path FROM image_urls JOIN images USING (sha256) WHERE image_urls.url = ?',
+            (url,)
+        ).fetchone()
+        
+        if row and os.path.exists(row['path']):
+            self.stats['known_url'] += 1
+            return row['path']
+        
+        return None
+    
+    def add(
+        self,
+        url: str,
+        tmp_path: str,
+        sha256: str,
+        ext: str,
+        size: int,
+        phash: Optional[str] = None
+    ) -> str:
+        """
+        Сохраняет скачанный файл в хранилище
+        
+        Если такое содержимое уже есть - временный файл удаляется,
+        URL привязывается к существующему файлу.
+        
+        Args:
+            url: Исходный URL изображения
+            tmp_path: Временный файл с байтами изображения
+            sha256: SHA-256 содержимого (hex)
+            ext: Расширение файла
+            size: Размер в байтах
+            phash: Перцептивный хеш (hex) или None
+            
+        Returns:
+            Путь к файлу в хранилище
+        """
+        row = self.conn.execute('SELECT path FROM images WHERE sha256 = ?', (sha256,)).fetchone()
+        
+        if row and os.path.exists(row['path']):
+            os.remove(tmp_path)
+            path = row['path']
+            self.stats['known_content'] += 1
+        else:
+            path = os.path.join(self.root_dir, sha256[:2], f"{sha256}.{ext}")
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, path)
+            
+            self.conn.execute(
+                'INSERT OR REPLACE INTO images (sha256, path, size, phash, group_id, created) VALUES (?, ?, ?, ?, ?, ?)',
+                (sha256, path, size, phash, self._find_group(sha256, phash), datetime.now().isoformat())
+            )
+            self.stats['stored'] += 1
+        
+        self.conn.execute('INSERT OR REPLACE INTO image_urls (url, sha256) VALUES (?, ?)', (url, sha256))
+        self.conn.commit()
+        
+        return path
+    
+    def group(self, path: str) -> List[str]:
+        """
+        Пути всех изображений из той же phash-группы, что и path
+        """
+        rows = self.conn.execute(
+            'SELECT path FROM images WHERE group_id = (SELECT group_id FROM images WHERE path = ?)',
+            (path,)
+        ).fetchall()
+        
+        return [row['path'] for row in rows]
+    
+    def _find_group(self, sha256: str, phash: Optional[str]) -> str:
+        """
+        Ищет группу похожего изображения по phash
+        
+        Returns:
+            group_id найденной группы или sha256 (изображение открывает новую группу)
+        """
+        if phash is None:
+            return sha256
+        
+        if self._phashes is None:
+            rows = self.conn.execute('SELECT phash, group_id FROM images WHERE phash IS NOT NULL')
+            self._phashes = [(int(row['phash'], 16), row['group_id']) for row in rows]
+        
+        value = int(phash, 16)
+        group_id = sha256
+        
+        for known, known_group in self._phashes:
+            if bin(known ^ value).count('1') <= self.phash_distance:
+                group_id = known_group
+                self.stats['similar'] += 1
+                break
+        
+        self._phashes.append((value, group_id))
+        
+        return group_id
+    
+    def close(self):
+        """
+        Закрывает соединение с базой
+        """
+        self.conn.close()
@@ -1,9 +1,9 @@
 """
 Утилиты для OLX Scraper
 - Логирование
-- Rate limiting
+- Rate limiting (в том числе общий бюджет запросов для нескольких процессов)
+- Телеметрия ожиданий (TimingStats)
 - Парсинг robots.txt
-- Скачивание изображений
 - Вспомогательные функции
 """
 
@@ -13,16 +13,16 @@ import json
 import time
 import random
 import asyncio
+import multiprocessing
+from collections import OrderedDict
 from pathlib import Path
 from typing import Optional, List, Dict, Any
 from datetime import datetime
-from urllib.parse import urlparse
-import requests
+from urllib.parse import urlparse, urlunparse, unquote
+import aiohttp
 from loguru import logger
 from ratelimit import limits, sleep_and_retry
 from robotexclusionrulesparser import RobotExclusionRulesParser
-from PIL import Image
-from io import BytesIO
 
 
 # ========================================
@@ -81,43 +81,286 @@ def setup_logging(log_level: str = "INFO", log_file: Optional[str] = None, conso
 
 class RateLimiter:
     """
-    Token bucket rate limiter с jitter
+    Token bucket rate limiter с jitter и адаптивной скоростью (AIMD)
+    
+    Ведро вмещает burst токенов и пополняется со скоростью calls_per_minute.
+    Пока токены есть, запросы идут без пауз; при пустом ведре ждём
+    следующий токен, но не меньше случайной паузы min_delay..max_delay.
+    
+    penalize() (CAPTCHA, 429) вдвое снижает скорость пополнения,
+    reward() (успешный ответ) возвращает её аддитивными шагами.
     """
     
-    def __init__(self, calls_per_minute: int = 10, min_delay: float = 0.8, max_delay: float = 2.5):
+    # AIMD: во сколько раз снижать скорость, шаг восстановления и нижняя граница
+    BACKOFF_FACTOR = 0.5
+    RECOVERY_STEP = 0.1
+    MIN_RATE_FACTOR = 0.1
+    
+    def __init__(
+        self,
+        calls_per_minute: int = 10,
+        min_delay: float = 0.8,
+        max_delay: float = 2.5,
+        budget: Optional['SharedBudget'] = None,
+        burst: int = 1,
+        name: str = 'olx',
+        cooldown: float = 0
+    ):
         """
         Args:
-            calls_per_minute: Максимум вызовов в минуту
-            min_delay: Минимальная задержка между вызовами (сек)
-            max_delay: Максимальная задержка между вызовами (сек)
+            calls_per_minute: Максимум вызовов в минуту (0 - без ограничения)
+            min_delay: Минимальная пауза при пустом ведре (сек)
+            max_delay: Максимальная пауза при пустом ведре (сек)
+            budget: Общий бюджет запросов всех процессов (опционально)
+            burst: Сколько запросов можно сделать подряд без пауз
+            name: Имя ведра (для логов и метрик)
+            cooldown: Пауза всех участников budget после CAPTCHA/блокировки (сек)
         """
         self.calls_per_minute = calls_per_minute
         self.min_delay = min_delay
         self.max_delay = max_delay
-        self.last_call = 0.0
+        self.budget = budget
+        self.burst = max(1, burst)
+        self.name = name
+        self.cooldown = cooldown
+        
+        # Состояние ведра
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.rate_factor = 1.0
+        self.penalties = 0
+        
+        # Время, проведённое в wait() (метрика 'wait')
+        self.timings = TimingStats()
+        
+        # Lock сериализует вызовы из параллельных воркеров,
+        # чтобы токены выдавались строго по очереди
+        self._lock = asyncio.Lock()
+        
+        # Запущенные в потоках start_cooldown() (ссылки до завершения)
+        self._cooldowns = set()
         
-        logger.info(f"RateLimiter initialized: {calls_per_minute} calls/min, delay {min_delay}-{max_delay}s")
+        logger.info(
+            f"RateLimiter {name} initialized: {calls_per_minute} calls/min, burst {self.burst}, "
+            f"delay {min_delay}-{max_delay}s"
+        )
+    
+    @property
+    def rate(self) -> float:
+        """
+        Текущая скорость пополнения (токенов в секунду) с учётом backoff
+        """
+        return self.calls_per_minute / 60.0 * self.rate_factor
+    
+    def _refill(self):
+        """
+        Начисляет токены за время с последнего обновления
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
     
     async def wait(self):
         """
-        Асинхронное ожидание с jitter
+        Асинхронное ожидание токена
+        
+        Безопасно для конкурентного вызова: параллельные корутины
+        получают токены строго по очереди.
+        """
+        if self.calls_per_minute <= 0 and not self.budget:
+            return
+        
+        async with self._lock:
+            start = time.monotonic()
+            delay = 0.0
+            
+            if self.calls_per_minute > 0:
+                self._refill()
+                
+                # Пустое ведро: ждём следующий токен (с jitter)
+                if self.tokens < 1:
+                    deficit = (1 - self.tokens) / self.rate
+                    delay = max(deficit, random.uniform(self.min_delay, self.max_delay))
+            
+            # Общий бюджет: ждём свой слот среди запросов всех процессов
+            # (reserve() блокирующий - SQLite/Redis/замок, поэтому в потоке)
+            if self.budget:
+                delay = max(delay, await asyncio.to_thread(self.budget.reserve))
+            
+            if delay > 0:
+                logger.debug(f"Rate limit delay ({self.name}): {delay:.2f}s")
+                await asyncio.sleep(delay)
+            
+            if self.calls_per_minute > 0:
+                self._refill()
+                self.tokens = max(0.0, self.tokens - 1)
+            
+            self.timings.record('wait', time.monotonic() - start)
+    
+    def penalize(self):
+        """
+        Multiplicative decrease: CAPTCHA/429 - снижаем скорость и опустошаем ведро
+        
+        С общим budget заодно включается cool-down для всех процессов
+        и экземпляров, которые его используют.
         """
-        # Рассчитываем задержку с jitter
-        delay = random.uniform(self.min_delay, self.max_delay)
+        self._refill()
+        self.rate_factor = max(self.MIN_RATE_FACTOR, self.rate_factor * self.BACKOFF_FACTOR)
+        self.tokens = 0.0
+        self.penalties += 1
         
-        # Дополнительная задержка если превышен лимит
-        now = time.time()
-        time_since_last = now - self.last_call
-        min_interval = 60.0 / self.calls_per_minute
+        logger.warning(f"RateLimiter {self.name} backing off: {self.rate * 60:.1f} calls/min")
         
-        if time_since_last < min_interval:
-            additional_delay = min_interval - time_since_last
-            delay += additional_delay
+        if self.budget and self.cooldown > 0:
+            self._start_cooldown()
+            logger.warning(f"Shared cool-down started: {self.cooldown:.0f}s")
+    
+    def _start_cooldown(self):
+        """
+        Включает общий cool-down, не блокируя event loop
         
-        logger.debug(f"Rate limit delay: {delay:.2f}s")
-        await asyncio.sleep(delay)
+        Из корутины запись уходит в поток по умолчанию, без event loop
+        выполняется сразу.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.budget.start_cooldown(self.cooldown)
+            return
         
-        self.last_call = time.time()
+        future = loop.run_in_executor(None, self.budget.start_cooldown, self.cooldown)
+        self._cooldowns.add(future)
+        future.add_done_callback(self._cooldown_done)
+    
+    def _cooldown_done(self, future):
+        self._cooldowns.discard(future)
+        
+        if not future.cancelled() and future.exception():
+            logger.error(f"Shared cool-down failed ({self.name}): {future.exception()}")
+    
+    def reward(self):
+        """
+        Additive increase: успешный ответ - возвращаем скорость к номинальной
+        """
+        if self.rate_factor < 1.0:
+            self._refill()
+            self.rate_factor = min(1.0, self.rate_factor + self.RECOVERY_STEP)
+    
+    def format_summary(self) -> str:
+        """
+        Строка для логов: ожидание и текущая скорость
+        """
+        return (
+            f"{self.name}: {self.timings.format_summary()}, "
+            f"rate {self.rate * 60:.1f}/min, penalties {self.penalties}"
+        )
+
+
+class SharedBudget:
+    """
+    Глобальный лимит запросов, общий для нескольких процессов
+    
+    Хранит в разделяемой памяти время следующего свободного слота.
+    Каждый reserve() занимает слот и сдвигает его на 60/calls_per_minute,
+    поэтому суммарная частота запросов всех воркеров не превышает лимит.
+    Объект передаётся в дочерние процессы при их создании.
+    
+    Работает только между процессами одного MultiProcessRunner; бюджеты
+    для нескольких экземпляров scraper - в limits.py (тот же интерфейс).
+    """
+    
+    def __init__(self, calls_per_minute: int, ctx=None):
+        """
+        Args:
+            calls_per_minute: Максимум запросов в минуту на все процессы
+            ctx: multiprocessing context (по умолчанию spawn)
+        """
+        ctx = ctx or multiprocessing.get_context('spawn')
+        
+        self.interval = 60.0 / calls_per_minute
+        self._next_slot = ctx.Value('d', 0.0, lock=False)
+        self._cooldown_until = ctx.Value('d', 0.0, lock=False)
+        self._lock = ctx.Lock()
+    
+    def reserve(self) -> float:
+        """
+        Занимает ближайший свободный слот (не раньше конца cool-down)
+        
+        Returns:
+            Сколько секунд ждать до своего слота
+        """
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot.value, self._cooldown_until.value)
+            self._next_slot.value = slot + self.interval
+        
+        return slot - now
+    
+    def start_cooldown(self, seconds: float):
+        """
+        Пауза для всех процессов после CAPTCHA/блокировки
+        """
+        with self._lock:
+            self._cooldown_until.value = max(self._cooldown_until.value, time.time() + seconds)
+    
+    def cooldown_remaining(self) -> float:
+        """
+        Сколько секунд осталось до конца cool-down
+        """
+        return max(0.0, self._cooldown_until.value - time.time())
+
+
+# ========================================
+# Timing Telemetry
+# ========================================
+
+class TimingStats:
+    """
+    Собирает длительности операций по именам метрик
+    
+    Используется для ожиданий готовности страниц: вместо фиксированных
+    пауз видно реальное распределение времени до готовности.
+    """
+    
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+    
+    def record(self, name: str, seconds: float):
+        """
+        Добавляет одно измерение
+        """
+        self.samples.setdefault(name, []).append(seconds)
+    
+    def summary(self, name: str) -> Dict[str, float]:
+        """
+        Статистика по метрике: count, avg, p50, p95, max (секунды)
+        """
+        values = sorted(self.samples.get(name, []))
+        
+        if not values:
+            return {'count': 0, 'avg': 0.0, 'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+        
+        def percentile(p: float) -> float:
+            return values[min(len(values) - 1, int(p * len(values)))]
+        
+        return {
+            'count': len(values),
+            'avg': sum(values) / len(values),
+            'p50': percentile(0.50),
+            'p95': percentile(0.95),
+            'max': values[-1]
+        }
+    
+    def format_summary(self) -> str:
+        """
+        Однострочная сводка по всем метрикам для лога
+        """
+        parts = []
+        for name in sorted(self.samples):
+            s = self.summary(name)
+            parts.append(f"{name}: n={s['count']} p50={s['p50']:.2f}s p95={s['p95']:.2f}s max={s['max']:.2f}s")
+        
+        return '; '.join(parts) if parts else 'no samples'
 
 
 # ========================================
@@ -126,38 +369,220 @@ class RateLimiter:
 
 class RobotsParser:
     """
-    Парсер robots.txt с кешированием
+    Асинхронный парсер robots.txt с кешем на диске
+    
+    - robots.txt загружается через aiohttp один раз (параллельные
+      вызовы ждут одну загрузку) и сохраняется на диск на cache_ttl секунд
+    - Неудачная загрузка не повторяется на каждом URL: следующая попытка
+      через retry_delay (удваивается до cache_ttl), пока - устаревший кеш
+      или "разрешено всё"
+    - Решения запоминаются в LRU по правилам, которые подходят к URL:
+      самому длинному подходящему префиксу обычных правил и совпадениям
+      правил с '*' и '$'. Разные объявления одного каталога делят одну
+      запись, а запомненное решение всегда совпадает с новой проверкой
     """
     
-    def __init__(self, robots_url: str):
+    # Строки Allow/Disallow (для ключа LRU правила всех User-agent)
+    RULE_RE = re.compile(r'^\s*(?:allow|disallow)\s*:\s*([^#\s]*)', re.IGNORECASE | re.MULTILINE)
+    
+    def __init__(
+        self,
+        robots_url: str,
+        cache_path: Optional[str] = None,
+        cache_ttl: float = 86400,
+        retry_delay: float = 300,
+        memo_size: int = 1024,
+        timeout: float = 10
+    ):
         """
         Args:
             robots_url: URL к robots.txt
+            cache_path: Файл кеша на диске (None - без кеша)
+            cache_ttl: Сколько секунд кеш считается свежим
+            retry_delay: Пауза перед повторной загрузкой после ошибки (сек)
+            memo_size: Размер LRU решений
+            timeout: Таймаут загрузки (сек)
         """
         self.robots_url = robots_url
+        self.cache_path = cache_path
+        self.cache_ttl = cache_ttl
+        self.retry_delay = retry_delay
+        self.memo_size = memo_size
+        self.timeout = timeout
+        
         self.parser = RobotExclusionRulesParser()
         self.loaded = False
+        self.expires_at = 0.0
+        self.failures = 0
+        self.memo: 'OrderedDict[tuple, bool]' = OrderedDict()
+        self._lock = asyncio.Lock()
+        
+        # Правила для ключа LRU (см. _index_rules)
+        self._prefixes: set = set()
+        self._prefix_lengths: List[int] = []
+        self._patterns: List['re.Pattern'] = []
         
         logger.info(f"RobotsParser initialized for: {robots_url}")
     
-    def load(self):
+    def _read_cache(self) -> Optional[Dict[str, Any]]:
         """
-        Загружает и парсит robots.txt
+        Кеш с диска ({url, fetched_at, text}) или None
         """
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return None
+        
         try:
-            logger.info(f"Fetching robots.txt from {self.robots_url}")
-            response = requests.get(self.robots_url, timeout=10)
-            response.raise_for_status()
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Invalid robots.txt cache {self.cache_path}: {e}")
+            return None
+        
+        if not isinstance(cached, dict) or cached.get('url') != self.robots_url:
+            return None
+        
+        if not isinstance(cached.get('text'), str):
+            logger.warning(f"Invalid robots.txt cache {self.cache_path}: no text")
+            return None
+        
+        # Без времени загрузки кеш считается устаревшим
+        if not isinstance(cached.get('fetched_at'), (int, float)):
+            logger.warning(f"Invalid robots.txt cache {self.cache_path}: no fetched_at, treating as stale")
+            cached['fetched_at'] = 0.0
+        
+        return cached
+    
+    def _write_cache(self, text: str):
+        """
+        Атомарно сохраняет robots.txt на диск
+        """
+        if not self.cache_path:
+            return
+        
+        Path(self.cache_path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'url': self.robots_url, 'fetched_at': time.time(), 'text': text}, f)
+        os.replace(tmp_path, self.cache_path)
+    
+    def _apply(self, text: str, fetched_at: float):
+        """
+        Применяет текст robots.txt и сбрасывает запомненные решения
+        """
+        self.parser = RobotExclusionRulesParser()
+        self.parser.parse(text)
+        self.loaded = True
+        self.expires_at = fetched_at + self.cache_ttl
+        self.memo.clear()
+        self._index_rules(text)
+    
+    @staticmethod
+    def _unquote(path: str) -> str:
+        # Как в RobotExclusionRulesParser: %xx раскодируются, кроме '/'
+        return unquote(re.sub('%2[fF]', '\n', path)).replace('\n', '%2F')
+    
+    def _index_rules(self, text: str):
+        """
+        Раскладывает правила для ключа LRU: префиксы обычных правил
+        и регулярные выражения правил с '*' / '$' (как их понимает парсер)
+        """
+        prefixes = set()
+        patterns = []
+        
+        for path in self.RULE_RE.findall(text):
+            path = self._unquote(path)
             
-            self.parser.parse(response.text)
-            self.loaded = True
-            logger.info("robots.txt loaded successfully")
+            if '*' in path or path.endswith('$'):
+                anchor = '$' if path.endswith('$') else ''
+                parts = re.sub(r'\*+', '*', path.rstrip('$')).split('*')
+                patterns.append(re.compile('.*'.join(re.escape(part) for part in parts) + anchor))
+            else:
+                prefixes.add(path)
+        
+        self._prefixes = prefixes
+        self._prefix_lengths = sorted({len(prefix) for prefix in prefixes}, reverse=True)
+        self._patterns = patterns
+    
+    async def _fetch(self) -> Optional[str]:
+        """
+        Загружает robots.txt
+        
+        Returns:
+            Текст robots.txt ('' если его нет - 4xx) или None при ошибке
+        """
+        timeout = aiohttp.ClientTimeout(total=self.timeout)
+        
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            async with session.get(self.robots_url) as response:
+                # Нет robots.txt - ограничений нет
+                if 400 <= response.status < 500:
+                    logger.info(f"robots.txt not found ({response.status}), allowing all")
+                    return ''
+                
+                response.raise_for_status()
+                return await response.text()
+    
+    async def load(self):
+        """
+        Загружает robots.txt: свежий кеш с диска, иначе сеть
+        """
+        cached = self._read_cache()
+        if cached and time.time() - cached['fetched_at'] < self.cache_ttl:
+            self._apply(cached['text'], cached['fetched_at'])
+            logger.info(f"robots.txt loaded from cache: {self.cache_path}")
+            return
+        
+        try:
+            logger.info(f"Fetching robots.txt from {self.robots_url}")
+            text = await self._fetch()
             
         except Exception as e:
-            logger.warning(f"Failed to load robots.txt: {e}. Continuing anyway...")
-            self.loaded = False
+            self.failures += 1
+            delay = min(self.retry_delay * 2 ** (self.failures - 1), self.cache_ttl)
+            
+            # Устаревший кеш лучше, чем ничего
+            if cached:
+                self._apply(cached['text'], cached['fetched_at'])
+            self.expires_at = time.time() + delay
+            
+            logger.warning(
+                f"Failed to load robots.txt: {e}. "
+                f"{'Using stale cache' if cached else 'Allowing all'}, retry in {delay:.0f}s"
+            )
+            return
+        
+        self.failures = 0
+        self._apply(text, time.time())
+        
+        try:
+            self._write_cache(text)
+        except OSError as e:
+            logger.warning(f"Failed to cache robots.txt: {e}")
+        
+        logger.info("robots.txt loaded successfully")
     
-    def can_fetch(self, url: str, user_agent: str = "*") -> bool:
+    def _memo_key(self, url: str, user_agent: str) -> tuple:
+        """
+        Ключ LRU: правила robots.txt, которые подходят к URL
+        
+        Все подходящие обычные правила - префиксы URL, поэтому их набор
+        задаёт самый длинный из них; правила с '*' и '$' проверяются
+        каждое. Парсер применяет первое подходящее правило, так что
+        URL с одинаковым набором правил получают одинаковое решение.
+        """
+        parsed = urlparse(url)
+        target = self._unquote(urlunparse(('', '', parsed.path, parsed.params, parsed.query, parsed.fragment)))
+        
+        prefix = next(
+            (target[:length] for length in self._prefix_lengths if target[:length] in self._prefixes),
+            None
+        )
+        matches = tuple(bool(pattern.match(target)) for pattern in self._patterns)
+        
+        return (user_agent, parsed.netloc, prefix, matches)
+    
+    async def can_fetch(self, url: str, user_agent: str = "*") -> bool:
         """
         Проверяет можно ли получить URL
         
@@ -168,14 +593,26 @@ class RobotsParser:
         Returns:
             True если разрешено, False если запрещено
         """
-        if not self.loaded:
-            self.load()
+        if time.time() >= self.expires_at:
+            async with self._lock:
+                # Пока ждали замок, robots.txt мог загрузить другой вызов
+                if time.time() >= self.expires_at:
+                    await self.load()
         
         if not self.loaded:
             # Если не удалось загрузить - разрешаем
             return True
         
-        allowed = self.parser.is_allowed(user_agent, url)
+        key = self._memo_key(url, user_agent)
+        allowed = self.memo.get(key)
+        
+        if allowed is None:
+            allowed = self.parser.is_allowed(user_agent, url)
+            self.memo[key] = allowed
+            if len(self.memo) > self.memo_size:
+                self.memo.popitem(last=False)
+        else:
+            self.memo.move_to_end(key)
         
         if not allowed:
             logger.warning(f"robots.txt disallows: {url}")
@@ -183,73 +620,6 @@ class RobotsParser:
         return allowed
 
 
-# ========================================
-# Image Downloader
-# ========================================
-
-async def download_image(
-    url: str,
-    save_dir: str,
-    filename: Optional[str] = None,
-    max_size_mb: int = 10
-) -> Optional[str]:
-    """
-    Скачивает изображение с проверками
-    
-    Args:
-        url: URL изображения
-        save_dir: Директория для сохранения
-        filename: Имя файла (опционально, генерируется автоматически)
-        max_size_mb: Максимальный размер файла в MB
-        
-    Returns:
-        Путь к скачанному файлу или None при ошибке
-    """
-    try:
-        # Создаём директорию
-        Path(save_dir).mkdir(parents=True, exist_ok=True)
-        
-        # Скачиваем изображение
-        logger.debug(f"Downloading image: {url}")
-        response = requests.get(url, timeout=15, stream=True)
-        response.raise_for_status()
-        
-        # Проверяем размер
-        content_length = response.headers.get('content-length')
-        if content_length and int(content_length) > max_size_mb * 1024 * 1024:
-            logger.warning(f"Image too large: {content_length} bytes > {max_size_mb}MB")
-            return None
-        
-        # Читаем контент
-        image_data = response.content
-        
-        # Проверяем что это изображение
-        try:
-            img = Image.open(BytesIO(image_data))
-            img.verify()
-            
-            # Генерируем имя файла если не указано
-            if not filename:
-                ext = img.format.lower() if img.format else 'jpg'
-                filename = f"{int(time.time())}_{random.randint(1000, 9999)}.{ext}"
-            
-            # Сохраняем
-            filepath = os.path.join(save_dir, filename)
-            with open(filepath, 'wb') as f:
-                f.write(image_data)
-            
-            logger.info(f"Image saved: {filepath} ({len(image_data)} bytes)")
-            return filepath
-            
-        except Exception as e:
-            logger.error(f"Invalid image data: {e}")
-            return None
-            
-    except Exception as e:
-        logger.error(f"Failed to download image {url}: {e}")
-        return None
-
-
 # ========================================
 # Manual Review Queue
 # ========================================
@@ -386,8 +756,9 @@ def extract_id_from_url(url: str) -> Optional[str]:
     Returns:
         ID или None
     """
-    # Ищем паттерн IDxxxxxx
-    match = re.search(r'ID([a-zA-Z0-9]+)', url)
+    # Ищем паттерн IDxxxxxx в начале сегмента или после '-'
+    # (чтобы не спутать с категорией: ...-CID99-IDabc123.html)
+    match = re.search(r'(?:^|[-/])ID([a-zA-Z0-9]+)(?:\.html)?(?:[?#]|$)', url)
     if match:
         return match.group(1)
     
@@ -411,30 +782,24 @@ def sanitize_filename(filename: str) -> str:
 
 def is_captcha_present(page_content: str) -> bool:
     """
-    Определяет наличие CAPTCHA на странице
+    Определяет наличие CAPTCHA в тексте страницы
+    
+    Один проход объединённым выражением CAPTCHA_TEXT_RE. Скрейпер
+    использует detection.classify_page / classify_html, которые
+    не требуют полного HTML.
     
     Args:
-        page_content: HTML контент страницы
+        page_content: HTML или видимый текст страницы
         
     Returns:
         True если CAPTCHA обнаружена
     """
-    # Паттерны CAPTCHA
-    captcha_patterns = [
-        r'captcha',
-        r'recaptcha',
-        r'hcaptcha',
-        r'robot\s+check',
-        r'verify\s+you.*human',
-        r'security\s+check'
-    ]
-    
-    content_lower = page_content.lower()
-    
-    for pattern in captcha_patterns:
-        if re.search(pattern, content_lower):
-            logger.warning(f"CAPTCHA pattern detected: {pattern}")
-            return True
+    from .detection import CAPTCHA_TEXT_RE
+    
+    match = CAPTCHA_TEXT_RE.search(page_content)
+    if match:
+        logger.warning(f"CAPTCHA pattern detected: {match.group(0)}")
+        return True
     
     return False
 
@@ -443,6 +808,13 @@ def is_captcha_present(page_content: str) -> bool:
 # Configuration Loader
 # ========================================
 
+def _env_list(name: str, default: str = '') -> List[str]:
+    """
+    Читает список через запятую из переменной окружения
+    """
+    return [item.strip() for item in os.getenv(name, default).split(',') if item.strip()]
+
+
 def load_config() -> Dict[str, Any]:
     """
     Загружает конфигурацию из .env
@@ -457,14 +829,36 @@ def load_config() -> Dict[str, Any]:
         # OLX
         'search_queries': os.getenv('SEARCH_QUERIES', '').split(','),
         'max_ads': int(os.getenv('MAX_ADS', '10')),
+        'ad_concurrency': max(1, int(os.getenv('AD_CONCURRENCY', '1'))),
+        'search_prefetch_depth': int(os.getenv('SEARCH_PREFETCH_DEPTH', '1')),
         'rate_limit': int(os.getenv('RATE_LIMIT_PER_MINUTE', '10')),
+        'rate_burst': max(1, int(os.getenv('RATE_BURST', '1'))),
         
         # Playwright
         'headless': os.getenv('PLAYWRIGHT_HEADLESS', 'true').lower() == 'true',
         'browser_type': os.getenv('BROWSER_TYPE', 'chromium'),
         'download_images': os.getenv('DOWNLOAD_IMAGES', 'true').lower() == 'true',
         'images_dir': os.getenv('IMAGES_DIR', './data/images'),
+        'image_max_size_mb': int(os.getenv('IMAGE_MAX_SIZE_MB', '10')),
+        'image_concurrency': int(os.getenv('IMAGE_CONCURRENCY', '4')),
+        'image_connections_per_host': int(os.getenv('IMAGE_CONNECTIONS_PER_HOST', '4')),
+        'image_store': os.getenv('IMAGE_STORE', 'true').lower() == 'true',
+        'image_index_path': os.getenv('IMAGE_INDEX_PATH', './data/image_index.sqlite3'),
+        'image_phash': os.getenv('IMAGE_PHASH', 'false').lower() == 'true',
+        'image_phash_distance': int(os.getenv('IMAGE_PHASH_DISTANCE', '5')),
+        'image_postprocess': os.getenv('IMAGE_POSTPROCESS', 'false').lower() == 'true',
+        'image_webp_quality': int(os.getenv('IMAGE_WEBP_QUALITY', '80')),  # 0 = исходный формат
+        'image_thumb_size': int(os.getenv('IMAGE_THUMB_SIZE', '320')),  # 0 = без миниатюр
+        'image_workers': int(os.getenv('IMAGE_WORKERS', '2')),
+        'image_capture': os.getenv('IMAGE_CAPTURE', 'false').lower() == 'true',
+        'image_capture_hosts': _env_list('IMAGE_CAPTURE_HOSTS', 'olxcdn.com'),
         'screenshot_on_error': os.getenv('SCREENSHOT_ON_ERROR', 'true').lower() == 'true',
+        'page_pool_size': int(os.getenv('PAGE_POOL_SIZE', '0')),  # 0 = AD_CONCURRENCY + 1
+        'page_max_uses': int(os.getenv('PAGE_MAX_USES', '50')),
+        'block_resources': os.getenv('BLOCK_RESOURCES', 'true').lower() == 'true',
+        'block_resource_types': _env_list('BLOCK_RESOURCE_TYPES', 'image,media,font'),
+        'block_domains': _env_list('BLOCK_DOMAINS') or None,  # None = встроенный список трекеров
+        'allow_domains': _env_list('ALLOW_DOMAINS'),
         
         # Llama
         'llama_url': os.getenv('LLAMA_WEB_URL', ''),
@@ -476,12 +870,49 @@ def load_config() -> Dict[str, Any]:
         'webhook_timeout': int(os.getenv('WEBHOOK_TIMEOUT', '30')),
         'webhook_retries': int(os.getenv('WEBHOOK_MAX_RETRIES', '3')),
         
+        # Конвейер scrape → analyze → deliver
+        'analyze_workers': max(1, int(os.getenv('ANALYZE_WORKERS', '1'))),
+        'deliver_workers': max(1, int(os.getenv('DELIVER_WORKERS', '2'))),
+        'pipeline_queue_size': max(1, int(os.getenv('PIPELINE_QUEUE_SIZE', '10'))),
+        
+        # Отдельные ведра rate limit (не расходуют лимит страниц OLX, 0 = без ограничения)
+        'image_rate_limit': int(os.getenv('IMAGE_RATE_LIMIT_PER_MINUTE', '120')),
+        'image_rate_burst': max(1, int(os.getenv('IMAGE_RATE_BURST', '10'))),
+        'llama_rate_limit': int(os.getenv('LLAMA_RATE_LIMIT_PER_MINUTE', '0')),
+        'llama_rate_burst': max(1, int(os.getenv('LLAMA_RATE_BURST', '1'))),
+        'webhook_rate_limit': int(os.getenv('WEBHOOK_RATE_LIMIT_PER_MINUTE', '60')),
+        'webhook_rate_burst': max(1, int(os.getenv('WEBHOOK_RATE_BURST', '5'))),
+        
         # Advanced
         'min_delay': float(os.getenv('MIN_DELAY', '0.8')),
         'max_delay': float(os.getenv('MAX_DELAY', '2.5')),
         'page_timeout': int(os.getenv('PAGE_TIMEOUT', '30')) * 1000,  # в миллисекундах
+        'ready_timeout': int(os.getenv('READY_TIMEOUT', '10')) * 1000,  # в миллисекундах
+        'fetch_engine': os.getenv('FETCH_ENGINE', 'browser').lower(),  # browser / http
+        'fast_path_required_fields': _env_list('FAST_PATH_REQUIRED_FIELDS', 'title,description'),
+        'scrape_mode': os.getenv('SCRAPE_MODE', 'full').lower(),  # full / listing
+        'listing_required_fields': _env_list('LISTING_REQUIRED_FIELDS', 'title,price,description'),
+        
+        # Incremental runs
+        'incremental': os.getenv('INCREMENTAL', 'false').lower() == 'true',
+        'seen_index_path': os.getenv('SEEN_INDEX_PATH', './data/seen_ads.sqlite3'),
+        'known_streak_stop': int(os.getenv('KNOWN_STREAK_STOP', '20')),
+        
+        # Фильтры поиска и ранняя остановка по времени последнего объявления
+        'search_filters_file': os.getenv('SEARCH_FILTERS_FILE', ''),
+        'search_sort': os.getenv('SEARCH_SORT', 'relevance').lower(),  # relevance / newest / cheapest / expensive
+        'search_watermark': os.getenv('SEARCH_WATERMARK', 'false').lower() == 'true',
+        
+        # Frontier запуска (дедупликация объявлений между запросами)
+        'frontier': os.getenv('FRONTIER', 'true').lower() == 'true',
+        'frontier_bloom_threshold': int(os.getenv('FRONTIER_BLOOM_THRESHOLD', '100000')),
+        'frontier_false_positive_rate': float(os.getenv('FRONTIER_FALSE_POSITIVE_RATE', '0.001')),
+        
         'respect_robots': os.getenv('RESPECT_ROBOTS', 'true').lower() == 'true',
         'robots_url': os.getenv('ROBOTS_URL', 'https://www.olx.pl/robots.txt'),
+        'robots_cache_path': os.getenv('ROBOTS_CACHE_PATH', './data/robots_cache.json'),
+        'robots_cache_ttl': int(os.getenv('ROBOTS_CACHE_TTL', '86400')),
+        'robots_retry_delay': int(os.getenv('ROBOTS_RETRY_DELAY', '300')),
         
         # Logging
         'log_level': os.getenv('LOG_LEVEL', 'INFO'),
@@ -494,6 +925,21 @@ def load_config() -> Dict[str, Any]:
         
         # Proxy
         'proxy': os.getenv('PROXY', None),
+        'proxy_list': _env_list('PROXY_LIST'),
+        
+        # Browser contexts (у каждого свой UA, прокси, cookies и rate limit)
+        'browser_contexts': int(os.getenv('BROWSER_CONTEXTS', '1')),
+        
+        # Multi-process mode (запросы распределяются между процессами)
+        'worker_processes': int(os.getenv('WORKER_PROCESSES', '1')),
+        'global_rate_limit': int(os.getenv('GLOBAL_RATE_LIMIT_PER_MINUTE', '0')),  # 0 = RATE_LIMIT_PER_MINUTE
+        
+        # Общий бюджет между экземплярами: memory (только воркеры одного запуска) / sqlite / redis
+        'rate_limit_backend': os.getenv('RATE_LIMIT_BACKEND', 'memory').lower(),
+        'rate_limit_state_path': os.getenv('RATE_LIMIT_STATE_PATH', './data/rate_limit.sqlite'),
+        'redis_url': os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+        'captcha_cooldown': float(os.getenv('CAPTCHA_COOLDOWN', '60')),
+        'worker_max_restarts': int(os.getenv('WORKER_MAX_RESTARTS', '3')),
         
         # CAPTCHA
         'captcha_dir': os.getenv('CAPTCHA_SCREENSHOT_DIR', './data/captcha_screenshots'),
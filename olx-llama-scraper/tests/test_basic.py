@@ -68,6 +68,22 @@ class TestUtils:
         # Без ID
         url = "https://www.olx.pl/d/oferty/"
         assert extract_id_from_url(url) is None
+        
+        # ID категории (CID) не должен приниматься за ID объявления
+        url = "https://www.olx.pl/d/oferty/rtx-3060-CID99-IDxyz789.html?reason=extended"
+        assert extract_id_from_url(url) == "xyz789"
+        
+        # Карточки выдачи: /d/oferta/ с параметрами и без
+        base = "https://www.olx.pl/d/oferta/karta-graficzna-rtx-3060-12gb-CID99-ID10aBc3.html"
+        assert extract_id_from_url(base) == "10aBc3"
+        assert extract_id_from_url(base + "?reason=extended_search_extended_distance") == "10aBc3"
+        assert extract_id_from_url(base + "?reason=observed_ad&search_reason=search%7Corganic") == "10aBc3"
+        assert extract_id_from_url(base + "#gallery") == "10aBc3"
+        assert extract_id_from_url("/d/oferta/karta-CID99-ID10aBc3.html") == "10aBc3"
+        
+        # Только категория или ID в параметрах - не объявление
+        assert extract_id_from_url("https://www.olx.pl/elektronika/q-rtx-CID99/") is None
+        assert extract_id_from_url("https://www.olx.pl/d/oferty/?search[ID]=1") is None
     
     def test_is_captcha_present(self):
         """Тест обнаружения CAPTCHA"""
@@ -83,6 +99,23 @@ class TestUtils:
         html = "<div class='h-captcha'></div>"
         assert is_captcha_present(html) is True
     
+    def test_timing_stats_summary(self):
+        """Тест телеметрии ожиданий"""
+        from src.utils import TimingStats
+        
+        stats = TimingStats()
+        for seconds in [0.1, 0.2, 0.3, 0.4, 2.0]:
+            stats.record('ad_ready', seconds)
+        
+        summary = stats.summary('ad_ready')
+        assert summary['count'] == 5
+        assert summary['p50'] == 0.3
+        assert summary['max'] == 2.0
+        
+        # Пустая метрика
+        assert stats.summary('search_ready')['count'] == 0
+        assert 'ad_ready' in stats.format_summary()
+    
     def test_sanitize_filename(self):
         """Тест очистки имён файлов"""
         # Небезопасные символы
@@ -97,6 +130,216 @@ class TestUtils:
         assert len(result) == 100
 
 
+class TestRateLimiter:
+    """
+    Тесты для token bucket rate limiter
+    """
+    
+    @pytest.mark.asyncio
+    async def test_burst_then_wait(self):
+        """Тест: burst запросов без пауз, затем ожидание токена"""
+        import time
+        from src.utils import RateLimiter
+        
+        limiter = RateLimiter(calls_per_minute=600, min_delay=0, max_delay=0, burst=3, name='test')
+        
+        start = time.monotonic()
+        for _ in range(3):
+            await limiter.wait()
+        assert time.monotonic() - start < 0.05
+        
+        # Ведро пустое: следующий токен через 60/600 = 0.1 сек
+        start = time.monotonic()
+        await limiter.wait()
+        assert time.monotonic() - start >= 0.09
+        
+        assert limiter.timings.summary('wait')['count'] == 4
+    
+    def test_aimd(self):
+        """Тест: CAPTCHA/429 снижает скорость вдвое, успехи возвращают её"""
+        from src.utils import RateLimiter
+        
+        limiter = RateLimiter(calls_per_minute=60, burst=5, name='test')
+        
+        limiter.penalize()
+        limiter.penalize()
+        assert limiter.rate == pytest.approx(0.25)
+        assert limiter.tokens < 1
+        
+        for _ in range(20):
+            limiter.reward()
+        assert limiter.rate == pytest.approx(1.0)
+        
+        # Скорость не падает ниже MIN_RATE_FACTOR
+        for _ in range(20):
+            limiter.penalize()
+        assert limiter.rate == pytest.approx(RateLimiter.MIN_RATE_FACTOR)
+    
+    @pytest.mark.asyncio
+    async def test_unlimited_bucket(self):
+        """Тест: 0 вызовов в минуту - без ограничения"""
+        from src.utils import RateLimiter
+        
+        limiter = RateLimiter(calls_per_minute=0, min_delay=0, max_delay=0, name='llama')
+        for _ in range(100):
+            await limiter.wait()
+        
+        assert limiter.penalties == 0
+    
+    @pytest.mark.asyncio
+    async def test_blocking_budget_runs_off_loop(self):
+        """Тест: блокирующие reserve()/start_cooldown() бюджета не останавливают event loop"""
+        import time
+        import asyncio
+        from src.utils import RateLimiter
+        
+        class SlowBudget:
+            def __init__(self):
+                self.cooldowns = []
+            
+            def reserve(self):
+                time.sleep(0.2)
+                return 0.0
+            
+            def start_cooldown(self, seconds):
+                time.sleep(0.2)
+                self.cooldowns.append(seconds)
+        
+        budget = SlowBudget()
+        limiter = RateLimiter(calls_per_minute=0, budget=budget, name='test', cooldown=30)
+        ticks = 0
+        
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+        
+        task = asyncio.create_task(ticker())
+        await limiter.wait()
+        assert ticks >= 5
+        
+        ticks = 0
+        limiter.penalize()
+        await asyncio.sleep(0.3)
+        task.cancel()
+        
+        assert ticks >= 5
+        assert budget.cooldowns == [30]
+        assert not limiter._cooldowns
+
+
+class TestRobotsParser:
+    """
+    Тесты для асинхронного robots.txt с кешем
+    """
+    
+    ROBOTS_URL = 'https://www.olx.pl/robots.txt'
+    ROBOTS_TXT = "User-agent: *\nDisallow: /konto/\nDisallow: /d/oferty/*?*search%5Bphotos%5D\nDisallow: /d/oferta/*promo\n"
+    
+    @pytest.mark.asyncio
+    async def test_disk_cache_and_memo(self, tmp_path):
+        """Тест: свежий кеш с диска без сети, решения запоминаются по префиксу"""
+        import time
+        from src.utils import RobotsParser
+        
+        cache_path = tmp_path / 'robots.json'
+        cache_path.write_text(json.dumps({'url': self.ROBOTS_URL, 'fetched_at': time.time(), 'text': self.ROBOTS_TXT}))
+        
+        robots = RobotsParser(self.ROBOTS_URL, cache_path=str(cache_path), memo_size=2)
+        
+        async def no_network():
+            raise AssertionError("robots.txt must come from cache")
+        robots._fetch = no_network
+        
+        assert await robots.can_fetch('https://www.olx.pl/d/oferty/iphone-CID99-ID1.html') is True
+        assert await robots.can_fetch('https://www.olx.pl/konto/settings') is False
+        assert await robots.can_fetch('https://www.olx.pl/d/oferty/q-x/?search%5Bphotos%5D=1') is False
+        
+        # LRU ограничен memo_size
+        assert len(robots.memo) == 2
+    
+    @pytest.mark.asyncio
+    async def test_memo_matches_fresh_check(self, tmp_path):
+        """Тест: решение для соседнего URL того же каталога не берётся из LRU"""
+        import time
+        from src.utils import RobotsParser
+        
+        cache_path = tmp_path / 'robots.json'
+        cache_path.write_text(json.dumps({'url': self.ROBOTS_URL, 'fetched_at': time.time(), 'text': self.ROBOTS_TXT}))
+        
+        robots = RobotsParser(self.ROBOTS_URL, cache_path=str(cache_path))
+        urls = [
+            'https://www.olx.pl/d/oferta/gpu-IDabc.html',
+            'https://www.olx.pl/d/oferta/promo',
+            'https://www.olx.pl/d/oferty/q-x/?search%5Border%5D=1',
+            'https://www.olx.pl/d/oferty/q-x/?search%5Bphotos%5D=1'
+        ]
+        
+        for _ in range(2):
+            for url in urls:
+                assert await robots.can_fetch(url) == robots.parser.is_allowed('*', url)
+        
+        assert await robots.can_fetch(urls[1]) is False
+        
+        # Объявления одного каталога с одинаковыми правилами - одна запись LRU
+        memo_size = len(robots.memo)
+        for n in range(20):
+            assert await robots.can_fetch(f'https://www.olx.pl/d/oferta/gpu-CID99-ID{n}.html?reason=observed_ad') is True
+        assert len(robots.memo) == memo_size
+        assert await robots.can_fetch('https://www.olx.pl/d/oferta/gpu-ID5.html?ref=promo') is False
+    
+    @pytest.mark.asyncio
+    async def test_malformed_cache_is_stale(self, tmp_path):
+        """Тест: кеш без fetched_at считается устаревшим, а не роняет загрузку"""
+        from src.utils import RobotsParser
+        
+        cache_path = tmp_path / 'robots.json'
+        cache_path.write_text(json.dumps({'url': self.ROBOTS_URL, 'text': self.ROBOTS_TXT}))
+        
+        robots = RobotsParser(self.ROBOTS_URL, cache_path=str(cache_path))
+        calls = []
+        
+        async def failing_fetch():
+            calls.append(1)
+            raise OSError("connection reset")
+        robots._fetch = failing_fetch
+        
+        # Загрузка не удалась - используется устаревший кеш
+        assert await robots.can_fetch('https://www.olx.pl/konto/') is False
+        assert calls == [1]
+        
+        cache_path.write_text(json.dumps(['not', 'a', 'cache']))
+        assert robots._read_cache() is None
+    
+    @pytest.mark.asyncio
+    async def test_failed_fetch_backs_off(self, tmp_path):
+        """Тест: ошибка загрузки не повторяется на каждом URL"""
+        from src.utils import RobotsParser
+        
+        robots = RobotsParser(self.ROBOTS_URL, cache_path=str(tmp_path / 'robots.json'), retry_delay=60)
+        calls = []
+        
+        async def failing_fetch():
+            calls.append(1)
+            raise OSError("connection reset")
+        robots._fetch = failing_fetch
+        
+        for index in range(5):
+            assert await robots.can_fetch(f'https://www.olx.pl/d/oferty/ad-ID{index}.html') is True
+        
+        assert len(calls) == 1
+        
+        # Успешная загрузка после паузы сохраняется на диск
+        async def fetch():
+            return self.ROBOTS_TXT
+        robots._fetch = fetch
+        robots.expires_at = 0
+        
+        assert await robots.can_fetch('https://www.olx.pl/konto/') is False
+        assert json.loads((tmp_path / 'robots.json').read_text())['text'] == self.ROBOTS_TXT
+
+
 class TestRating:
     """
     Тесты для системы рейтинга
@@ -290,6 +533,1469 @@ class TestScraper:
         # Вторая страница
         url = scraper._build_search_url('rtx 3060', 2)
         assert 'page=2' in url
+    
+    def test_browser_slots_sharding(self):
+        """Тест слотов браузера: свои UA/прокси, стабильное распределение URL"""
+        from src.scraper import OLXScraper
+        from src.browser import pick_slot
+        
+        config = {
+            'rate_limit': 10,
+            'min_delay': 0,
+            'max_delay': 0,
+            'respect_robots': False,
+            'browser_contexts': 3,
+            'proxy_list': ['http://p1:8080', 'http://p2:8080']
+        }
+        
+        scraper = OLXScraper(config, ['ua-1', 'ua-2', 'ua-3'])
+        slots = scraper.slots
+        
+        assert len({slot.user_agent for slot in slots}) == 3
+        assert [slot.proxy for slot in slots] == ['http://p1:8080', 'http://p2:8080', 'http://p1:8080']
+        assert len({id(slot.rate_limiter) for slot in slots}) == 3
+        
+        # Все страницы одного поиска - в одном контексте
+        first = scraper._build_search_url('rtx 3060', 1)
+        second = scraper._build_search_url('rtx 3060', 2)
+        assert pick_slot(slots, first) is pick_slot(slots, second)
+        
+        # Объявления распределяются по нескольким контекстам
+        urls = [f"https://www.olx.pl/d/oferta/ad-CID99-ID{n}.html" for n in range(30)]
+        assert len({pick_slot(slots, url).index for url in urls}) > 1
+    
+    @pytest.mark.asyncio
+    async def test_ads_batch_keeps_order_and_concurrency(self):
+        """Тест параллельного парсинга: порядок результатов и лимит страниц"""
+        import asyncio
+        from src.scraper import OLXScraper
+        
+        config = {
+            'rate_limit': 6000,
+            'min_delay': 0,
+            'max_delay': 0,
+            'respect_robots': False,
+            'ad_concurrency': 3
+        }
+        
+        scraper = OLXScraper(config, ['test-agent'])
+        
+        in_flight = 0
+        max_in_flight = 0
+        
+        async def fake_scrape_ad_page(url, search_query):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            # Первые объявления отвечают дольше последних
+            await asyncio.sleep(0.01 * (10 - int(url)))
+            in_flight -= 1
+            return None if url == '4' else {'url': url, 'title': url}
+        
+        scraper._scrape_ad_page = fake_scrape_ad_page
+        
+        cards = [{'url': str(i), 'id': str(i), 'listing': None} for i in range(8)]
+        ads = await scraper._scrape_ads_batch(cards, 'test')
+        
+        assert [ad['url'] for ad in ads] == ['0', '1', '2', '3', '5', '6', '7']
+        assert max_in_flight <= 3
+    
+    @pytest.mark.asyncio
+    async def test_search_pages_prefetched(self):
+        """Тест read-ahead: следующая страница выдачи грузится до окончания текущей"""
+        import asyncio
+        from src.scraper import OLXScraper
+        
+        config = {
+            'rate_limit': 6000,
+            'min_delay': 0,
+            'max_delay': 0,
+            'respect_robots': False,
+            'search_prefetch_depth': 1
+        }
+        
+        scraper = OLXScraper(config, ['test-agent'])
+        events = []
+        
+        async def fake_scrape_search_page(url):
+            page = int(url.split('page=')[1]) if 'page=' in url else 1
+            events.append(f"search {page}")
+            if page > 3:
+                return []
+            return [{'url': f"{page}-{n}", 'id': f"{page}-{n}", 'listing': None} for n in range(2)]
+        
+        async def fake_scrape_ad_page(url, search_query):
+            await asyncio.sleep(0.01)
+            events.append(f"ad {url}")
+            return {'url': url, 'title': url}
+        
+        scraper._scrape_search_page = fake_scrape_search_page
+        scraper._scrape_ad_page = fake_scrape_ad_page
+        
+        ads = await scraper.scrape_search_query('gpu', max_ads=5)
+        
+        assert [ad['url'] for ad in ads] == ['1-0', '1-1', '2-0', '2-1', '3-0']
+        
+        # Страница 2 запрошена до того, как закончились объявления страницы 1
+        assert events.index('search 2') < events.index('ad 1-1')
+        
+        # max_ads достигнут на странице 3 - дальше не листаем
+        assert 'search 5' not in events
+    
+    @pytest.mark.asyncio
+    async def test_iter_search_query_streams_and_cancels(self):
+        """Тест: объявление отдаётся до окончания пачки, aclose() отменяет остальные"""
+        import asyncio
+        from src.scraper import OLXScraper
+        
+        config = {
+            'rate_limit': 6000,
+            'min_delay': 0,
+            'max_delay': 0,
+            'respect_robots': False,
+            'rate_burst': 10,
+            'ad_concurrency': 4,
+            'search_prefetch_depth': 0
+        }
+        
+        scraper = OLXScraper(config, ['test-agent'])
+        cancelled = []
+        
+        async def fake_scrape_search_page(url):
+            return [{'url': str(n), 'id': str(n), 'listing': None} for n in range(4)]
+        
+        async def fake_scrape_ad_page(url, search_query):
+            try:
+                await asyncio.sleep(0 if url == '0' else 10)
+            except asyncio.CancelledError:
+                cancelled.append(url)
+                raise
+            return {'url': url, 'title': url}
+        
+        scraper._scrape_search_page = fake_scrape_search_page
+        scraper._scrape_ad_page = fake_scrape_ad_page
+        
+        ads = scraper.iter_search_query('gpu', max_ads=4)
+        
+        first = await asyncio.wait_for(ads.__anext__(), timeout=1)
+        assert first['url'] == '0'
+        
+        await ads.aclose()
+        
+        assert sorted(cancelled) == ['1', '2', '3']
+    
+    @pytest.mark.asyncio
+    async def test_listing_mode_skips_complete_cards(self):
+        """Тест listing mode: страница открывается только для неполных карточек"""
+        from src.scraper import OLXScraper
+        
+        config = {
+            'rate_limit': 6000,
+            'min_delay': 0,
+            'max_delay': 0,
+            'respect_robots': False,
+            'download_images': False,
+            'scrape_mode': 'listing'
+        }
+        
+        scraper = OLXScraper(config, ['test-agent'])
+        
+        visited = []
+        
+        async def fake_scrape_ad_page(url, search_query):
+            visited.append(url)
+            return {'url': url, 'title': 'from page'}
+        
+        scraper._scrape_ad_page = fake_scrape_ad_page
+        
+        complete = {'title': 'GPU', 'price': 100, 'description': 'ok', 'images': []}
+        cards = [
+            {'url': 'https://www.olx.pl/d/oferty/IDa1.html', 'id': 'a1', 'listing': complete},
+            {'url': 'https://www.olx.pl/d/oferty/IDb2.html', 'id': 'b2', 'listing': {'title': 'No price'}},
+            {'url': 'https://www.olx.pl/d/oferty/IDc3.html', 'id': 'c3', 'listing': None}
+        ]
+        
+        ads = await scraper._scrape_ads_batch(cards, 'gpu')
+        
+        assert [ad['title'] for ad in ads] == ['GPU', 'from page', 'from page']
+        assert visited == [cards[1]['url'], cards[2]['url']]
+    
+    @pytest.mark.asyncio
+    async def test_discover_queries_merges_duplicates(self):
+        """Тест frontier: общее объявление парсится один раз и помечается всеми запросами"""
+        from src.scraper import OLXScraper
+        
+        config = {
+            'rate_limit': 6000,
+            'min_delay': 0,
+            'max_delay': 0,
+            'respect_robots': False,
+            'rate_burst': 10,
+            'search_queries': ['gpu', 'rtx'],
+            'max_ads': 3
+        }
+        
+        scraper = OLXScraper(config, ['test-agent'])
+        results = {'gpu': [1, 2, 3, 5], 'rtx': [2, 3, 4]}
+        visited = []
+        
+        async def fake_scrape_search_page(url):
+            if 'page=' in url:
+                return []
+            query = 'gpu' if 'q-gpu' in url else 'rtx'
+            return [
+                {'url': f"https://www.olx.pl/d/oferta/ad-CID99-ID{n}.html", 'id': str(n), 'listing': None}
+                for n in results[query]
+            ]
+        
+        async def fake_scrape_ad_page(url, search_query):
+            visited.append(url)
+            return {'url': url, 'title': url, 'search_query': search_query}
+        
+        scraper._scrape_search_page = fake_scrape_search_page
+        scraper._scrape_ad_page = fake_scrape_ad_page
+        
+        cards = await scraper.discover_queries(['gpu', 'rtx'], max_ads=3)
+        ads = [ad async for ad in scraper.iter_cards(cards)]
+        
+        # Объявление 5 не влезло в max_ads запроса gpu и не попало в frontier;
+        # 2 и 3 rtx не парсит повторно, но помечает
+        assert [card['id'] for card in cards] == ['1', '2', '3', '4']
+        assert len(visited) == 4
+        assert [ad['search_query'] for ad in ads] == [['gpu'], ['gpu', 'rtx'], ['gpu', 'rtx'], ['rtx']]
+        assert scraper.fetch_stats['duplicate'] == 2
+        assert not scraper.frontier.pending
+
+
+class TestExtraction:
+    """
+    Тесты для схемы извлечения полей объявления
+    """
+    
+    def test_build_ad_record_full(self):
+        """Тест сборки записи из полного набора полей"""
+        from src.extraction import build_ad_record, SCHEMA_VERSION
+        
+        raw = {
+            'title': '  RTX 3060   12GB ',
+            'price': '1 299 zł',
+            'description': 'Karta\n\nw dobrym stanie',
+            'location_date': 'Warszawa, Mokotów - Dzisiaj o 12:00',
+            'images': [
+                'https://cdn.olx.pl/1.jpg',
+                'https://cdn.olx.pl/1.jpg',
+                '/static/placeholder.svg',
+                'https://cdn.olx.pl/2.jpg'
+            ]
+        }
+        
+        data = build_ad_record(raw, 'https://www.olx.pl/d/oferty/IDabc123.html', 'rtx 3060')
+        
+        assert data['id'] == 'abc123'
+        assert data['title'] == 'RTX 3060 12GB'
+        assert data['price'] == 1299.0
+        assert data['currency'] == 'PLN'
+        assert data['description'] == 'Karta w dobrym stanie'
+        assert data['location'] == 'Warszawa, Mokotów'
+        assert data['date'] == 'Dzisiaj o 12:00'
+        assert data['images'] == ['https://cdn.olx.pl/1.jpg', 'https://cdn.olx.pl/2.jpg']
+        assert data['schema_version'] == SCHEMA_VERSION
+    
+    def test_build_ad_record_missing_fields(self):
+        """Тест: отсутствующие поля дают пустые значения без ошибок"""
+        from src.extraction import build_ad_record
+        
+        raw = {'title': None, 'price': None, 'description': None, 'location_date': None, 'images': []}
+        
+        data = build_ad_record(raw, 'https://www.olx.pl/d/oferty/IDx1.html', 'test')
+        
+        assert data['title'] == ""
+        assert data['price'] is None
+        assert data['currency'] is None
+        assert data['location'] == ""
+        assert data['date'] == ""
+        assert data['images'] == []
+    
+    
+    def test_parse_ad_html_matches_schema(self):
+        """Тест парсинга HTML объявления (HTTP fast path)"""
+        from src.extraction import parse_ad_html, build_ad_record, missing_fields, AD_FIELDS
+        
+        html = """
+        <html><body>
+            <h1>Laptop Dell</h1>
+            <h3 data-testid="ad-price-container">2 500 zł</h3>
+            <div data-testid="location-date">Kraków - 18 października 2025</div>
+            <div data-testid="swiper-image-slide"><img src="https://cdn.olx.pl/a.jpg"></div>
+        </body></html>
+        """
+        
+        raw = parse_ad_html(html)
+        
+        assert set(raw) == set(AD_FIELDS)
+        assert raw['description'] is None
+        assert raw['images'] == ['https://cdn.olx.pl/a.jpg']
+        
+        data = build_ad_record(raw, 'https://www.olx.pl/d/oferty/IDq1.html', 'laptop')
+        assert data['price'] == 2500.0
+        assert data['location'] == 'Kraków'
+        
+        # Без описания fast path должен уступить браузеру
+        assert missing_fields(data, ['title', 'description']) == ['description']
+    
+    def test_parse_search_html(self):
+        """Тест извлечения ссылок из HTML выдачи"""
+        from src.extraction import parse_search_html
+        
+        html = """
+        <div data-cy="l-card"><a href="/d/oferty/gpu-IDa1.html">GPU</a></div>
+        <div data-cy="l-card"><a href="/d/oferty/gpu-IDa1.html">GPU</a></div>
+        <div data-cy="l-card"><a href="https://www.olx.pl/d/oferty/cpu-IDb2.html">CPU</a></div>
+        <a href="/d/oferty/promo-IDc3.html">not a card</a>
+        """
+        
+        urls = parse_search_html(html, 'https://www.olx.pl')
+        
+        assert urls == [
+            'https://www.olx.pl/d/oferty/gpu-IDa1.html',
+            'https://www.olx.pl/d/oferty/cpu-IDb2.html'
+        ]
+    
+    
+    def test_listing_record_from_prerendered_state(self):
+        """Тест сборки объявлений из JSON состояния страницы поиска"""
+        import json
+        from src.extraction import parse_prerendered_state, listings_from_state, build_listing_record
+        
+        state = {
+            'listing': {'listing': {'ads': [{
+                'url': 'https://www.olx.pl/d/oferty/rtx-3060-CID99-IDgpu1.html',
+                'title': 'RTX 3060',
+                'description': 'Karta<br />sprawna',
+                'price': {'regularPrice': {'value': 1200, 'currencyCode': 'PLN'}},
+                'location': {'cityName': 'Gdańsk'},
+                'createdTime': '2025-10-18T10:00:00+02:00',
+                'lastRefreshTime': '2025-10-18T12:00:00+02:00',
+                'photos': ['https://cdn.olx.pl/v1/files/p1/image;s={width}x{height}']
+            }]}}
+        }
+        html = f'<script>window.__PRERENDERED_STATE__= {json.dumps(json.dumps(state))};</script>'
+        
+        listings = listings_from_state(parse_prerendered_state(html))
+        assert list(listings) == ['gpu1']
+        
+        record = build_listing_record(listings['gpu1'], listings['gpu1']['url'], 'rtx 3060')
+        
+        assert record['id'] == 'gpu1'
+        assert record['price'] == 1200.0
+        assert record['currency'] == 'PLN'
+        assert record['description'] == 'Karta sprawna'
+        assert record['location'] == 'Gdańsk'
+        assert record['last_refresh'] == '2025-10-18T12:00:00+02:00'
+        assert record['images'] == ['https://cdn.olx.pl/v1/files/p1/image;s=1000x750']
+        assert record['source'] == 'listing'
+        
+        # Страница без состояния
+        assert parse_prerendered_state('<html></html>') is None
+
+
+class TestSeenAdIndex:
+    """
+    Тесты для индекса объявлений из прошлых запусков
+    """
+    
+    def test_remember_and_persist(self, tmp_path):
+        """Тест сохранения объявлений между запусками"""
+        from src.storage import SeenAdIndex, ad_fingerprint
+        
+        path = str(tmp_path / 'seen.sqlite3')
+        ad = {'id': 'a1', 'url': 'https://www.olx.pl/d/oferty/IDa1.html', 'title': 'GPU', 'price': 100.0, 'images': []}
+        
+        index = SeenAdIndex(path)
+        assert index.is_known('a1') is False
+        index.remember(ad)
+        index.close()
+        
+        # Новый запуск видит объявление
+        index = SeenAdIndex(path)
+        record = index.get('a1')
+        assert record['fingerprint'] == ad_fingerprint(ad)
+        assert index.is_known(None) is False
+        index.close()
+    
+    def test_known_streak_stops_pagination(self, tmp_path):
+        """Тест: известные объявления пропускаются, длинная серия останавливает листание"""
+        from src.scraper import OLXScraper
+        
+        config = {
+            'rate_limit': 10,
+            'min_delay': 0,
+            'max_delay': 0,
+            'respect_robots': False,
+            'incremental': True,
+            'seen_index_path': str(tmp_path / 'seen.sqlite3'),
+            'known_streak_stop': 2
+        }
+        
+        scraper = OLXScraper(config, ['test-agent'])
+        for ad_id in ['k1', 'k2', 'k3']:
+            scraper.seen_index.remember({'id': ad_id, 'title': ad_id})
+        
+        cards = [{'id': ad_id, 'url': ad_id} for ad_id in ['k1', 'n1', 'k2', 'k3', 'n2']]
+        
+        fresh, streak, reached = scraper._skip_known(cards, 0)
+        
+        assert [card['id'] for card in fresh] == ['n1']
+        assert streak == 2
+        assert reached is True
+        
+        scraper.seen_index.close()
+    
+    def test_detect_change_from_card(self, tmp_path):
+        """Тест определения изменений известного объявления по карточке"""
+        from src.storage import SeenAdIndex
+        
+        index = SeenAdIndex(str(tmp_path / 'seen.sqlite3'))
+        index.remember({
+            'id': 'a1',
+            'title': 'RTX 3060',
+            'price': 1200.0,
+            'images': ['https://img/1.jpg'],
+            'last_refresh': '2024-01-01T10:00:00'
+        })
+        
+        listing = {'title': ' RTX 3060 ', 'price': 1200, 'images': ['https://img/1.jpg'], 'last_refresh': '2024-01-02T10:00:00'}
+        
+        # Поднятое объявление без изменений
+        assert index.detect_change({'id': 'a1', 'listing': listing}) is None
+        
+        # Цена изменилась
+        change = index.detect_change({'id': 'a1', 'listing': dict(listing, price=999)})
+        assert change == {'event': 'price_changed', 'previous_price': 1200.0}
+        
+        # Новые фото
+        change = index.detect_change({'id': 'a1', 'listing': dict(listing, images=['https://img/1.jpg', 'https://img/2.jpg'])})
+        assert change['event'] == 'updated'
+        
+        # Новое объявление и карточка без данных
+        assert index.detect_change({'id': 'b2', 'listing': listing}) is None
+        assert index.detect_change({'id': 'a1'}) is None
+        
+        index.close()
+    
+    @pytest.mark.asyncio
+    async def test_remember_uses_card_fingerprint(self, tmp_path):
+        """Тест: отпечаток доставленного объявления берётся с карточки, а не со страницы"""
+        from src.scraper import OLXScraper
+        
+        config = {
+            'rate_limit': 6000,
+            'min_delay': 0,
+            'max_delay': 0,
+            'respect_robots': False,
+            'incremental': True,
+            'seen_index_path': str(tmp_path / 'seen.sqlite3')
+        }
+        
+        scraper = OLXScraper(config, ['test-agent'])
+        listing = {'title': 'RTX 3060', 'price': 1200, 'images': ['https://img/1.jpg'], 'last_refresh': '2024-01-01T10:00:00'}
+        card = {'url': 'https://www.olx.pl/d/oferta/rtx-CID99-IDa1.html', 'id': 'a1', 'listing': listing}
+        
+        async def fake_scrape_ad_page(url, search_query):
+            # Галерея страницы отдаёт больше слайдов, чем карточка
+            images = ['https://img/1.jpg', 'https://img/1.jpg', 'https://img/2.jpg']
+            return {'url': url, 'id': 'a1', 'title': 'RTX 3060', 'price': 1200.0, 'images': images}
+        
+        scraper._scrape_ad_page = fake_scrape_ad_page
+        
+        ads = [ad async for ad in scraper.iter_cards([card])]
+        scraper.seen_index.remember(ads[0])
+        
+        # Поднятое, но не изменённое объявление не считается обновлённым
+        refreshed = {'id': 'a1', 'listing': dict(listing, last_refresh='2024-01-02T10:00:00')}
+        assert scraper.seen_index.detect_change(refreshed) is None
+        
+        scraper.seen_index.close()
+
+
+class TestFrontier:
+    """
+    Тесты для frontier запуска
+    """
+    
+    def test_admit_tags_pending_duplicates(self):
+        """Тест: повтор помечается запросом, пока объявление не спарсено"""
+        from src.frontier import UrlFrontier
+        
+        frontier = UrlFrontier(expected_items=10)
+        card = {'url': 'https://www.olx.pl/d/oferta/ad-CID99-IDabc1.html', 'id': 'abc1'}
+        
+        assert frontier.admit(card, 'gpu')
+        assert not frontier.admit({'url': card['url'] + '?reason=promoted', 'id': 'abc1'}, 'rtx')
+        assert card['queries'] == ['gpu', 'rtx']
+        
+        frontier.release(card)
+        assert not frontier.admit(dict(card), 'gtx')
+        assert card['queries'] == ['gpu', 'rtx']
+        assert frontier.stats == {'admitted': 1, 'duplicates': 2}
+        assert card['url'] in frontier
+        
+        # Не спарсилось - следующий запрос может взять объявление снова
+        failed = {'url': 'https://www.olx.pl/d/oferta/rtx-3060-CID99-IDdef2.html', 'id': 'def2'}
+        assert frontier.admit(failed, 'gpu')
+        frontier.release(failed, failed=True)
+        assert failed['url'] not in frontier
+        assert frontier.admit(dict(failed), 'rtx')
+    
+    def test_bloom_backend_for_large_runs(self):
+        """Тест: фильтр Блума без ложноотрицательных и с малой долей ложноположительных"""
+        from src.frontier import UrlFrontier
+        
+        frontier = UrlFrontier(expected_items=2000, bloom_threshold=1000, false_positive_rate=0.01)
+        assert frontier.bloom
+        
+        for n in range(2000):
+            frontier.admit({'url': f"https://www.olx.pl/d/oferta/ID{n}.html"}, 'gpu')
+            frontier.release({'url': f"https://www.olx.pl/d/oferta/ID{n}.html"})
+        
+        # Ложное срабатывание при вставке - объявление пропускается как повтор
+        assert frontier.stats['admitted'] > 1940
+        assert all(f"https://www.olx.pl/d/oferta/ID{n}.html" in frontier for n in range(2000))
+        
+        false_positives = sum(f"https://www.olx.pl/d/oferta/IDx{n}.html" in frontier for n in range(2000))
+        assert false_positives < 60
+
+
+class TestSearch:
+    """
+    Тесты для фильтров поиска и отметки последнего объявления
+    """
+    
+    def test_build_search_url_with_filters(self):
+        """Тест URL выдачи: категория и место в пути, остальное - параметры search[...]"""
+        from src.search import build_search_url, normalize_filters
+        
+        filters = normalize_filters({
+            'category': 'elektronika/komputery',
+            'city': 'warszawa',
+            'distance': 30,
+            'price_from': 800,
+            'price_to': 1500.5,
+            'condition': 'used',
+            'sort': 'newest'
+        })
+        url = build_search_url('https://www.olx.pl', 'rtx 3060', 2, filters)
+        
+        assert url.startswith('https://www.olx.pl/d/elektronika/komputery/warszawa/q-rtx+3060/?')
+        assert 'search[filter_float_price:from]=800&search[filter_float_price:to]=1500.5' in url
+        assert 'search[dist]=30' in url
+        assert 'search[filter_enum_state][0]=used' in url
+        assert 'search[order]=created_at:desc' in url
+        assert url.endswith('&page=2')
+        
+        # Без фильтров - прежний URL; радиус без города не передаётся
+        assert build_search_url('https://www.olx.pl', 'gpu') == 'https://www.olx.pl/d/oferty/q-gpu/'
+        url = build_search_url('https://www.olx.pl', 'gpu', 1, {'region': 'mazowieckie', 'distance': 30})
+        assert url == 'https://www.olx.pl/d/mazowieckie/q-gpu/'
+    
+    def test_load_search_filters_per_query(self, tmp_path):
+        """Тест файла фильтров: "*" для всех запросов, проверка значений"""
+        from src.search import load_search_filters, filters_for_query
+        
+        path = tmp_path / 'filters.json'
+        path.write_text(json.dumps({'*': {'price_to': 2000}, 'RTX 3060': {'city': 'krakow', 'condition': ['new', 'used']}}))
+        
+        filters = load_search_filters(str(path))
+        merged = filters_for_query(filters, 'rtx 3060', {'sort': 'newest'})
+        
+        assert merged == {'sort': 'newest', 'price_to': 2000, 'city': 'krakow', 'condition': ['new', 'used']}
+        assert filters_for_query(filters, 'gpu') == {'price_to': 2000}
+        assert load_search_filters(str(tmp_path / 'missing.json')) == {}
+        
+        path.write_text(json.dumps({'gpu': {'condition': 'broken'}}))
+        with pytest.raises(ValueError):
+            load_search_filters(str(path))
+    
+    def test_default_sort_and_watermark_time(self):
+        """Тест: по умолчанию порядок OLX; отметка сравнивается по времени создания"""
+        from src.scraper import OLXScraper
+        from src.search import SearchWatermark
+        
+        scraper = OLXScraper({'rate_limit': 6000, 'min_delay': 0, 'max_delay': 0, 'respect_robots': False}, ['test-agent'])
+        assert 'search[order]' not in scraper._build_search_url('gpu')
+        
+        # Старое объявление, поднятое (last_refresh) после отметки, стоит ниже неё в created_at:desc
+        watermark = SearchWatermark('key', '2026-10-18T12:00:00+02:00')
+        cards = [
+            {'url': 'u3', 'id': '3', 'listing': {'date': '2026-10-18T13:00:00+02:00'}},
+            {'url': 'u1', 'id': '1', 'listing': {'date': '2026-10-18T11:00:00+02:00', 'last_refresh': '2026-10-18T14:00:00+02:00'}}
+        ]
+        
+        assert [card['id'] for card in watermark.cut(cards)] == ['3']
+        assert watermark.reached
+    
+    @pytest.mark.asyncio
+    async def test_watermark_stops_pagination(self, tmp_path):
+        """Тест: второй запуск листает выдачу только до самого нового объявления первого"""
+        from src.scraper import OLXScraper
+        from src.utils import extract_id_from_url
+        
+        config = {
+            'rate_limit': 6000,
+            'min_delay': 0,
+            'max_delay': 0,
+            'respect_robots': False,
+            'rate_burst': 10,
+            'search_prefetch_depth': 0,
+            'incremental': True,
+            'seen_index_path': str(tmp_path / 'seen.sqlite3'),
+            'search_watermark': True,
+            'search_sort': 'newest',
+            'frontier': False
+        }
+        
+        def card(n, promoted=False):
+            listing = {'title': f"ad {n}", 'date': f"2026-10-18T1{n}:00:00+02:00", 'promoted': promoted}
+            return {'url': f"https://www.olx.pl/d/oferta/ad-ID{n}.html", 'id': str(n), 'listing': listing}
+        
+        # Промо-объявление 0 старое, но стоит первым
+        pages = {1: [card(0, promoted=True), card(4), card(3)], 2: [card(2), card(1)]}
+        fetched = []
+        
+        async def fake_scrape_search_page(url):
+            page = int(url.split('page=')[1]) if 'page=' in url else 1
+            fetched.append(page)
+            return pages.get(page, [])
+        
+        async def fake_scrape_ad_page(url, search_query):
+            return {'url': url, 'id': extract_id_from_url(url), 'title': f"ad {extract_id_from_url(url)}"}
+        
+        scraper = OLXScraper(config, ['test-agent'])
+        scraper._scrape_search_page = fake_scrape_search_page
+        scraper._scrape_ad_page = fake_scrape_ad_page
+        
+        # Первый запуск: выдача целиком, отметка - время объявления 4
+        ads = await scraper.scrape_search_query('gpu', max_ads=10)
+        assert [ad['id'] for ad in ads] == ['0', '4', '3', '2', '1']
+        
+        # Отметка сдвигается только после доставки
+        key = scraper._build_search_url('gpu')
+        assert 'search[order]=created_at:desc' in key
+        assert scraper.seen_index.get_watermark(key) is None
+        
+        scraper.save_watermarks({ad['id'] for ad in ads})
+        assert scraper.seen_index.get_watermark(key) == '2026-10-18T14:00:00+02:00'
+        
+        # Второй запуск: новые объявления 6 и 5, дальше отметки не листаем
+        pages[1] = [card(0, promoted=True), card(6), card(5), card(4), card(3)]
+        fetched.clear()
+        
+        ads = await scraper.scrape_search_query('gpu', max_ads=10)
+        
+        assert [ad['id'] for ad in ads] == ['0', '6', '5']
+        assert fetched == [1]
+        assert scraper.fetch_stats['watermark_stop'] == 1
+        
+        # 5 не доставлено - отметка не может уйти выше него
+        scraper.save_watermarks({'0', '6'})
+        assert scraper.seen_index.get_watermark(key) == '2026-10-18T14:00:00+02:00'
+        
+        # Третий запуск снова берёт 5
+        ads = await scraper.scrape_search_query('gpu', max_ads=10)
+        assert [ad['id'] for ad in ads] == ['0', '6', '5']
+        
+        scraper.save_watermarks({'0', '6', '5'})
+        assert scraper.seen_index.get_watermark(key) == '2026-10-18T16:00:00+02:00'
+        
+        scraper.seen_index.close()
+
+
+class TestPagePool:
+    """
+    Тесты для пула вкладок (с фейковым контекстом вместо браузера)
+    """
+    
+    class FakePage:
+        def __init__(self):
+            self.closed = False
+        
+        def is_closed(self):
+            return self.closed
+        
+        async def goto(self, url):
+            pass
+        
+        async def close(self):
+            self.closed = True
+    
+    class FakeContext:
+        def __init__(self):
+            self.pages = []
+        
+        async def new_page(self):
+            page = TestPagePool.FakePage()
+            self.pages.append(page)
+            return page
+    
+    @pytest.mark.asyncio
+    async def test_page_reused_until_max_uses(self):
+        """Тест переиспользования и пересоздания вкладок"""
+        from src.browser import PagePool
+        
+        context = self.FakeContext()
+        pool = PagePool(context, size=1, max_uses=2)
+        
+        async with pool.page() as first:
+            pass
+        async with pool.page() as second:
+            pass
+        
+        # Вторая выдача - та же вкладка, после неё вкладка закрыта
+        assert first is second
+        assert first.closed
+        
+        async with pool.page() as third:
+            pass
+        
+        assert third is not first
+        assert len(context.pages) == 2
+        assert pool.stats['reused'] == 1
+    
+    @pytest.mark.asyncio
+    async def test_page_recycled_after_error(self):
+        """Тест: вкладка после исключения не возвращается в пул"""
+        from src.browser import PagePool
+        
+        context = self.FakeContext()
+        pool = PagePool(context, size=1, max_uses=10)
+        
+        with pytest.raises(RuntimeError):
+            async with pool.page() as page:
+                raise RuntimeError("boom")
+        
+        assert page.closed
+        
+        async with pool.page() as page2:
+            assert page2 is not page
+
+
+class TestResourcePolicy:
+    """
+    Тесты для политики блокировки ресурсов
+    """
+    
+    def test_should_block(self):
+        """Тест решений по типу ресурса и домену"""
+        from src.browser import ResourcePolicy
+        
+        policy = ResourcePolicy(allowed_domains=['apollo.olxcdn.com'])
+        
+        # Картинки и шрифты блокируются
+        assert policy.should_block('image', 'https://www.olx.pl/logo.png') is True
+        assert policy.should_block('font', 'https://www.olx.pl/font.woff2') is True
+        
+        # Документ и скрипты OLX пропускаются
+        assert policy.should_block('document', 'https://www.olx.pl/d/oferty/') is False
+        assert policy.should_block('script', 'https://www.olx.pl/app.js') is False
+        
+        # Трекеры блокируются вместе с поддоменами
+        assert policy.should_block('script', 'https://www.googletagmanager.com/gtm.js') is True
+        
+        # Allow-list важнее блокировки по типу
+        assert policy.should_block('image', 'https://apollo.olxcdn.com/v1/files/x/image') is False
+    
+    @pytest.mark.asyncio
+    async def test_image_capture_from_responses(self):
+        """Тест перехвата картинок галереи: только нужные хосты, обработчики снимаются"""
+        from types import SimpleNamespace
+        from src.browser import ImageCapture
+        
+        class FakePage:
+            def __init__(self):
+                self.listeners = []
+                self.routes = []
+            
+            async def route(self, pattern, handler):
+                self.routes.append(handler)
+            
+            async def unroute(self, pattern, handler):
+                self.routes.remove(handler)
+            
+            def on(self, event, handler):
+                self.listeners.append(handler)
+            
+            def remove_listener(self, event, handler):
+                self.listeners.remove(handler)
+        
+        def response(url, resource_type='image', ok=True):
+            async def body():
+                return url.encode()
+            return SimpleNamespace(url=url, ok=ok, request=SimpleNamespace(resource_type=resource_type), body=body)
+        
+        page = FakePage()
+        capture = ImageCapture(page, ['olxcdn.com'])
+        await capture.start()
+        
+        for item in [
+            response('https://ireland.apollo.olxcdn.com/v1/files/a/image'),
+            response('https://ireland.apollo.olxcdn.com/v1/files/b/image', ok=False),
+            response('https://www.olx.pl/logo.png'),
+            response('https://ireland.apollo.olxcdn.com/app.js', resource_type='script')
+        ]:
+            page.listeners[0](item)
+        
+        bodies = await capture.stop()
+        
+        assert bodies == {'https://ireland.apollo.olxcdn.com/v1/files/a/image': b'https://ireland.apollo.olxcdn.com/v1/files/a/image'}
+        assert page.listeners == [] and page.routes == []
+        assert await capture.stop() == {}
+
+
+class TestDetection:
+    """
+    Тесты для определения CAPTCHA и блокировок
+    """
+    
+    def test_classify_html(self):
+        """Тест классификации по статусу, хосту и разметке"""
+        from src.detection import PAGE_OK, PAGE_CAPTCHA, PAGE_BLOCK, classify_html
+        
+        assert classify_html("<div data-cy='l-card'>iPhone</div>") == PAGE_OK
+        assert classify_html("<div class='g-recaptcha'></div>") == PAGE_CAPTCHA
+        assert classify_html("", status=429) == PAGE_BLOCK
+        assert classify_html("<h1>Forbidden</h1>", status=403) == PAGE_BLOCK
+        assert classify_html("", final_url='https://geo.captcha-delivery.com/captcha/') == PAGE_CAPTCHA
+        
+        # Слово в скриптах обычной страницы - не CAPTCHA
+        assert classify_html("<script>var captchaEnabled = false;</script>") == PAGE_OK
+    
+    @pytest.mark.asyncio
+    async def test_http_fast_path_checks_final_url(self):
+        """Тест: 200 после редиректа на challenge-хост на HTTP fast path - CAPTCHA"""
+        from src.scraper import OLXScraper
+        
+        config = {'rate_limit': 6000, 'min_delay': 0, 'max_delay': 0, 'respect_robots': False}
+        scraper = OLXScraper(config, ['test-agent'])
+        
+        class FakeFetcher:
+            async def fetch(self, url):
+                return 200, "<html><body>Please wait</body></html>", 'https://geo.captcha-delivery.com/captcha/?initialCid=1'
+        
+        for slot in scraper.slots:
+            slot.http_fetcher = FakeFetcher()
+        
+        assert await scraper._fetch_html('https://www.olx.pl/d/oferta/ad-CID99-IDabc1.html') is None
+        assert scraper.fetch_stats['captcha'] == 1
+    
+    @pytest.mark.asyncio
+    async def test_http_fetcher_returns_final_url(self):
+        """Тест: HttpFetcher.fetch отдаёт URL после редиректов"""
+        from aiohttp import web
+        from aiohttp.test_utils import TestServer
+        from src.http_fetcher import HttpFetcher
+        
+        async def moved(request):
+            raise web.HTTPFound('/challenge')
+        
+        async def challenge(request):
+            return web.Response(text='<html></html>', content_type='text/html')
+        
+        app = web.Application()
+        app.router.add_get('/ad', moved)
+        app.router.add_get('/challenge', challenge)
+        
+        server = TestServer(app)
+        await server.start_server()
+        
+        fetcher = HttpFetcher('test-agent')
+        try:
+            status, html, final_url = await fetcher.fetch(str(server.make_url('/ad')))
+        finally:
+            await fetcher.close()
+            await server.close()
+        
+        assert status == 200
+        assert final_url.endswith('/challenge')
+    
+    @pytest.mark.asyncio
+    async def test_classify_page(self):
+        """Тест классификации в браузере: ответ навигации, затем один evaluate"""
+        from types import SimpleNamespace
+        from src.detection import PAGE_OK, PAGE_CAPTCHA, PAGE_BLOCK, classify_page
+        
+        class FakePage:
+            def __init__(self, url, challenge=False, text=''):
+                self.url = url
+                self.detected = {'challenge': challenge, 'text': text}
+                self.evaluations = 0
+            
+            async def evaluate(self, script, arg):
+                self.evaluations += 1
+                return self.detected
+        
+        ok = SimpleNamespace(status=200)
+        
+        # Блокировка по статусу - без обращения к странице
+        page = FakePage('https://www.olx.pl/d/oferty/')
+        assert await classify_page(page, SimpleNamespace(status=429)) == PAGE_BLOCK
+        assert page.evaluations == 0
+        
+        # Редирект на challenge-хост
+        page = FakePage('https://geo.captcha-delivery.com/captcha/?initialCid=x')
+        assert await classify_page(page, ok) == PAGE_CAPTCHA
+        
+        # Готовая страница: "captcha" в описании объявления не срабатывает
+        page = FakePage('https://www.olx.pl/d/oferty/', text='Sprzedam, bez captcha')
+        assert await classify_page(page, ok, ready=True) == PAGE_OK
+        
+        # Виджет CAPTCHA на странице
+        page = FakePage('https://www.olx.pl/d/oferty/', challenge=True)
+        assert await classify_page(page, ok, ready=True) == PAGE_CAPTCHA
+        
+        # Страница не загрузилась, в видимом тексте просьба подтвердить
+        page = FakePage('https://www.olx.pl/d/oferty/', text='Please verify you are a human')
+        assert await classify_page(page, ok) == PAGE_CAPTCHA
+        assert page.evaluations == 1
+
+
+class TestBrowserManager:
+    """
+    Тесты для общего браузера процесса
+    """
+    
+    @pytest.mark.asyncio
+    async def test_single_launch_and_shutdown(self, monkeypatch):
+        """Тест: один запуск на все контексты, на выходе закрыто всё"""
+        import src.browser
+        from src.browser import BrowserManager
+        
+        events = []
+        
+        class FakeContext:
+            def __init__(self, browser):
+                self.browser = browser
+            
+            async def close(self):
+                events.append('context.close')
+                self.browser.contexts.remove(self)
+        
+        class FakeBrowser:
+            def __init__(self):
+                self.contexts = []
+            
+            async def new_context(self, **options):
+                context = FakeContext(self)
+                self.contexts.append(context)
+                return context
+            
+            async def close(self):
+                events.append('browser.close')
+        
+        class FakeLauncher:
+            async def launch(self, **options):
+                events.append('launch')
+                return FakeBrowser()
+        
+        class FakeDriver:
+            chromium = firefox = webkit = FakeLauncher()
+            
+            async def start(self):
+                events.append('start')
+                return self
+            
+            async def stop(self):
+                events.append('stop')
+        
+        monkeypatch.setattr(src.browser, 'async_playwright', FakeDriver)
+        
+        async with BrowserManager({'browser_type': 'chromium', 'headless': True}) as manager:
+            await manager.new_context('scraper slot 0', locale='pl-PL')
+            await manager.new_context('llama')
+            await manager.start()
+            
+            assert len(manager.browser.contexts) == 2
+        
+        assert events == ['start', 'launch', 'context.close', 'context.close', 'browser.close', 'stop']
+        
+        # Повторное закрытие ничего не делает
+        await manager.close()
+        assert events.count('stop') == 1
+
+
+class TestImageDownloader:
+    """
+    Тесты для потокового скачивания изображений (локальный aiohttp сервер)
+    """
+    
+    @pytest.mark.asyncio
+    async def test_streaming_download_and_size_limit(self, tmp_path):
+        """Тест: изображения сохраняются по порядку, большой ответ без content-length отбрасывается"""
+        import io
+        import os
+        from aiohttp import web
+        from aiohttp.test_utils import TestServer
+        from PIL import Image
+        from src.images import ImageDownloader
+        
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8), 'red').save(buffer, format='PNG')
+        png = buffer.getvalue()
+        
+        async def image(request):
+            return web.Response(body=png, content_type='image/png')
+        
+        async def huge(request):
+            # Chunked ответ: размер известен только по мере чтения
+            response = web.StreamResponse()
+            await response.prepare(request)
+            for _ in range(40):
+                await response.write(b'x' * 65536)
+            await response.write_eof()
+            return response
+        
+        app = web.Application()
+        app.router.add_get('/a.png', image)
+        app.router.add_get('/huge', huge)
+        
+        server = TestServer(app)
+        await server.start_server()
+        
+        downloader = ImageDownloader(str(tmp_path), max_size_mb=1, concurrency=2)
+        try:
+            paths = await downloader.download_all(
+                [str(server.make_url('/a.png')), str(server.make_url('/huge')), str(server.make_url('/a.png'))],
+                prefix='ad1'
+            )
+        finally:
+            await downloader.close()
+            await server.close()
+        
+        assert [os.path.basename(path) for path in paths] == ['ad1_1.png', 'ad1_3.png']
+        assert downloader.stats['too_large'] == 1
+        assert sorted(os.listdir(tmp_path)) == ['ad1_1.png', 'ad1_3.png']
+    
+    @pytest.mark.asyncio
+    async def test_cancelled_download_removes_temp_file(self, tmp_path):
+        """Тест: отмена посреди загрузки не оставляет .part файл"""
+        import os
+        import asyncio
+        from aiohttp import web
+        from aiohttp.test_utils import TestServer
+        from src.images import ImageDownloader
+        
+        started = asyncio.Event()
+        
+        async def stalled(request):
+            # Первая часть тела, дальше ответ зависает
+            response = web.StreamResponse()
+            await response.prepare(request)
+            await response.write(b'x' * 65536)
+            started.set()
+            await asyncio.sleep(30)
+            return response
+        
+        app = web.Application()
+        app.router.add_get('/stalled', stalled)
+        
+        server = TestServer(app)
+        await server.start_server()
+        
+        downloader = ImageDownloader(str(tmp_path))
+        try:
+            task = asyncio.create_task(downloader._download(str(server.make_url('/stalled')), 'ad1_1'))
+            await started.wait()
+            await asyncio.sleep(0.1)
+            assert any(name.endswith('.part') for name in os.listdir(tmp_path))
+            
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        finally:
+            await downloader.close()
+            await server.close()
+        
+        assert os.listdir(tmp_path) == []
+    
+    @pytest.mark.asyncio
+    async def test_captured_bodies_skip_network(self, tmp_path):
+        """Тест: картинки, полученные браузером, сохраняются без сетевого запроса"""
+        import io
+        from PIL import Image
+        from src.images import ImageDownloader
+        
+        buffer = io.BytesIO()
+        Image.new('RGB', (8, 8), 'green').save(buffer, format='JPEG')
+        
+        downloader = ImageDownloader(str(tmp_path))
+        try:
+            # Хост недоступен - успешной может быть только запись из captured
+            paths = await downloader.download_all(
+                ['http://127.0.0.1:9/a.jpg', 'http://127.0.0.1:9/b.jpg'],
+                prefix='ad1',
+                captured={'http://127.0.0.1:9/a.jpg': buffer.getvalue()}
+            )
+        finally:
+            await downloader.close()
+        
+        assert [path.endswith('ad1_1.jpg') for path in paths] == [True]
+        assert downloader.stats['captured'] == 1
+        assert downloader.stats['failed'] == 1
+    
+    @pytest.mark.asyncio
+    async def test_image_store_dedup(self, tmp_path):
+        """Тест хранилища: одинаковые байты - один файл, известный URL - без запроса"""
+        import io
+        from aiohttp import web
+        from aiohttp.test_utils import TestServer
+        from PIL import Image
+        from src.images import ImageDownloader
+        from src.storage import ImageStore
+        
+        def gradient(size):
+            img = Image.new('L', (size, size))
+            img.putdata([x * 255 // size for y in range(size) for x in range(size)])
+            buffer = io.BytesIO()
+            img.save(buffer, format='PNG')
+            return buffer.getvalue()
+        
+        bodies = {'/a.png': gradient(32), '/copy.png': gradient(32), '/small.png': gradient(16)}
+        requests_seen = []
+        
+        async def image(request):
+            requests_seen.append(request.path)
+            return web.Response(body=bodies[request.path], content_type='image/png')
+        
+        app = web.Application()
+        for path in bodies:
+            app.router.add_get(path, image)
+        
+        server = TestServer(app)
+        await server.start_server()
+        
+        images_dir = tmp_path / 'images'
+        store = ImageStore(str(images_dir), str(tmp_path / 'index.sqlite3'))
+        downloader = ImageDownloader(str(images_dir), store=store, phash=True)
+        urls = [str(server.make_url(path)) for path in bodies]
+        
+        try:
+            first = await downloader.download_all(urls, prefix='ad1')
+            again = await downloader.download_all(urls[:1], prefix='ad2')
+        finally:
+            await downloader.close()
+            await server.close()
+        
+        # Копия с другим URL указывает на тот же файл, повторный URL не скачивается
+        assert first[0] == first[1] == again[0]
+        assert len(requests_seen) == 3
+        assert store.stats['known_content'] == 1
+        assert store.stats['known_url'] == 1
+        
+        # Уменьшенная копия попадает в ту же phash-группу
+        assert sorted(store.group(first[0])) == sorted([first[0], first[2]])
+        
+        store.close()
+    
+    @pytest.mark.asyncio
+    async def test_postprocess_webp_and_thumbnail(self, tmp_path):
+        """Тест пост-обработки в пуле процессов: WebP на месте + миниатюра"""
+        from PIL import Image
+        from src.images import ImagePostProcessor, process_image
+        
+        path = tmp_path / 'photo.part'
+        Image.new('RGB', (800, 600), 'blue').save(path, format='JPEG')
+        
+        postprocessor = ImagePostProcessor(workers=1, webp_quality=70, thumb_size=100)
+        try:
+            ext, phash, thumb_tmp = await postprocessor.process(str(path))
+        finally:
+            postprocessor.close()
+        
+        assert ext == 'webp'
+        assert phash is None
+        
+        with Image.open(path) as img:
+            assert img.format == 'WEBP'
+            assert img.size == (800, 600)
+        
+        with Image.open(thumb_tmp) as thumb:
+            assert thumb.size == (100, 75)
+        
+        # Битый файл не проходит проверку
+        broken = tmp_path / 'broken.part'
+        broken.write_bytes(b'not an image')
+        
+        assert process_image(str(broken), False, 70, 100) is None
+
+
+def _fake_runner_worker(worker_id, config, tasks, results, budget):
+    """Воркер для теста MultiProcessRunner: падает один раз на запросе 'crash'"""
+    import os
+    
+    while True:
+        query = tasks.get()
+        if query is None:
+            break
+        
+        marker = os.path.join(config['marker_dir'], 'crashed')
+        if query == 'crash' and not os.path.exists(marker):
+            open(marker, 'w').close()
+            os._exit(1)
+        
+        budget.reserve()
+        results.put(('done', worker_id, query, {'queries': 1, 'ads_scraped': 2}))
+    
+    results.put(('stats', worker_id, None, {'browser': 1}))
+
+
+class TestRunner:
+    """
+    Тесты для многопроцессного запуска
+    """
+    
+    def test_shared_budget_spaces_requests(self):
+        """Тест общего бюджета: слоты идут с интервалом 60/лимит"""
+        from src.utils import SharedBudget
+        
+        budget = SharedBudget(calls_per_minute=60)
+        
+        assert budget.reserve() == pytest.approx(0, abs=0.05)
+        assert budget.reserve() == pytest.approx(1, abs=0.05)
+        assert budget.reserve() == pytest.approx(2, abs=0.05)
+    
+    def test_crashed_worker_query_is_reassigned(self, tmp_path):
+        """Тест: запрос упавшего воркера выполняется заново, статистика суммируется"""
+        from src.runner import MultiProcessRunner
+        
+        config = {
+            'worker_processes': 2,
+            'rate_limit': 6000,
+            'search_queries': ['a', 'crash', 'b'],
+            'marker_dir': str(tmp_path)
+        }
+        
+        runner = MultiProcessRunner(config, worker_target=_fake_runner_worker)
+        result = runner.run()
+        
+        assert result['stats'] == {'queries': 3, 'ads_scraped': 6}
+        assert result['failed_queries'] == []
+        assert result['restarts'] == 1
+        assert result['fetch_stats']['browser'] >= 2
+
+
+class TestSharedLimits:
+    """
+    Тесты для бюджетов, общих для нескольких экземпляров scraper
+    """
+    
+    def test_sqlite_budget_shared_between_instances(self, tmp_path):
+        """Тест: два независимых экземпляра делят один бюджет и cool-down"""
+        import pickle
+        from src.limits import SqliteBudget
+        
+        path = str(tmp_path / 'rate_limit.sqlite')
+        first = SqliteBudget(path, calls_per_minute=60)
+        second = SqliteBudget(path, calls_per_minute=60)
+        
+        assert first.reserve() == pytest.approx(0, abs=0.05)
+        assert second.reserve() == pytest.approx(1, abs=0.05)
+        assert first.reserve() == pytest.approx(2, abs=0.05)
+        
+        # CAPTCHA у одного - пауза у всех
+        second.start_cooldown(30)
+        assert first.cooldown_remaining() == pytest.approx(30, abs=0.5)
+        assert first.reserve() == pytest.approx(30, abs=0.5)
+        
+        # Передаётся в дочерний процесс без соединения
+        clone = pickle.loads(pickle.dumps(first))
+        assert clone.reserve() == pytest.approx(31, abs=0.5)
+        
+        for budget in (first, second, clone):
+            budget.close()
+    
+    def test_sqlite_budget_retries_locked_database(self, tmp_path):
+        """Тест: занятая другим процессом база - повтор, а не исключение"""
+        import sqlite3
+        import threading
+        from src.limits import SqliteBudget
+        
+        path = str(tmp_path / 'rate_limit.sqlite')
+        budget = SqliteBudget(path, calls_per_minute=60)
+        budget.LOCK_RETRY_DELAY = 0.05
+        budget._conn.execute('PRAGMA busy_timeout = 10')
+        
+        # Другое соединение держит транзакцию записи
+        other = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        other.execute('BEGIN IMMEDIATE')
+        threading.Timer(0.3, other.execute, args=('COMMIT',)).start()
+        
+        assert budget.reserve() == pytest.approx(0, abs=0.5)
+        budget.start_cooldown(10)
+        assert budget.cooldown_remaining() == pytest.approx(10, abs=0.5)
+        
+        other.close()
+        budget.close()
+    
+    def test_store_budget_with_local_store(self):
+        """Тест бюджета поверх Redis-совместимого хранилища (локальная замена)"""
+        from src.limits import MemoryStore, StoreBudget
+        
+        store = MemoryStore()
+        first = StoreBudget(calls_per_minute=60, store=store)
+        second = StoreBudget(calls_per_minute=60, store=store)
+        
+        assert first.reserve() == pytest.approx(0, abs=0.05)
+        assert second.reserve() == pytest.approx(1, abs=0.05)
+        
+        first.start_cooldown(10)
+        assert second.cooldown_remaining() == pytest.approx(10, abs=0.5)
+        
+        # Более короткий cool-down не сокращает уже включённый
+        second.start_cooldown(2)
+        assert first.cooldown_remaining() == pytest.approx(10, abs=0.5)
+        
+        # Замок снят после каждого reserve()/start_cooldown()
+        assert store.get('olx:lock') is None
+    
+    def test_create_budget(self, tmp_path):
+        """Тест выбора backend по конфигу"""
+        from src.limits import SqliteBudget, create_budget
+        from src.utils import SharedBudget
+        
+        assert isinstance(create_budget({'rate_limit': 10}), SharedBudget)
+        
+        budget = create_budget({
+            'rate_limit': 10,
+            'rate_limit_backend': 'sqlite',
+            'rate_limit_state_path': str(tmp_path / 'state' / 'rate.sqlite')
+        })
+        assert isinstance(budget, SqliteBudget)
+        budget.close()
+        
+        with pytest.raises(ValueError):
+            create_budget({'rate_limit': 10, 'rate_limit_backend': 'etcd'})
+
+
+class TestPipeline:
+    """
+    Тесты для конвейера scrape → analyze → deliver
+    """
+    
+    @pytest.mark.asyncio
+    async def test_stages_overlap_with_backpressure(self):
+        """Тест: стадии работают одновременно, очередь ограничена, статистика собирается"""
+        import asyncio
+        import time
+        from src.processor import OLXProcessor
+        
+        config = {
+            'webhook_url': 'http://localhost/hook',
+            'webhook_timeout': 1,
+            'webhook_retries': 1,
+            'analyze_workers': 2,
+            'deliver_workers': 2,
+            'pipeline_queue_size': 2
+        }
+        processor = OLXProcessor(config)
+        
+        class FakeIndex:
+            def __init__(self):
+                self.remembered = []
+            
+            def remember(self, ad_data):
+                self.remembered.append(ad_data['id'])
+        
+        class FakeScraper:
+            seen_index = FakeIndex()
+            saved = None
+            
+            def save_watermarks(self, delivered):
+                self.saved = set(delivered)
+            
+            async def iter_search_query(self, query, max_ads):
+                for n in range(max_ads):
+                    await asyncio.sleep(0.05)
+                    yield {'id': str(n), 'title': f"ad {n}", 'url': f"https://www.olx.pl/d/oferty/ID{n}.html"}
+        
+        class FakeLlama:
+            async def analyze_ad(self, ad_data):
+                await asyncio.sleep(0.05)
+                return {'score': 50}
+        
+        delivered = []
+        
+        async def fake_send(payload):
+            await asyncio.sleep(0.05)
+            delivered.append(payload['id'])
+            return payload['id'] != '3'
+        
+        processor._send_to_webhook = fake_send
+        scraper = FakeScraper()
+        
+        start = time.perf_counter()
+        await processor._process_single_query('gpu', 6, scraper, FakeLlama())
+        elapsed = time.perf_counter() - start
+        
+        assert sorted(delivered) == [str(n) for n in range(6)]
+        assert processor.stats == {'queries': 1, 'ads_scraped': 6, 'ads_sent': 5, 'ads_failed': 1}
+        
+        # Индекс запоминает только доставленные объявления
+        assert sorted(scraper.seen_index.remembered) == ['0', '1', '2', '4', '5']
+        assert scraper.saved == {'0', '1', '2', '4', '5'}
+        
+        
+        # Последовательно было бы 6 * 0.15 = 0.9с, конвейером - около 0.4с
+        assert elapsed < 0.7
+        
+        stats = processor.pipeline_stats
+        assert [stats[stage]['items'] for stage in ('scrape', 'analyze', 'deliver')] == [6, 6, 6]
+        assert stats['analyze']['max_queue'] <= 2
+        assert 'deliver: 6 items' in processor.format_pipeline_stats()
+    
+    @pytest.mark.asyncio
+    async def test_crashed_worker_fails_query(self):
+        """Тест: упавшие воркеры доставки прерывают запрос, а не подвешивают его"""
+        import asyncio
+        from src.processor import OLXProcessor
+        
+        config = {
+            'webhook_url': 'http://localhost/hook',
+            'webhook_timeout': 1,
+            'webhook_retries': 1,
+            'deliver_workers': 2,
+            'pipeline_queue_size': 1
+        }
+        processor = OLXProcessor(config)
+        
+        class FakeScraper:
+            seen_index = None
+            
+            def save_watermarks(self, delivered):
+                pass
+            
+            async def iter_search_query(self, query, max_ads):
+                for n in range(max_ads):
+                    yield {'id': str(n), 'title': f"ad {n}", 'url': f"https://www.olx.pl/d/oferty/ID{n}.html"}
+        
+        class FakeLlama:
+            async def analyze_ad(self, ad_data):
+                return {'score': 50}
+        
+        async def fake_send(payload):
+            return True
+        
+        record_stage = processor._record_stage
+        
+        def broken_record_stage(stage, seconds):
+            if stage == 'deliver':
+                raise RuntimeError('deliver stage crashed')
+            record_stage(stage, seconds)
+        
+        processor._send_to_webhook = fake_send
+        processor._record_stage = broken_record_stage
+        
+        await asyncio.wait_for(processor._process_single_query('gpu', 20, FakeScraper(), FakeLlama()), timeout=5)
+        
+        assert processor.stats['ads_sent'] == 0
 
 
 # ========================================